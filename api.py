@@ -1,11 +1,16 @@
 import json
 import os
 
+from flask import request
+
 from __init__ import app, dynamodb
+import fleet
+import storage
+import utils
 
 @app.route('/api/trucks', methods=['GET'])
 def truck_api_get_all_trucks():
-    return {"trucks": os.listdir(app.config['TRUCK_PATH'])}
+    return {"trucks": storage.list_objects('trucks')}
 
 @app.route('/api/trucks', methods=['POST'])
 def truck_api_add_truck():
@@ -13,13 +18,11 @@ def truck_api_add_truck():
 
 @app.route('/api/trucks/<truck_name>', methods=['GET'])
 def truck_api_get_truck(truck_name):
-    with open(f"{app.config['TRUCK_PATH']}/{truck_name}", 'r', encoding='utf-8') as truckfile:
-        truck_json = json.load(truckfile)
-    return truck_json
+    return storage.get_object('trucks', truck_name)
 
 @app.route('/api/racks', methods=['GET'])
 def rack_api_get_all_racks():
-    return {"racks": os.listdir(app.config['RACK_PATH'])}
+    return {"racks": storage.list_objects('racks')}
 
 @app.route('/api/racks', methods=['POST'])
 def rack_api_add_rack():
@@ -27,18 +30,34 @@ def rack_api_add_rack():
 
 @app.route('/api/racks/<rack_name>', methods=['GET'])
 def rack_api_get_rack(rack_name):
-    with open(f"{app.config['RACK_PATH']}/{rack_name}", 'r', encoding='utf-8') as rackfile:
-        rack_json = json.load(rackfile)
-    return rack_json
+    return storage.get_object('racks', rack_name)
 
 @app.route('/api/manifests', methods=['GET'])
 def manifest_api_get_all_manifests():
-    return {"manifests": os.listdir(app.config['MANIFEST_PATH'])}
+    # Parsed manifest sidecars are kept in a hidden directory alongside the manifests
+    return {"manifests": [manifest for manifest in os.listdir(app.config['MANIFEST_PATH']) if not manifest.startswith('.')]}
 
 @app.route('/api/manifests/<manifest>', methods=['GET'])
 def manifest_api_get_manifest(manifest):
     return
 
+@app.route('/api/manifests/<manifest>/rows/<int:row>', methods=['PATCH'])
+def manifest_api_patch_row(manifest, row):
+    '''
+    Sets some of the cells of a single manifest row, counted from zero. Expects a JSON body of values keyed by column
+    '''
+    try:
+        return utils.patch_manifest_row(manifest, row, request.get_json())
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+@app.route('/api/manifests/<manifest>/rows/<int:row>', methods=['DELETE'])
+def manifest_api_delete_row(manifest, row):
+    try:
+        return {"validation": utils.delete_manifest_row(manifest, row)}
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
 @app.route('/api/layouts', methods=['GET'])
 def generate_layout_api_get_layouts():
     return
@@ -47,15 +66,53 @@ def generate_layout_api_get_layouts():
 def generate_layout_api_create_layout():
     return
 
+def load_shipment_plan(truck_name: str, manifest_name: str) -> object:
+    return utils.load_shipment_plan(truck_name, manifest_name)
+
+@app.route('/api/plans/shipments', methods=['GET'])
+def get_shipment_plans():
+    '''
+    Lists the stored shipment plans, optionally only those with a given owner or created within a range of Unix times
+    '''
+    return {"plans": storage.list_objects(
+        'plans',
+        owner=request.args.get('owner', default=None, type=str),
+        created_after=request.args.get('created_after', default=None, type=float),
+        created_before=request.args.get('created_before', default=None, type=float)
+    )}
+
 @app.route('/api/plans/shipments', methods=['PUT'])
 def store_shipment_plan(shipment_plan: object):
-    shipment_plan_name = f"{shipment_plan['truck_details']['truck_name'].replace(' ', '_')}-{shipment_plan['manifest_details']['name']}-shipment_plan"
-    with open(f'./resources/plans/shipments/{shipment_plan_name}', 'w', encoding='utf-8') as shipment_plan_file:
-        stringified_json = json.dumps(shipment_plan)
-        shipment_plan_file.write(stringified_json)
+    stringified_json = utils.save_shipment_plan(shipment_plan)
     response = app.response_class(
         response=stringified_json,
         status=200,
         mimetype='application/json'
     )
-    return response
\ No newline at end of file
+    return response
+
+@app.route('/api/plans/fleet', methods=['POST'])
+def fleet_api_create_plan():
+    '''
+    Splits a manifest across several trucks and plans each of them. Expects a JSON body naming the manifest and the trucks to use, and optionally the solver and time budget to plan each truck with
+    '''
+    fleet_request = request.get_json()
+    manifest_name = fleet_request['manifest']
+    trucks = [utils.load_truck(truck_name) for truck_name in fleet_request.get('trucks') or []]
+    manifest_details = utils.get_manifest_details(manifest_name)
+    manifest_units = utils.get_manifest_units(manifest_name)
+
+    try:
+        fleet_plan = fleet.plan_fleet(
+            trucks,
+            manifest_name,
+            manifest_details,
+            manifest_units,
+            solver=fleet_request.get('solver', 'greedy'),
+            time_budget_ms=int(fleet_request.get('time_budget_ms', 0))
+        )
+    except ValueError as error:
+        return {"error": str(error)}, 400
+    for shipment_plan in fleet_plan['shipment_plans'].values():
+        store_shipment_plan(shipment_plan)
+    return fleet_plan
@@ -0,0 +1,159 @@
+'''
+Offline batch planning. Every manifest in a directory is planned on every one of a set of trucks across a pool of worker processes. Each plan is stored with the other shipment plans as soon as it is ready, and a summary CSV is written as the plans come in. Intended to be run ahead of time for the next day's routes, for example:
+
+    python batch_plan.py --trucks "Toe Mater" --solver portfolio
+'''
+import argparse
+import concurrent.futures
+import csv
+import os
+import sys
+import time
+
+import storage
+import utils
+
+BATCH_SUMMARY_FIELDS = [
+    'manifest',
+    'truck',
+    'solver',
+    'rack_backend',
+    'units_total',
+    'units_placed',
+    'fill_ratio',
+    'runtime_seconds',
+    'error'
+]
+
+def find_batch_manifests(manifest_path: str) -> list:
+    '''
+    Names of the manifests in a directory that are ready to be planned, meaning that they have been mapped and have their units saved alongside them
+    '''
+    batch_manifests = []
+    for filename in sorted(os.listdir(manifest_path)):
+        if not filename.endswith('.csv') or filename.endswith('-units.csv'):
+            continue
+        manifest_name = filename[:-len('.csv')]
+        if not os.path.exists(f'{manifest_path}/{manifest_name}-units.csv'):
+            print(f"Skipping '{manifest_name}', it has no units file", file=sys.stderr)
+        elif not utils.check_if_manifest_mapped(manifest_name):
+            print(f"Skipping '{manifest_name}', it has not been mapped", file=sys.stderr)
+        else:
+            batch_manifests.append(manifest_name)
+    return batch_manifests
+
+def get_plan_fill_ratio(shipment_plan: object) -> float:
+    '''
+    Share of the rack footprint of the truck that is taken up by cargo
+    '''
+    filled_cells = 0
+    total_cells = 0
+    for sector in shipment_plan['flattened_map']:
+        for side in shipment_plan['flattened_map'][sector]:
+            for rack in shipment_plan['flattened_map'][sector][side]['racks']:
+                for row in rack['map']:
+                    filled_cells += sum(1 for cell in row if cell)
+                    total_cells += len(row)
+    if total_cells == 0:
+        return 0.0
+    return filled_cells / total_cells
+
+def plan_batch_job(truck_details: object, manifest_path: str, manifest_name: str, solver: str, time_budget_ms: int, use_cache: bool, rack_backend: str) -> object:
+    '''
+    Plans a single manifest on a single truck and stores the plan. This is run inside the worker processes, so that only the summary of the plan has to be sent back
+    '''
+    manifest_details = utils.get_manifest_details(manifest_name, manifest_path)
+    manifest_units = utils.get_manifest_units(manifest_name, manifest_path)
+
+    start_time = time.perf_counter()
+    shipment_plan = utils.generate_shipment_plan(
+        truck_details,
+        manifest_name,
+        manifest_details,
+        manifest_units,
+        solver,
+        time_budget_ms,
+        use_cache=use_cache,
+        rack_backend=rack_backend
+    )
+    runtime_seconds = time.perf_counter() - start_time
+    utils.save_shipment_plan(shipment_plan)
+
+    manifest_items = shipment_plan['manifest_details']['items']
+    return {
+        'manifest': manifest_name,
+        'truck': truck_details['truck_name'],
+        'solver': solver,
+        'rack_backend': rack_backend,
+        'units_total': len(manifest_items),
+        'units_placed': sum(1 for item in manifest_items if item.get('placement') is not None),
+        'fill_ratio': round(get_plan_fill_ratio(shipment_plan), 4),
+        'runtime_seconds': round(runtime_seconds, 3),
+        'error': ''
+    }
+
+def run_batch(manifest_path: str, truck_names: list, summary_path: str, solver: str = 'greedy', time_budget_ms: int = 0, use_cache: bool = True, max_workers: int = None, rack_backend: str = 'dense') -> list:
+    '''
+    Plans every manifest in the directory on every truck. Summary rows are written in the order that the plans finish, and a plan that fails is recorded in the summary with its error rather than stopping the batch
+    '''
+    trucks = [utils.load_truck(truck_name) for truck_name in truck_names]
+    manifest_names = find_batch_manifests(manifest_path)
+    os.makedirs('./resources/plans/shipments', exist_ok=True)
+
+    summary_rows = []
+    with open(summary_path, 'w', encoding='utf-8', newline='') as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=BATCH_SUMMARY_FIELDS)
+        writer.writeheader()
+        summary_file.flush()
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(plan_batch_job, truck_details, manifest_path, manifest_name, solver, time_budget_ms, use_cache, rack_backend): (manifest_name, truck_details['truck_name'])
+                for manifest_name in manifest_names
+                for truck_details in trucks
+            }
+            for future in concurrent.futures.as_completed(futures):
+                manifest_name, truck_name = futures[future]
+                try:
+                    summary_row = future.result()
+                except Exception as error:
+                    summary_row = {
+                        'manifest': manifest_name,
+                        'truck': truck_name,
+                        'solver': solver,
+                        'rack_backend': rack_backend,
+                        'error': f'{type(error).__name__}: {error}'
+                    }
+                writer.writerow(summary_row)
+                summary_file.flush()
+                summary_rows.append(summary_row)
+                print(f"{manifest_name} on {truck_name}: {summary_row['error'] or 'planned'}", file=sys.stderr)
+    return summary_rows
+
+def main(args: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Plans every manifest in a directory on a set of trucks')
+    parser.add_argument('--manifests', default='./resources/manifests', help='directory of mapped manifests along with their units files')
+    parser.add_argument('--trucks', nargs='+', help='names of the trucks to plan on, defaults to every saved truck')
+    parser.add_argument('--solver', default='greedy', choices=['greedy', 'portfolio'])
+    parser.add_argument('--rack-backend', default='dense', choices=list(utils.RACK_BACKENDS), help='how rack space is represented while placing cargo')
+    parser.add_argument('--time-budget-ms', type=int, default=0, help='time spent improving each plan after it is found')
+    parser.add_argument('--summary', default='./resources/plans/batch_summary.csv', help='where to write the summary CSV')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, defaults to the number of CPUs')
+    parser.add_argument('--no-cache', action='store_true', help='plan everything again rather than reusing cached plans')
+    parsed_args = parser.parse_args(args)
+
+    truck_names = parsed_args.trucks or storage.list_objects('trucks')
+    summary_rows = run_batch(
+        parsed_args.manifests,
+        truck_names,
+        parsed_args.summary,
+        solver=parsed_args.solver,
+        time_budget_ms=parsed_args.time_budget_ms,
+        use_cache=not parsed_args.no_cache,
+        max_workers=parsed_args.workers,
+        rack_backend=parsed_args.rack_backend
+    )
+    return 1 if any(summary_row['error'] for summary_row in summary_rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
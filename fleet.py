@@ -0,0 +1,151 @@
+'''
+Fleet planning, for when a manifest is too much for a single truck. The stops of the manifest are shared out between a set of trucks, keeping each stop on one truck where possible, and then every truck is planned in its own worker process.
+'''
+import concurrent.futures
+import copy
+import math
+import os
+
+import units
+import utils
+
+# Share of a truck's rack space that can realistically be filled once gaps between panels are accounted for
+FLEET_PACKING_EFFICIENCY = 0.85
+
+def get_truck_capacity(truck_details: object) -> int:
+    '''
+    Usable rack space of a truck, in grid cells of rack footprint across both sides of every rack
+    '''
+    truck_details = copy.deepcopy(truck_details)
+    utils.prepare_types(truck_details, [])
+    utils.calculate_physical_space(truck_details, [], {})
+
+    rack_cells = 0
+    for sector in truck_details['rack_info']:
+        for rack in truck_details['rack_info'][sector]:
+            rack_cells += 2 * rack['grid_size_length_axis'] * rack['grid_size_depth_axis']
+    return math.floor(rack_cells * FLEET_PACKING_EFFICIENCY)
+
+def get_unit_demands(manifest_details: list, manifest_units: object, tallest_rack_height: int) -> list:
+    '''
+    Rack space taken up by a single unit of each manifest row, in grid cells of rack footprint. Units are assumed to be stood on their long edge whenever some rack is tall enough for it, as they would be when placed. The sizes of all of the rows are converted together
+    '''
+    rows = [dict(row, quantity=1) for row in manifest_details]
+    utils.prepare_types({'distance_to_rear_axle': 0, 'interior_rack_quantity': 0, 'exterior_rack_quantity': 0, 'rack_info': {'interior': [], 'exterior': []}}, rows)
+    utils.calculate_grid_volumes(rows, manifest_units)
+
+    unit_demands = []
+    for row in rows:
+        orientation = 'vertical' if row['grid_volume']['vertical']['height'] < tallest_rack_height else 'horizontal'
+        unit_demands.append(row['grid_volume'][orientation]['length'] * row['grid_volume'][orientation]['thickness'])
+    return unit_demands
+
+def get_tallest_rack_height(trucks: list) -> int:
+    # Rack sizes are always given in feet
+    feet_to_standard_factor = units.get_conversion_factor('feet', utils.STANDARD_CALCULATION_UNITS['dimension'])
+
+    tallest_rack_height = 0
+    for truck_details in trucks:
+        for sector in truck_details['rack_info']:
+            for rack in truck_details['rack_info'][sector]:
+                rack_height = float(rack['rack_height']) * feet_to_standard_factor
+                tallest_rack_height = max(tallest_rack_height, math.floor(rack_height / utils.GRID_PRECISION_FACTOR))
+    return tallest_rack_height
+
+def assign_stops_to_trucks(trucks: list, manifest_details: list, manifest_units: object) -> object:
+    '''
+    Shares the rows of a manifest out between the trucks. Stops are handed out largest first, each to the truck with the least room left that can still take the whole stop. A stop that no truck has room for is split up row by row onto the trucks with the most room left, splitting the quantity of a row across trucks when the row alone is too big for any of them. Raises a ValueError when no trucks are given
+    '''
+    if not trucks:
+        raise ValueError('At least one truck is needed to plan a fleet')
+    tallest_rack_height = get_tallest_rack_height(trucks)
+    remaining_capacity = {truck_details['truck_name']: get_truck_capacity(truck_details) for truck_details in trucks}
+    assignments = {truck_details['truck_name']: [] for truck_details in trucks}
+    split_stops = []
+
+    rows_by_stop = {}
+    for row, unit_demand in zip(manifest_details, get_unit_demands(manifest_details, manifest_units, tallest_rack_height)):
+        rows_by_stop.setdefault(int(row['stop_number']), []).append((row, unit_demand))
+    stop_demands = {
+        stop_number: sum(int(row['quantity']) * unit_demand for row, unit_demand in stop_rows)
+        for stop_number, stop_rows in rows_by_stop.items()
+    }
+
+    for stop_number in sorted(rows_by_stop, key=lambda x: stop_demands[x], reverse=True):
+        fitting_trucks = [truck_name for truck_name in remaining_capacity if remaining_capacity[truck_name] >= stop_demands[stop_number]]
+        if fitting_trucks:
+            truck_name = min(fitting_trucks, key=lambda x: remaining_capacity[x])
+            assignments[truck_name].extend(row for row, unit_demand in rows_by_stop[stop_number])
+            remaining_capacity[truck_name] -= stop_demands[stop_number]
+            continue
+
+        split_stops.append(stop_number)
+        for row, unit_demand in sorted(rows_by_stop[stop_number], key=lambda x: int(x[0]['quantity']) * x[1], reverse=True):
+            remaining_quantity = int(row['quantity'])
+            while remaining_quantity > 0:
+                truck_name = max(remaining_capacity, key=lambda x: remaining_capacity[x])
+                fitting_quantity = remaining_capacity[truck_name] // unit_demand if unit_demand else remaining_quantity
+                # When nothing fits anywhere, the rest goes to the roomiest truck and is reported as unplaced once planned
+                quantity = remaining_quantity if fitting_quantity <= 0 else min(remaining_quantity, fitting_quantity)
+                assigned_row = dict(row)
+                assigned_row['quantity'] = str(quantity)
+                assignments[truck_name].append(assigned_row)
+                remaining_capacity[truck_name] -= quantity * unit_demand
+                remaining_quantity -= quantity
+
+    return {
+        'assignments': assignments,
+        'split_stops': sorted(split_stops)
+    }
+
+def plan_truck(truck_details: object, manifest_name: str, manifest_details: list, manifest_units: object, solver: str, time_budget_ms: int) -> object:
+    '''
+    Plans the rows assigned to a single truck. This is run inside the worker processes of the fleet planner
+    '''
+    return utils.generate_shipment_plan(truck_details, manifest_name, manifest_details, manifest_units, solver, time_budget_ms)
+
+def plan_fleet(trucks: list, manifest_name: str, manifest_details: list, manifest_units: object, solver: str = 'greedy', time_budget_ms: int = 0, max_workers: int = None) -> object:
+    '''
+    Splits a manifest across a set of trucks and plans every truck in parallel. Raises a ValueError when no trucks are given
+
+    Returns the plan for each truck that was given any cargo, along with every unit that could not be placed on the truck it was assigned to
+    '''
+    fleet_assignment = assign_stops_to_trucks(trucks, manifest_details, manifest_units)
+    assigned_trucks = [truck_details for truck_details in trucks if fleet_assignment['assignments'][truck_details['truck_name']]]
+    if max_workers is None:
+        max_workers = max(1, min(len(assigned_trucks), os.cpu_count() or 1))
+
+    shipment_plans = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            truck_details['truck_name']: executor.submit(
+                plan_truck,
+                truck_details,
+                manifest_name,
+                fleet_assignment['assignments'][truck_details['truck_name']],
+                manifest_units,
+                solver,
+                time_budget_ms
+            )
+            for truck_details in assigned_trucks
+        }
+        for truck_name, future in futures.items():
+            shipment_plans[truck_name] = future.result()
+
+    unplaced_items = []
+    for truck_name, shipment_plan in shipment_plans.items():
+        for item in shipment_plan['manifest_details']['items']:
+            if item.get('placement') is None:
+                unplaced_items.append({
+                    'truck_name': truck_name,
+                    'cargo_id': item['cargo_id'],
+                    'stop_number': item['stop_number'],
+                    'description': item['description']
+                })
+
+    return {
+        'manifest_name': manifest_name,
+        'shipment_plans': shipment_plans,
+        'split_stops': fleet_assignment['split_stops'],
+        'unplaced_items': unplaced_items
+    }
@@ -8,15 +8,18 @@ from werkzeug.utils import secure_filename
 from __init__ import app, dynamodb
 from forms import TruckOpenGlassRackForm, TruckInteriorRackForm, TruckExteriorRackForm, UploadForm
 import api
+import resource_registry
 import utils
 
+# Time spent improving a shipment plan for interactive requests, in milliseconds
+INTERACTIVE_PLAN_TIME_BUDGET_MS = 250
+
 @app.route('/htmx-api/truck-form/body-type', methods=['GET'])
 def truck_form_get_body_type_options():
     selected_body_type = request.args.get('truck_body_type', default=None, type=str)
 
-    with open('./schemas/truck_body_to_forms.json', 'r', encoding='utf-8') as f:
-        schema_json = json.load(f)
-    
+    schema_json = resource_registry.get_schema('truck_body_to_forms')
+
     form = eval(f'{schema_json[selected_body_type]}()')
 
     return render_template(f'./htmx/trucks/{selected_body_type}.html', form=form)
@@ -62,15 +65,20 @@ def layout_form_post_manifest_upload():
             flash('No selected file', 'danger')
         if file and utils.allowed_file(file.filename):
             filename = secure_filename(file.filename)
+            file_format = file.filename.rsplit('.', 1)[1].lower()
             filename = filename.split('.')[0]
-            file.save(os.path.join(app.config['MANIFEST_PATH'], f"{filename}.csv"))
+            try:
+                manifest_column_names = utils.save_manifest_upload(file.stream, filename, file_format)['column_names']
+            except ValueError as error:
+                flash(str(error), 'danger')
+                manifest_column_names = []
         manifest_params = utils.get_manifest_params()
-        manifest_column_names = utils.get_manifest_column_names(filename)
 
     return render_template('./htmx/layout/describe-manifest.html', 
         manifest_name=filename,
         manifest_params=manifest_params,
-        manifest_column_names=manifest_column_names
+        manifest_column_names=manifest_column_names,
+        manifest_map=utils.find_manifest_map(manifest_column_names) or {}
     )
 
 @app.route('/htmx-api/layout-form/describe-manifest', methods=['GET'])
@@ -80,13 +88,15 @@ def layout_form_get_describe_manifest():
     manifest_params = utils.get_manifest_params()
     manifest_details = utils.get_manifest_details(manifest_name)
     manifest_unit_map = utils.get_manifest_units(manifest_name)
-    flag_incomplete_manifest_data = utils.check_for_complete_manifest_data(manifest_name)
+    manifest_validation = utils.get_manifest_validation(manifest_name)
+    flag_incomplete_manifest_data = bool(manifest_validation)
 
     return render_template('./htmx/layout/mapped-manifest.html',
         manifest_name=manifest_name,
         manifest_params=manifest_params,
         manifest_details=manifest_details,
         manifest_unit_map=manifest_unit_map,
+        manifest_validation=manifest_validation,
         flag_incomplete_manifest_data=flag_incomplete_manifest_data
     )
 
@@ -96,20 +106,25 @@ def layout_form_post_describe_manifest():
 
     manifest_params = utils.get_manifest_params()
     manifest_map = utils.make_manifest_map(request.form)
-    manifest_details = utils.analyze_manifest(manifest_name, manifest_map)
+    dimension_report = {}
+    utils.save_manifest_map(manifest_name, manifest_map)
+    manifest_details = utils.analyze_manifest(manifest_name, manifest_map, dimension_report)
     utils.update_manifest(manifest_name, manifest_params, manifest_details)
 
     utils.save_manifest_units(manifest_name, manifest_map)
     manifest_unit_map = utils.get_manifest_units(manifest_name)
 
-    flag_incomplete_manifest_data = utils.check_for_complete_manifest_data(manifest_name)
+    manifest_validation = utils.get_manifest_validation(manifest_name)
+    flag_incomplete_manifest_data = bool(manifest_validation)
 
     return render_template('./htmx/layout/mapped-manifest.html',
         manifest_name=manifest_name,
         manifest_params=manifest_params,
         manifest_details=manifest_details,
         manifest_unit_map=manifest_unit_map,
-        flag_incomplete_manifest_data=flag_incomplete_manifest_data
+        manifest_validation=manifest_validation,
+        flag_incomplete_manifest_data=flag_incomplete_manifest_data,
+        dimension_report=dimension_report
     )
 
 @app.route('/htmx-api/layout-form/save-manifest', methods=['POST'])
@@ -122,26 +137,86 @@ def layout_form_post_save_manifest():
     manifest_params = utils.get_manifest_params()
     utils.update_manifest(manifest_name, manifest_params, manifest_details)
     manifest_unit_map = utils.get_manifest_units(manifest_name)
-    flag_incomplete_manifest_data = utils.check_for_complete_manifest_data(manifest_name)
+    manifest_validation = utils.get_manifest_validation(manifest_name)
+    flag_incomplete_manifest_data = bool(manifest_validation)
 
     return render_template('./htmx/layout/mapped-manifest.html',
         manifest_name=manifest_name,
         manifest_params=manifest_params,
         manifest_details=manifest_details,
         manifest_unit_map=manifest_unit_map,
+        manifest_validation=manifest_validation,
         flag_incomplete_manifest_data=flag_incomplete_manifest_data
     )
 
+@app.route('/htmx-api/layout-form/manifest-row', methods=['POST'])
+def layout_form_post_manifest_row():
+    '''
+    Saves the cells of a single manifest row and renders only that row again. The generate layout button listens for the manifestChanged event to update itself
+    '''
+    manifest_name = request.args.get('manifest', default=None, type=str)
+    row_idx = request.args.get('row', default=None, type=int)
+
+    try:
+        patched_row = utils.patch_manifest_row(manifest_name, row_idx, request.form.to_dict())
+    except ValueError as error:
+        return str(error), 400
+
+    return render_template('./htmx/layout/manifest-row.html',
+        manifest_name=manifest_name,
+        manifest_params=utils.get_manifest_params(),
+        item=patched_row['row'],
+        row_idx=row_idx,
+        row_problems=patched_row['problems']
+    ), {'HX-Trigger': 'manifestChanged'}
+
+@app.route('/htmx-api/layout-form/manifest-row/delete', methods=['POST'])
+def layout_form_post_delete_manifest_row():
+    '''
+    Deletes a single manifest row. The rows after it are numbered again, so the whole manifest is rendered again rather than just the row
+    '''
+    manifest_name = request.args.get('manifest', default=None, type=str)
+    row_idx = request.args.get('row', default=None, type=int)
+
+    try:
+        manifest_validation = utils.delete_manifest_row(manifest_name, row_idx)
+    except ValueError as error:
+        return str(error), 400
+
+    return render_template('./htmx/layout/mapped-manifest.html',
+        manifest_name=manifest_name,
+        manifest_params=utils.get_manifest_params(),
+        manifest_details=utils.get_manifest_details(manifest_name),
+        manifest_unit_map=utils.get_manifest_units(manifest_name),
+        manifest_validation=manifest_validation,
+        flag_incomplete_manifest_data=bool(manifest_validation)
+    )
+
+@app.route('/htmx-api/layout-form/generate-layout-button', methods=['GET'])
+def layout_form_get_generate_layout_button():
+    manifest_name = request.args.get('manifest', default=None, type=str)
+
+    return render_template('./htmx/layout/generate-layout-button.html',
+        manifest_name=manifest_name,
+        flag_incomplete_manifest_data=bool(utils.get_manifest_validation(manifest_name))
+    )
+
 @app.route('/htmx-api/layout-form/generate-shipment-plan', methods=['POST'])
 def layout_form_post_generate_shipment_plan():
     truck = request.args.get('truck', default=None, type=str)
     manifest_name = request.args.get('manifest', default=None, type=str)
+    solver = request.args.get('solver', default='greedy', type=str)
+    time_budget_ms = request.args.get('time_budget_ms', default=INTERACTIVE_PLAN_TIME_BUDGET_MS, type=int)
+    rack_backend = request.args.get('rack_backend', default='dense', type=str)
 
     truck_details = api.truck_api_get_truck(urllib.parse.unquote(truck))
     manifest_details = utils.format_manifest_form_data(request.form)
     manifest_units = utils.get_manifest_units(manifest_name)
 
-    shipment_plan = utils.generate_shipment_plan(truck_details, manifest_name, manifest_details, manifest_units)
+    # Build on the last plan made for this truck and manifest, so that edits to the manifest only move the affected cargo
+    previous_plan = api.load_shipment_plan(truck_details['truck_name'], manifest_name)
+
+    shipment_plan = utils.generate_shipment_plan(truck_details, manifest_name, manifest_details, manifest_units, solver, time_budget_ms, previous_plan=previous_plan, rack_backend=rack_backend)
     api.store_shipment_plan(shipment_plan)
 
     return render_template('./htmx/layout/shipment-plan.html',
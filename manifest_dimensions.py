@@ -0,0 +1,105 @@
+'''
+Extraction of glass sizes from the description text of manifest rows. ERP exports often leave the length, width and thickness of an item blank and only give them in its description, as a size in fractional inches such as '44 X 97 3/16' followed by the make-up of the glass, such as '1/4 Clear Tempered -  1/2 Lpx Clear Ano Spacer -  1/4 Clear Tempered'. Descriptions repeat heavily across a manifest, so each distinct description is parsed once and the results are spread back out over the whole column.
+'''
+import re
+
+import numpy as np
+
+# A measurement in inches, written as a whole number, a decimal, a fraction or a whole number followed by a fraction
+INCHES_PATTERN = r'(?:\d+(?:\.\d+)?(?:\s+\d+/\d+)?|\d+/\d+)'
+
+SIZE_PATTERN = re.compile(rf'(?<![\d/.])({INCHES_PATTERN})\s*[xX]\s*({INCHES_PATTERN})(?![\d/])')
+LINE_BREAK_PATTERN = re.compile(r'<br\s*/?>|\n', re.IGNORECASE)
+SHAPE_PATTERN = re.compile(r'\{[^}]*\}\s*(?:\d+(?:\.\d+)?)?')
+MAKE_UP_SEPARATOR_PATTERN = re.compile(r'\s+-\s+')
+MAKE_UP_LAYER_PATTERN = re.compile(rf'({INCHES_PATTERN})\s+[A-Za-z]')
+TRAILING_THICKNESS_PATTERN = re.compile(rf'[A-Za-z]-\s*({INCHES_PATTERN})$')
+
+# How far a row's parsed sizes can be trusted. Rows are 'high' when a single size and the make-up of the glass were both found, and 'low' when only one of them was or the description gave more than one size
+DIMENSION_CONFIDENCE_HIGH = 'high'
+DIMENSION_CONFIDENCE_LOW = 'low'
+
+def parse_inches(text: str) -> float:
+    '''
+    Value of a measurement in inches such as '97 3/16', '3/16' or '79.5'
+    '''
+    inches = 0.0
+    for part in text.split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            if int(denominator) == 0:
+                raise ValueError(f"'{text}' is not a measurement")
+            inches += int(numerator) / int(denominator)
+        else:
+            inches += float(part)
+    return inches
+
+def parse_make_up_thickness(line: str) -> float:
+    '''
+    Overall thickness of the glass described on one line of a description, adding up every lite and spacer of an insulated unit. Returns None when the line does not describe a make-up
+    '''
+    line = line.strip()
+    if not line:
+        return None
+
+    layer_thicknesses = []
+    for layer in MAKE_UP_SEPARATOR_PATTERN.split(line):
+        layer_match = MAKE_UP_LAYER_PATTERN.match(layer)
+        if layer_match is None:
+            break
+        layer_thicknesses.append(parse_inches(layer_match.group(1)))
+    else:
+        return sum(layer_thicknesses)
+
+    # Products named by what they are, such as 'Shower Glass- 3/8', give their thickness at the end instead
+    trailing_match = TRAILING_THICKNESS_PATTERN.search(line)
+    if trailing_match is not None:
+        return parse_inches(trailing_match.group(1))
+    return None
+
+def parse_description_dimensions(description: str) -> tuple:
+    '''
+    Length, width and thickness in inches given by a single description, along with how far they can be trusted. The longer side of the size is taken as the length. Values that could not be found are NaN and the confidence is None when nothing could be found
+    '''
+    sizes = []
+    thickness = None
+    for line in LINE_BREAK_PATTERN.split(description or ''):
+        size_matches = list(SIZE_PATTERN.finditer(line))
+        for size_match in size_matches:
+            sizes.append((parse_inches(size_match.group(1)), parse_inches(size_match.group(2))))
+        if thickness is None:
+            # The make-up can share a line with the size, as in '1/4 Clear 48 X 84', so the size is taken out of the line first
+            make_up = SHAPE_PATTERN.sub(' ', SIZE_PATTERN.sub(' ', line)) if size_matches else line
+            thickness = parse_make_up_thickness(make_up)
+
+    if not sizes and thickness is None:
+        return (np.nan, np.nan, np.nan, None)
+
+    length, width = (max(sizes[0]), min(sizes[0])) if sizes else (np.nan, np.nan)
+    if thickness is None:
+        thickness = np.nan
+    found_all = bool(sizes) and not np.isnan(thickness)
+    ambiguous = len(set(sizes)) > 1
+    confidence = DIMENSION_CONFIDENCE_HIGH if found_all and not ambiguous else DIMENSION_CONFIDENCE_LOW
+    return (length, width, thickness, confidence)
+
+def extract_dimensions(descriptions: object) -> object:
+    '''
+    Parses a whole column of descriptions at once, parsing each distinct description only once
+
+    Returns the length, width and thickness of every row in inches, with NaN where they could not be found, and the confidence of every row
+    '''
+    descriptions = np.asarray(descriptions, dtype=str)
+    distinct_descriptions, row_description_idxs = np.unique(descriptions, return_inverse=True)
+
+    parsed_dimensions = [parse_description_dimensions(description) for description in distinct_descriptions.tolist()]
+    distinct_sizes = np.array([dimensions[:3] for dimensions in parsed_dimensions], dtype=np.float64).reshape(-1, 3)
+    distinct_confidences = np.array([dimensions[3] for dimensions in parsed_dimensions], dtype=object)
+
+    row_sizes = distinct_sizes[row_description_idxs.reshape(-1)]
+    return {
+        'length': row_sizes[:, 0],
+        'width': row_sizes[:, 1],
+        'thickness': row_sizes[:, 2],
+        'confidence': distinct_confidences[row_description_idxs.reshape(-1)].tolist()
+    }
@@ -0,0 +1,96 @@
+'''
+Store of the maps that tie the columns of a manifest to the manifest parameters. Every map is kept in a file of its own, keyed by the name of the manifest it was made for, and is also filed under a hash of the column names of that manifest, so that a later manifest with the same columns, such as the next export of the same ERP report, can be mapped the same way without being mapped by hand again. Files are read once and cached in memory until they change, and maps saved to the single shared file of earlier versions can still be read.
+'''
+import copy
+import hashlib
+import json
+import os
+import threading
+
+import manifest_store
+
+MANIFEST_MAP_DIRECTORY = './maps'
+
+# Single file that every manifest map used to be saved to, read for manifests mapped before maps were stored on their own
+LEGACY_MANIFEST_MAPS_PATH = './maps/manifest_maps.json'
+
+# Contents of the map files read so far, keyed by path, along with the signature of the file they were read from
+map_file_cache = {}
+map_file_cache_lock = threading.Lock()
+
+def get_header_hash(column_names: list) -> str:
+    '''
+    Hash of the column names of a manifest, in order, which is the same for every manifest exported in the same format
+    '''
+    return hashlib.sha1(json.dumps(list(column_names)).encode('utf-8')).hexdigest()
+
+def get_manifest_map_path(manifest_name: str) -> str:
+    return os.path.join(MANIFEST_MAP_DIRECTORY, 'manifests', f'{manifest_name}.json')
+
+def get_header_map_path(header_hash: str) -> str:
+    return os.path.join(MANIFEST_MAP_DIRECTORY, 'headers', f'{header_hash}.json')
+
+def read_map_file(map_path: str) -> object:
+    '''
+    Contents of a map file, read from memory unless the file has changed since it was last read. Returns None when there is no such file
+    '''
+    try:
+        file_signature = manifest_store.get_file_signature(map_path)
+    except FileNotFoundError:
+        return None
+
+    with map_file_cache_lock:
+        cached_file = map_file_cache.get(map_path)
+    if cached_file is not None and cached_file[0] == file_signature:
+        return cached_file[1]
+
+    try:
+        with open(map_path, 'r', encoding='utf-8') as jsonfile:
+            map_file = json.load(jsonfile)
+    except FileNotFoundError:
+        return None
+    with map_file_cache_lock:
+        map_file_cache[map_path] = (file_signature, map_file)
+    return map_file
+
+def write_map_file(map_path: str, map_file: object) -> None:
+    '''
+    Saves a map file, writing it to a temporary file first and moving it into place so that a concurrent reader never sees half of one
+    '''
+    os.makedirs(os.path.dirname(map_path), exist_ok=True)
+    temporary_path = f'{map_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as jsonfile:
+        json.dump(map_file, jsonfile)
+    os.replace(temporary_path, map_path)
+    with map_file_cache_lock:
+        map_file_cache[map_path] = (manifest_store.get_file_signature(map_path), map_file)
+
+def get_manifest_map(manifest_name: str) -> object:
+    '''
+    Map saved for a manifest, or None when the manifest has not been mapped
+    '''
+    map_file = read_map_file(get_manifest_map_path(manifest_name))
+    if map_file is not None:
+        return copy.deepcopy(map_file['map'])
+
+    legacy_maps = read_map_file(LEGACY_MANIFEST_MAPS_PATH) or {}
+    if manifest_name in legacy_maps:
+        return copy.deepcopy(legacy_maps[manifest_name])
+    return None
+
+def find_manifest_map(column_names: list) -> object:
+    '''
+    Map last saved for any manifest with exactly these column names, or None when no such manifest has been mapped
+    '''
+    map_file = read_map_file(get_header_map_path(get_header_hash(column_names)))
+    if map_file is None or map_file['column_names'] != list(column_names):
+        return None
+    return copy.deepcopy(map_file['map'])
+
+def save_manifest_map(manifest_name: str, column_names: list, manifest_map: object) -> None:
+    '''
+    Saves the map of a manifest under its name and under the column names it was made for
+    '''
+    header_hash = get_header_hash(column_names)
+    write_map_file(get_manifest_map_path(manifest_name), {'header_hash': header_hash, 'map': manifest_map})
+    write_map_file(get_header_map_path(header_hash), {'column_names': list(column_names), 'map': manifest_map})
@@ -0,0 +1,548 @@
+'''
+Columnar store for manifest CSVs. Each manifest is parsed once into a column per field, kept as the raw text along with a NumPy array of numbers for each of the numeric manifest parameters, and held in memory keyed by the path and modification time of the file so that an edited manifest is parsed again. Parsed manifests can also be written to a binary sidecar beside the CSV, so that a restarted worker does not have to parse a large manifest again.
+
+Edits to single rows are applied to the cached columns and appended to a change log beside the CSV rather than written out in full. A manifest reads as its CSV with the logged changes applied on top, and the log is compacted into the CSV in the background once it grows long enough.
+'''
+import codecs
+import collections
+import contextlib
+import csv
+import json
+import os
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+import resource_registry
+import spreadsheet_readers
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, and there the application is only run locally as a single process
+    fcntl = None
+
+# Sidecars are kept in a hidden directory beside the manifests so that they are not mistaken for manifests
+MANIFEST_SIDECAR_DIRECTORY = '.columns'
+MANIFEST_SIDECAR_ENABLED = True
+
+# Number of parsed manifests held in memory before the least recently used one is evicted
+MANIFEST_CACHE_MAX_ENTRIES = 16
+
+# Number of changes logged against a manifest before they are compacted into its CSV
+MANIFEST_CHANGE_LOG_MAX_ENTRIES = 64
+
+# Size in bytes of the chunks that an uploaded manifest is read in
+MANIFEST_UPLOAD_CHUNK_SIZE = 64 * 1024
+
+MANIFEST_UPLOAD_DELIMITERS = ',;\t|'
+
+memory_tier = collections.OrderedDict()
+memory_tier_lock = threading.Lock()
+
+# Held by this process while a manifest or its change log is being written, see lock_manifest
+manifest_write_lock = threading.RLock()
+# Lock files of the manifests locked by this process. Only used while holding manifest_write_lock, so that the thread holding the lock on a manifest can take it again
+locked_manifests = set()
+compacting_manifests = set()
+
+def get_numeric_param_keys() -> list:
+    manifest_params = resource_registry.get_schema('manifest_params')['manifest_parameters']
+    return [param['key'] for param in manifest_params if param['type'] == 'number']
+
+def get_file_signature(csv_path: str) -> tuple:
+    '''
+    Modification time and size of a file, which together tell whether it has changed since it was parsed
+    '''
+    file_stat = os.stat(csv_path)
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+def get_sidecar_path(csv_path: str, extension: str = 'npz') -> str:
+    manifest_directory, filename = os.path.split(csv_path)
+    return os.path.join(manifest_directory, MANIFEST_SIDECAR_DIRECTORY, f'{filename}.{extension}')
+
+def get_change_log_path(csv_path: str) -> str:
+    return get_sidecar_path(csv_path, 'changes.jsonl')
+
+@contextlib.contextmanager
+def lock_manifest(csv_path: str):
+    '''
+    Held while a manifest or its change log is being written, so that changes are not lost to a compaction running at the same time. The lock is taken within this process and then on a lock file beside the change log, which keeps out the other worker processes sharing the manifests
+    '''
+    with manifest_write_lock:
+        lock_path = os.path.abspath(get_sidecar_path(csv_path, 'lock'))
+        if fcntl is None or lock_path in locked_manifests:
+            yield
+            return
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            locked_manifests.add(lock_path)
+            try:
+                yield
+            finally:
+                locked_manifests.discard(lock_path)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def get_manifest_signature(csv_path: str) -> tuple:
+    '''
+    Version of a manifest as it reads now, made up of the signature of its CSV followed by that of any changes logged against it since it was last written out
+    '''
+    try:
+        change_log_signature = get_file_signature(get_change_log_path(csv_path))
+    except FileNotFoundError:
+        change_log_signature = (0, 0)
+    return get_file_signature(csv_path) + change_log_signature
+
+def parse_number(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+def parse_numeric_column(text_values: list) -> np.ndarray:
+    '''
+    Converts a column of text to floats, with blank or unreadable values as NaN. The whole column is converted at once, falling back to converting value by value only when some of the values are not numbers
+    '''
+    try:
+        return np.fromiter(map(float, text_values), dtype=np.float64, count=len(text_values))
+    except ValueError:
+        return np.fromiter(map(parse_number, text_values), dtype=np.float64, count=len(text_values))
+
+def parse_manifest_csv(csv_path: str) -> object:
+    '''
+    Reads a manifest CSV in a single pass and turns it into columns. Rows that are short are padded out with blanks and any values past the last header are dropped, as with a DictReader
+    '''
+    with open(csv_path, 'r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        column_names = next(reader, [])
+        column_count = len(column_names)
+        rows = [
+            row if len(row) == column_count else (row + [''] * (column_count - len(row)))[:column_count]
+            for row in reader if row
+        ]
+
+    numeric_param_keys = get_numeric_param_keys()
+    text_columns = {}
+    numeric_columns = {}
+    for column_name, text_values in zip(column_names, zip(*rows) if rows else [()] * column_count):
+        text_columns[column_name] = np.array(text_values, dtype=str)
+        if column_name in numeric_param_keys:
+            numeric_columns[column_name] = parse_numeric_column(text_values)
+
+    return build_manifest_columns(column_names, text_columns, numeric_columns, len(rows))
+
+def build_manifest_columns(column_names: list, text_columns: object, numeric_columns: object, row_count: int) -> object:
+    # Parsed manifests are shared between callers, so the columns are made read only
+    for column in list(text_columns.values()) + list(numeric_columns.values()):
+        column.flags.writeable = False
+
+    return {
+        'column_names': list(column_names),
+        'row_count': row_count,
+        'text_columns': text_columns,
+        'numeric_columns': numeric_columns
+    }
+
+def read_sidecar(csv_path: str, file_signature: tuple) -> object:
+    '''
+    Loads the columns of a manifest from its sidecar, if there is one that was written for the manifest as it is now
+    '''
+    try:
+        with np.load(get_sidecar_path(csv_path), allow_pickle=False) as sidecar:
+            if tuple(sidecar['file_signature'].tolist()) != file_signature:
+                return None
+            column_names = sidecar['column_names'].tolist()
+            text_columns = {
+                column_name: sidecar[f'text_{column_idx}']
+                for column_idx, column_name in enumerate(column_names)
+            }
+            numeric_columns = {
+                column_name: sidecar[f'numeric_{column_idx}']
+                for column_idx, column_name in enumerate(column_names)
+                if f'numeric_{column_idx}' in sidecar
+            }
+            row_count = int(sidecar['row_count'])
+    except (FileNotFoundError, KeyError, ValueError, OSError):
+        return None
+    return build_manifest_columns(column_names, text_columns, numeric_columns, row_count)
+
+def write_sidecar(csv_path: str, file_signature: tuple, manifest_columns: object) -> None:
+    '''
+    Writes the columns of a manifest to its sidecar. The sidecar is written to a temporary file first and moved into place, so that a concurrent reader never sees half of one
+    '''
+    sidecar_path = get_sidecar_path(csv_path)
+    os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+    sidecar_arrays = {
+        'file_signature': np.array(file_signature, dtype=np.int64),
+        'column_names': np.array(manifest_columns['column_names'], dtype=str),
+        'row_count': np.array(manifest_columns['row_count'])
+    }
+    for column_idx, column_name in enumerate(manifest_columns['column_names']):
+        sidecar_arrays[f'text_{column_idx}'] = manifest_columns['text_columns'][column_name]
+        if column_name in manifest_columns['numeric_columns']:
+            sidecar_arrays[f'numeric_{column_idx}'] = manifest_columns['numeric_columns'][column_name]
+
+    temporary_path = f'{sidecar_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as sidecar_file:
+        np.savez(sidecar_file, **sidecar_arrays)
+    os.replace(temporary_path, sidecar_path)
+
+def load_manifest_columns(csv_path: str, use_sidecar: bool = None) -> object:
+    '''
+    Columns of a manifest CSV, with any logged changes applied, parsed once for each version of the manifest. Memory is checked first, then the sidecar, and the CSV is only parsed when neither has the file as it is now
+    '''
+    if use_sidecar is None:
+        use_sidecar = MANIFEST_SIDECAR_ENABLED
+
+    manifest_signature = get_manifest_signature(csv_path)
+    cache_key = (os.path.abspath(csv_path), manifest_signature)
+    with memory_tier_lock:
+        if cache_key in memory_tier:
+            memory_tier.move_to_end(cache_key)
+            return memory_tier[cache_key]
+
+    file_signature = manifest_signature[:2]
+    manifest_columns = read_sidecar(csv_path, file_signature) if use_sidecar else None
+    if manifest_columns is None:
+        manifest_columns = parse_manifest_csv(csv_path)
+        if use_sidecar:
+            try:
+                write_sidecar(csv_path, file_signature, manifest_columns)
+            except OSError:
+                pass
+    if manifest_signature[2:] != (0, 0):
+        manifest_columns = replay_change_log(csv_path, file_signature, manifest_columns)
+
+    remember_manifest_columns(cache_key, manifest_columns)
+    return manifest_columns
+
+def remember_manifest_columns(cache_key: tuple, manifest_columns: object) -> None:
+    '''
+    Adds a parsed manifest to memory, evicting the least recently used manifests once it is full
+    '''
+    with memory_tier_lock:
+        memory_tier[cache_key] = manifest_columns
+        memory_tier.move_to_end(cache_key)
+        while len(memory_tier) > MANIFEST_CACHE_MAX_ENTRIES:
+            memory_tier.popitem(last=False)
+
+def forget_manifest(csv_path: str) -> None:
+    '''
+    Drops every parsed version of a manifest from memory, for when the file is about to be rewritten
+    '''
+    csv_path = os.path.abspath(csv_path)
+    with memory_tier_lock:
+        for cache_key in [cache_key for cache_key in memory_tier if cache_key[0] == csv_path]:
+            del memory_tier[cache_key]
+
+def discard_change_log(csv_path: str) -> None:
+    '''
+    Drops the logged changes of a manifest, for when the whole of it is about to be written out again. Only to be called while holding lock_manifest
+    '''
+    try:
+        os.remove(get_change_log_path(csv_path))
+    except FileNotFoundError:
+        pass
+
+def check_manifest_change(manifest_columns: object, manifest_change: object) -> None:
+    '''
+    Makes sure that a change is to a row that the manifest has and only to columns that it has, raising a ValueError when it is not
+    '''
+    row_idx = manifest_change['row']
+    if not isinstance(row_idx, int) or not 0 <= row_idx < manifest_columns['row_count']:
+        raise ValueError(f"The manifest has no row {row_idx}, it has {manifest_columns['row_count']} rows")
+    if manifest_change['op'] == 'set':
+        unknown_columns = [column_name for column_name in manifest_change['values'] if column_name not in manifest_columns['text_columns']]
+        if unknown_columns:
+            raise ValueError(f"The manifest has no column {', '.join(repr(column_name) for column_name in unknown_columns)}")
+    elif manifest_change['op'] != 'delete':
+        raise ValueError(f"Unknown manifest change '{manifest_change['op']}'")
+
+def apply_manifest_change(manifest_columns: object, manifest_change: object) -> object:
+    '''
+    Columns of a manifest with a single change made to them, either setting some of the cells of a row or deleting a row. Only the columns that the change touches are copied, the rest are shared with the manifest as it was
+    '''
+    row_idx = manifest_change['row']
+    text_columns = dict(manifest_columns['text_columns'])
+    numeric_columns = dict(manifest_columns['numeric_columns'])
+    row_count = manifest_columns['row_count']
+
+    if manifest_change['op'] == 'delete':
+        for column_name in text_columns:
+            text_columns[column_name] = np.delete(text_columns[column_name], row_idx)
+        for column_name in numeric_columns:
+            numeric_columns[column_name] = np.delete(numeric_columns[column_name], row_idx)
+        row_count -= 1
+    else:
+        for column_name, value in manifest_change['values'].items():
+            # Text columns are fixed width, so the column is widened when the new value would not fit
+            text_column = text_columns[column_name]
+            text_column = text_column.astype(f'<U{max(text_column.dtype.itemsize // 4, len(value), 1)}')
+            text_column[row_idx] = value
+            text_columns[column_name] = text_column
+            if column_name in numeric_columns:
+                numeric_column = numeric_columns[column_name].copy()
+                numeric_column[row_idx] = parse_number(value) if value else np.nan
+                numeric_columns[column_name] = numeric_column
+
+    return build_manifest_columns(manifest_columns['column_names'], text_columns, numeric_columns, row_count)
+
+def replay_change_log(csv_path: str, file_signature: tuple, manifest_columns: object) -> object:
+    '''
+    Applies the changes logged against a manifest to the columns of its CSV. Each change records the version of the CSV that it was made against, so changes left over from before the CSV was last written out are skipped, as is a change that was only half written
+    '''
+    try:
+        with open(get_change_log_path(csv_path), 'r', encoding='utf-8') as change_log:
+            for line in change_log:
+                try:
+                    manifest_change = json.loads(line)
+                except ValueError:
+                    continue
+                if tuple(manifest_change['base']) != file_signature:
+                    continue
+                manifest_columns = apply_manifest_change(manifest_columns, manifest_change)
+    except FileNotFoundError:
+        pass
+    return manifest_columns
+
+def patch_manifest(csv_path: str, manifest_change: object) -> object:
+    '''
+    Makes a change to a single row of a manifest, given as either {'op': 'set', 'row': ..., 'values': {column: value}} or {'op': 'delete', 'row': ...} with rows counted from zero. The change is applied to the cached columns and appended to the change log, and a compaction is started once the log has grown long enough. Raises a ValueError for a change that does not fit the manifest
+
+    Returns the columns of the manifest with the change made
+    '''
+    manifest_change = dict(manifest_change)
+    if 'values' in manifest_change:
+        manifest_change['values'] = {
+            column_name: '' if value is None else str(value).strip()
+            for column_name, value in manifest_change['values'].items()
+        }
+
+    with lock_manifest(csv_path):
+        manifest_columns = load_manifest_columns(csv_path)
+        check_manifest_change(manifest_columns, manifest_change)
+        manifest_columns = apply_manifest_change(manifest_columns, manifest_change)
+
+        manifest_change['base'] = list(get_file_signature(csv_path))
+        change_log_path = get_change_log_path(csv_path)
+        os.makedirs(os.path.dirname(change_log_path), exist_ok=True)
+        with open(change_log_path, 'a', encoding='utf-8') as change_log:
+            change_log.write(json.dumps(manifest_change) + '\n')
+        with open(change_log_path, 'r', encoding='utf-8') as change_log:
+            logged_change_count = sum(1 for _ in change_log)
+
+        remember_manifest_columns((os.path.abspath(csv_path), get_manifest_signature(csv_path)), manifest_columns)
+
+    if logged_change_count >= MANIFEST_CHANGE_LOG_MAX_ENTRIES:
+        schedule_compaction(csv_path)
+    return manifest_columns
+
+def schedule_compaction(csv_path: str) -> None:
+    '''
+    Starts compacting a manifest on a background thread, unless it is already being compacted
+    '''
+    csv_path = os.path.abspath(csv_path)
+    with manifest_write_lock:
+        if csv_path in compacting_manifests:
+            return
+        compacting_manifests.add(csv_path)
+    threading.Thread(target=compact_manifest, args=(csv_path,), daemon=True).start()
+
+def compact_manifest(csv_path: str, use_sidecar: bool = None) -> None:
+    '''
+    Writes a manifest out to its CSV with all of its logged changes applied and then clears its change log. The CSV is written to a temporary file first and moved into place, so that a concurrent reader never sees half of one
+    '''
+    if use_sidecar is None:
+        use_sidecar = MANIFEST_SIDECAR_ENABLED
+
+    try:
+        with lock_manifest(csv_path):
+            manifest_columns = load_manifest_columns(csv_path)
+            text_columns = [manifest_columns['text_columns'][column_name].tolist() for column_name in manifest_columns['column_names']]
+            temporary_path = f'{csv_path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'w', encoding='utf-8', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(manifest_columns['column_names'])
+                writer.writerows(zip(*text_columns))
+            os.replace(temporary_path, csv_path)
+            discard_change_log(csv_path)
+            forget_manifest(csv_path)
+
+            file_signature = get_file_signature(csv_path)
+            if use_sidecar:
+                try:
+                    write_sidecar(csv_path, file_signature, manifest_columns)
+                except OSError:
+                    pass
+            remember_manifest_columns((os.path.abspath(csv_path), get_manifest_signature(csv_path)), manifest_columns)
+    finally:
+        with manifest_write_lock:
+            compacting_manifests.discard(os.path.abspath(csv_path))
+
+def get_manifest_row(manifest_columns: object, row_idx: int) -> object:
+    return {
+        column_name: manifest_columns['text_columns'][column_name][row_idx].item()
+        for column_name in manifest_columns['column_names']
+    }
+
+def get_manifest_rows(manifest_columns: object) -> list:
+    '''
+    Rows of a parsed manifest as dicts of text keyed by column name, the same as a DictReader would give. Fresh dicts are made each time so that callers are free to modify them
+    '''
+    column_names = manifest_columns['column_names']
+    text_columns = [manifest_columns['text_columns'][column_name].tolist() for column_name in column_names]
+    return [dict(zip(column_names, row)) for row in zip(*text_columns)] if column_names else []
+
+def iterate_stream_lines(stream: object, chunk_size: int = MANIFEST_UPLOAD_CHUNK_SIZE):
+    '''
+    Decodes a binary stream a chunk at a time and yields it line by line, with the line endings kept so that values quoted across lines are read back whole. A byte order mark at the start is dropped, and bytes that are not UTF-8 are replaced rather than failing the upload
+    '''
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    partial_line = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            partial_line += decoder.decode(b'', final=True)
+            if partial_line:
+                yield partial_line
+            return
+
+        lines = (partial_line + decoder.decode(chunk)).split('\n')
+        partial_line = lines.pop()
+        for line in lines:
+            yield f'{line}\n'
+
+def sniff_manifest_dialect(header_line: str) -> object:
+    '''
+    Works out how the values of an uploaded manifest are separated and quoted from its header line, falling back to a plain comma separated file when it cannot be told
+    '''
+    try:
+        return csv.Sniffer().sniff(header_line, delimiters=MANIFEST_UPLOAD_DELIMITERS)
+    except csv.Error:
+        return csv.excel
+
+def iterate_csv_rows(stream: object, chunk_size: int = MANIFEST_UPLOAD_CHUNK_SIZE):
+    '''
+    Reads an uploaded CSV row by row, with the dialect sniffed from its header line
+    '''
+    lines = iterate_stream_lines(stream, chunk_size)
+    header_line = next((line for line in lines if line.strip()), None)
+    if header_line is None:
+        return
+
+    dialect = sniff_manifest_dialect(header_line)
+    try:
+        yield next(csv.reader([header_line], dialect))
+        yield from csv.reader(lines, dialect)
+    except csv.Error as error:
+        raise ValueError(f'The uploaded manifest could not be read as a CSV: {error}') from error
+
+def iterate_spreadsheet_rows(stream: object, row_reader: object):
+    '''
+    Reads an uploaded spreadsheet row by row, turning a broken or unexpected workbook into a ValueError
+    '''
+    try:
+        yield from row_reader(stream)
+    except (zipfile.BadZipFile, KeyError, IndexError, ET.ParseError) as error:
+        raise ValueError(f'The uploaded spreadsheet could not be read: {error!r}') from error
+
+def iterate_manifest_rows(stream: object, file_format: str, chunk_size: int = MANIFEST_UPLOAD_CHUNK_SIZE):
+    if file_format == 'csv':
+        return iterate_csv_rows(stream, chunk_size)
+    if file_format == 'xlsx':
+        return iterate_spreadsheet_rows(stream, spreadsheet_readers.iterate_xlsx_rows)
+    if file_format == 'ods':
+        return iterate_spreadsheet_rows(stream, spreadsheet_readers.iterate_ods_rows)
+    raise ValueError(f"Manifests cannot be read from '{file_format}' files")
+
+def normalize_column_names(header: list) -> list:
+    '''
+    Trims the column names of an uploaded manifest, naming any blank columns by their position and numbering repeated names, so that every column can be told apart when it is mapped
+    '''
+    column_names = []
+    for column_idx, column_name in enumerate(header):
+        column_name = column_name.strip() or f'Column {column_idx + 1}'
+        unique_column_name = column_name
+        repeat_count = 1
+        while unique_column_name in column_names:
+            repeat_count += 1
+            unique_column_name = f'{column_name} ({repeat_count})'
+        column_names.append(unique_column_name)
+    return column_names
+
+def ingest_manifest_stream(stream: object, csv_path: str, file_format: str = 'csv', chunk_size: int = MANIFEST_UPLOAD_CHUNK_SIZE, use_sidecar: bool = None) -> object:
+    '''
+    Reads an uploaded CSV, XLSX or ODS manifest from a binary stream a row at a time and writes it out as a normalized CSV, building its columns for the cache in the same pass so that it never has to be read back. Values are trimmed, blank rows are dropped, and rows are padded or cut to the width of the header. Raises a ValueError when the upload is empty or cannot be read
+
+    Returns the column names along with counts of how many rows were kept and how many had to be fixed up
+    '''
+    if use_sidecar is None:
+        use_sidecar = MANIFEST_SIDECAR_ENABLED
+
+    rows = iterate_manifest_rows(stream, file_format, chunk_size)
+    header = next((row for row in rows if any(value.strip() for value in row)), None)
+    if header is None:
+        raise ValueError('The uploaded manifest is empty')
+
+    column_names = normalize_column_names(header)
+    column_count = len(column_names)
+    ingest_summary = {
+        'column_names': column_names,
+        'row_count': 0,
+        'blank_rows': 0,
+        'padded_rows': 0,
+        'truncated_rows': 0
+    }
+
+    text_values = [[] for _ in column_names]
+    temporary_path = f'{csv_path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary_path, 'w', encoding='utf-8', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(column_names)
+            for row in rows:
+                row = [value.strip() for value in row]
+                if not any(row):
+                    ingest_summary['blank_rows'] += 1
+                    continue
+                if len(row) < column_count:
+                    row += [''] * (column_count - len(row))
+                    ingest_summary['padded_rows'] += 1
+                elif len(row) > column_count:
+                    if any(row[column_count:]):
+                        ingest_summary['truncated_rows'] += 1
+                    row = row[:column_count]
+
+                writer.writerow(row)
+                for column_values, value in zip(text_values, row):
+                    column_values.append(value)
+                ingest_summary['row_count'] += 1
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+    with lock_manifest(csv_path):
+        forget_manifest(csv_path)
+        discard_change_log(csv_path)
+        os.replace(temporary_path, csv_path)
+
+    numeric_param_keys = get_numeric_param_keys()
+    text_columns = {}
+    numeric_columns = {}
+    for column_name, column_values in zip(column_names, text_values):
+        text_columns[column_name] = np.array(column_values, dtype=str)
+        if column_name in numeric_param_keys:
+            numeric_columns[column_name] = parse_numeric_column(column_values)
+    manifest_columns = build_manifest_columns(column_names, text_columns, numeric_columns, ingest_summary['row_count'])
+
+    file_signature = get_file_signature(csv_path)
+    if use_sidecar:
+        try:
+            write_sidecar(csv_path, file_signature, manifest_columns)
+        except OSError:
+            pass
+    remember_manifest_columns((os.path.abspath(csv_path), get_manifest_signature(csv_path)), manifest_columns)
+    return ingest_summary
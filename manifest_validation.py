@@ -0,0 +1,174 @@
+'''
+Index of the cells of a manifest that are missing or cannot be used. The index is built once for each version of a manifest, from its cached columns, and stored beside the parsed columns of the manifest so that it survives restarts. When rows of a manifest are edited only those rows are checked again, so the cells to highlight and whether the manifest is ready to be planned are known without scanning the whole manifest.
+'''
+import json
+import os
+
+import numpy as np
+
+import manifest_store
+
+# Manifest parameters that are counted, and so have to be whole numbers
+MANIFEST_INTEGER_PARAMS = ('stop_number', 'quantity')
+
+class ManifestValidationError(ValueError):
+    '''
+    Raised when a manifest has a missing or unusable value where a value is needed
+    '''
+
+def get_validation_index_path(csv_path: str) -> str:
+    return manifest_store.get_sidecar_path(csv_path, 'validation.json')
+
+def get_cell_problem(column_name: str, value: object, numeric_param_keys: list) -> str:
+    '''
+    What is wrong with a single cell of a manifest, if anything. Cells are either 'missing' when blank, or 'invalid' when a numeric parameter holds something other than a number that is at least zero, or a counted parameter holds something other than a whole number
+    '''
+    value = '' if value is None else str(value).strip()
+    if not value:
+        return 'missing'
+    if column_name not in numeric_param_keys:
+        return None
+    if column_name in MANIFEST_INTEGER_PARAMS:
+        return None if value.isdecimal() else 'invalid'
+    try:
+        number = float(value)
+    except ValueError:
+        return 'invalid'
+    return None if np.isfinite(number) and number >= 0 else 'invalid'
+
+def validate_manifest_row(row: object, numeric_param_keys: list) -> object:
+    '''
+    Problems with the cells of a single manifest row, keyed by column
+    '''
+    row_problems = {}
+    for column_name, value in row.items():
+        cell_problem = get_cell_problem(column_name, value, numeric_param_keys)
+        if cell_problem:
+            row_problems[column_name] = cell_problem
+    return row_problems
+
+def build_validation_index(manifest_columns: object) -> object:
+    '''
+    Checks every cell of a manifest a column at a time, using the numbers already parsed for the numeric parameters. Gives the same problems as checking the rows one at a time
+    '''
+    cell_problems = {}
+    for column_name in manifest_columns['column_names']:
+        text_column = np.char.strip(manifest_columns['text_columns'][column_name])
+        missing_rows = text_column == ''
+        invalid_rows = np.zeros(len(text_column), dtype=bool)
+        if column_name in MANIFEST_INTEGER_PARAMS and column_name in manifest_columns['numeric_columns']:
+            invalid_rows = ~missing_rows & ~np.char.isdecimal(text_column)
+        elif column_name in manifest_columns['numeric_columns']:
+            numeric_column = manifest_columns['numeric_columns'][column_name]
+            with np.errstate(invalid='ignore'):
+                invalid_rows = ~missing_rows & ~(np.isfinite(numeric_column) & (numeric_column >= 0))
+
+        for cell_problem, problem_rows in (('missing', missing_rows), ('invalid', invalid_rows)):
+            for row_idx in np.flatnonzero(problem_rows).tolist():
+                cell_problems.setdefault(row_idx, {})[column_name] = cell_problem
+
+    return {
+        'row_count': manifest_columns['row_count'],
+        'cells': cell_problems
+    }
+
+def read_validation_index(csv_path: str) -> object:
+    '''
+    Loads the stored index of a manifest, if there is one that was built for the manifest as it is now
+    '''
+    try:
+        with open(get_validation_index_path(csv_path), 'r', encoding='utf-8') as index_file:
+            validation_index = json.load(index_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if tuple(validation_index['file_signature']) != manifest_store.get_manifest_signature(csv_path):
+        return None
+
+    # Row numbers come back from JSON as strings
+    validation_index['cells'] = {int(row_idx): row_problems for row_idx, row_problems in validation_index['cells'].items()}
+    return validation_index
+
+def write_validation_index(csv_path: str, validation_index: object) -> None:
+    '''
+    Stores the index of a manifest stamped with the version of the manifest that it was built for. The index is written to a temporary file first and moved into place, so that a concurrent reader never sees half of one
+    '''
+    validation_index['file_signature'] = list(manifest_store.get_manifest_signature(csv_path))
+    index_path = get_validation_index_path(csv_path)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    temporary_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as index_file:
+        json.dump(validation_index, index_file)
+    os.replace(temporary_path, index_path)
+
+def get_validation_index(csv_path: str) -> object:
+    '''
+    Index of the problem cells of a manifest, keyed by row number and then by column. The stored index is used when it is for the manifest as it is now, and is built again from the cached columns of the manifest when it is not
+    '''
+    validation_index = read_validation_index(csv_path)
+    if validation_index is None:
+        validation_index = build_validation_index(manifest_store.load_manifest_columns(csv_path))
+        try:
+            write_validation_index(csv_path, validation_index)
+        except OSError:
+            pass
+    return validation_index
+
+def update_validation_index(csv_path: str, manifest_rows: list, previous_rows: list = None, previous_validation_index: object = None) -> object:
+    '''
+    Brings the index of a manifest up to date after its rows have been written out. When the index of the version before the edit is given along with its rows, only the rows that have changed are checked again, otherwise every row is checked
+    '''
+    numeric_param_keys = manifest_store.get_numeric_param_keys()
+    manifest_rows = [
+        {column_name: '' if value is None else str(value) for column_name, value in row.items()}
+        for row in manifest_rows
+    ]
+
+    if previous_validation_index is None or previous_rows is None or len(previous_rows) != len(manifest_rows):
+        validation_index = {'row_count': len(manifest_rows), 'cells': {}}
+        changed_row_indexes = range(len(manifest_rows))
+    else:
+        validation_index = {'row_count': len(manifest_rows), 'cells': dict(previous_validation_index['cells'])}
+        changed_row_indexes = [
+            row_idx for row_idx, (row, previous_row) in enumerate(zip(manifest_rows, previous_rows))
+            if row != previous_row
+        ]
+
+    for row_idx in changed_row_indexes:
+        row_problems = validate_manifest_row(manifest_rows[row_idx], numeric_param_keys)
+        if row_problems:
+            validation_index['cells'][row_idx] = row_problems
+        else:
+            validation_index['cells'].pop(row_idx, None)
+
+    try:
+        write_validation_index(csv_path, validation_index)
+    except OSError:
+        pass
+    return validation_index
+
+def patch_validation_index(csv_path: str, previous_validation_index: object, row_idx: int, row: object = None) -> object:
+    '''
+    Brings the index of a manifest up to date after a single row has been patched, checking only that row. A row of None means that the row was deleted, in which case the rows after it move up by one
+    '''
+    if row is None:
+        validation_index = {
+            'row_count': previous_validation_index['row_count'] - 1,
+            'cells': {
+                other_row_idx - 1 if other_row_idx > row_idx else other_row_idx: row_problems
+                for other_row_idx, row_problems in previous_validation_index['cells'].items()
+                if other_row_idx != row_idx
+            }
+        }
+    else:
+        validation_index = {'row_count': previous_validation_index['row_count'], 'cells': dict(previous_validation_index['cells'])}
+        row_problems = validate_manifest_row(row, manifest_store.get_numeric_param_keys())
+        if row_problems:
+            validation_index['cells'][row_idx] = row_problems
+        else:
+            validation_index['cells'].pop(row_idx, None)
+
+    try:
+        write_validation_index(csv_path, validation_index)
+    except OSError:
+        pass
+    return validation_index
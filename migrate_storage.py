@@ -0,0 +1,50 @@
+'''
+One-shot copy of every stored truck, rack and shipment plan from one storage backend to another, keeping the owner and creation date of each object. Objects already in the target are replaced, so the copy can be run again if it is interrupted. Switch STORAGE_BACKEND in the app config once it has finished, for example:
+
+    python migrate_storage.py --from file --to sqlite
+'''
+import argparse
+import sys
+
+import storage
+
+def migrate_storage(from_backend: str, to_backend: str, collections: list = None) -> object:
+    '''
+    Copies the objects of each collection across, returning the number copied from each collection
+    '''
+    if from_backend == to_backend:
+        raise ValueError('The backends to migrate from and to are the same')
+
+    copied_counts = {}
+    for collection in collections or list(storage.STORAGE_COLLECTIONS):
+        copied_counts[collection] = 0
+        for name in storage.list_objects(collection, backend_name=from_backend):
+            try:
+                stored_object = storage.get_object(collection, name, backend_name=from_backend)
+                object_metadata = storage.get_object_metadata(collection, name, backend_name=from_backend)
+            except storage.ObjectNotFoundError:
+                continue
+            storage.save_object(
+                collection,
+                name,
+                stored_object,
+                owner=object_metadata['owner'],
+                created_at=object_metadata['created_at'],
+                backend_name=to_backend
+            )
+            copied_counts[collection] += 1
+        print(f'{collection}: copied {copied_counts[collection]}', file=sys.stderr)
+    return copied_counts
+
+def main(args: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Copies every stored truck, rack and shipment plan from one storage backend to another')
+    parser.add_argument('--from', dest='from_backend', default='file', choices=list(storage.STORAGE_BACKENDS))
+    parser.add_argument('--to', dest='to_backend', default='sqlite', choices=list(storage.STORAGE_BACKENDS))
+    parser.add_argument('--collections', nargs='+', choices=list(storage.STORAGE_COLLECTIONS), help='collections to copy, defaults to all of them')
+    parsed_args = parser.parse_args(args)
+
+    migrate_storage(parsed_args.from_backend, parsed_args.to_backend, parsed_args.collections)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+'''
+Content-addressed cache for shipment plans. Plans are keyed by a hash of everything that goes into making them, so that a repeat request for the same truck and manifest can be answered without placing any cargo. Recently used plans are held in memory, with every plan also written to disk so that they survive worker restarts. The plans on disk are pruned whenever one is written, oldest first, once there are too many of them or they have gone unused for too long.
+'''
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+import utils
+
+PLAN_CACHE_PATH = './resources/plans/cache'
+PLAN_HASH_INDEX_PATH = './resources/plans/plan_hashes.json'
+
+# Number of plans held in memory before the least recently used one is evicted
+PLAN_CACHE_MAX_ENTRIES = 32
+
+# Number of plans kept on disk before the least recently used ones are pruned
+PLAN_CACHE_MAX_DISK_ENTRIES = 1024
+
+# Time in seconds that a plan is kept on disk after it was last written or read from there
+PLAN_CACHE_MAX_DISK_AGE = 30 * 24 * 60 * 60
+
+memory_tier = collections.OrderedDict()
+memory_tier_lock = threading.Lock()
+
+def hash_plan_inputs(truck_details: object, manifest_details: list, manifest_units: object, solver_options: object = None) -> str:
+    '''
+    Creates the cache key for a shipment plan from a canonical JSON encoding of the truck, the manifest rows and units, the grid precision and the version and options of the solver. Manifest values are compared as trimmed strings, so that a row read back from a CSV and the same row posted from a form hash the same
+    '''
+    canonical_manifest_details = [
+        {column: str(value).strip() for column, value in row.items()}
+        for row in manifest_details
+    ]
+    canonical_inputs = {
+        'truck_details': truck_details,
+        'manifest_details': canonical_manifest_details,
+        'manifest_units': manifest_units,
+        'grid_precision_factor': utils.GRID_PRECISION_FACTOR,
+        'solver_version': utils.SOLVER_VERSION,
+        'solver_options': solver_options or {}
+    }
+    encoded_inputs = json.dumps(canonical_inputs, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded_inputs.encode('utf-8')).hexdigest()
+
+def hash_truck_details(truck_details: object) -> str:
+    '''
+    Hash of a truck as it was configured, used to tell whether a stored plan was made for the truck as it is now
+    '''
+    encoded_truck = json.dumps(truck_details, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded_truck.encode('utf-8')).hexdigest()
+
+def get_cached_plan(plan_hash: str) -> object:
+    '''
+    Looks up a plan by its hash, checking memory first and then disk. A fresh copy of the plan is returned each time so that callers are free to modify it
+    '''
+    with memory_tier_lock:
+        if plan_hash in memory_tier:
+            memory_tier.move_to_end(plan_hash)
+            return json.loads(memory_tier[plan_hash])
+
+    plan_path = f'{PLAN_CACHE_PATH}/{plan_hash}.json'
+    try:
+        with open(plan_path, 'r', encoding='utf-8') as plan_file:
+            stringified_plan = plan_file.read()
+        # Reading a plan counts as using it, so that plans still in use are the last to be pruned
+        os.utime(plan_path)
+    except FileNotFoundError:
+        return None
+
+    remember_plan(plan_hash, stringified_plan)
+    return json.loads(stringified_plan)
+
+def cache_plan(plan_hash: str, shipment_plan: object) -> None:
+    '''
+    Stores a plan under its hash in both tiers of the cache and prunes the disk tier. The disk copy is written to a temporary file first and moved into place, so that a concurrent reader never sees half of a plan
+    '''
+    stringified_plan = json.dumps(shipment_plan)
+    remember_plan(plan_hash, stringified_plan)
+
+    os.makedirs(PLAN_CACHE_PATH, exist_ok=True)
+    temporary_path = f'{PLAN_CACHE_PATH}/{plan_hash}.json.{os.getpid()}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as plan_file:
+        plan_file.write(stringified_plan)
+    os.replace(temporary_path, f'{PLAN_CACHE_PATH}/{plan_hash}.json')
+    prune_disk_tier()
+
+def prune_disk_tier() -> None:
+    '''
+    Removes the plans on disk that have gone unused for longer than the age limit, and then the least recently used of the rest until no more than the maximum number are left. Plans are aged by the modification time of their files. Temporary files are left alone, since they may belong to a write in progress
+    '''
+    plan_files = []
+    try:
+        for plan_entry in os.scandir(PLAN_CACHE_PATH):
+            if plan_entry.name.endswith('.json'):
+                try:
+                    plan_files.append((plan_entry.stat().st_mtime, plan_entry.path))
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        return
+    plan_files.sort()
+
+    excess_count = len(plan_files) - PLAN_CACHE_MAX_DISK_ENTRIES
+    oldest_allowed_time = time.time() - PLAN_CACHE_MAX_DISK_AGE
+    for plan_idx, (modified_time, plan_path) in enumerate(plan_files):
+        if plan_idx >= excess_count and modified_time >= oldest_allowed_time:
+            break
+        # Another worker may be pruning at the same time
+        try:
+            os.remove(plan_path)
+        except FileNotFoundError:
+            pass
+
+def remember_plan(plan_hash: str, stringified_plan: str) -> None:
+    '''
+    Adds a plan to the memory tier, evicting the least recently used plans once it is full
+    '''
+    with memory_tier_lock:
+        memory_tier[plan_hash] = stringified_plan
+        memory_tier.move_to_end(plan_hash)
+        while len(memory_tier) > PLAN_CACHE_MAX_ENTRIES:
+            memory_tier.popitem(last=False)
+
+def get_stored_plan_hash(shipment_plan_name: str) -> str:
+    '''
+    Hash of the plan last stored under a shipment plan name, if any
+    '''
+    try:
+        with open(PLAN_HASH_INDEX_PATH, 'r', encoding='utf-8') as index_file:
+            plan_hash_index = json.load(index_file)
+    except FileNotFoundError:
+        return None
+    return plan_hash_index.get(shipment_plan_name)
+
+def record_stored_plan_hash(shipment_plan_name: str, plan_hash: str) -> None:
+    try:
+        with open(PLAN_HASH_INDEX_PATH, 'r', encoding='utf-8') as index_file:
+            plan_hash_index = json.load(index_file)
+    except FileNotFoundError:
+        plan_hash_index = {}
+    plan_hash_index[shipment_plan_name] = plan_hash
+
+    temporary_path = f'{PLAN_HASH_INDEX_PATH}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as index_file:
+        json.dump(plan_hash_index, index_file)
+    os.replace(temporary_path, PLAN_HASH_INDEX_PATH)
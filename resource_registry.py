@@ -0,0 +1,118 @@
+'''
+Registry of the trucks, racks and schemas kept as JSON files on disk. Each directory is read once and its files are held in memory as frozen objects, so that the cached copy cannot be changed by whoever reads it. A directory is only read again when its modification time changes, which happens whenever a file is added, removed or moved into it, and then only the files that have changed are parsed again. Resources saved or deleted through the application invalidate their directory straight away.
+'''
+import json
+import os
+import threading
+import types
+
+TRUCK_DIRECTORY = './resources/trucks'
+RACK_DIRECTORY = './resources/racks'
+SCHEMA_DIRECTORY = './schemas'
+
+# Resources of each directory read so far, keyed by the absolute path of the directory. Each entry holds the modification time of the directory when it was read and the frozen contents of its files, keyed by file name, along with the signature of each file
+registry = {}
+registry_lock = threading.Lock()
+
+def freeze(value: object) -> object:
+    '''
+    Read-only copy of parsed JSON, with objects made into mapping proxies and arrays into tuples
+    '''
+    if isinstance(value, dict):
+        return types.MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def thaw(value: object) -> object:
+    '''
+    Plain, changeable copy of a frozen resource, for callers that fill in or convert its values
+    '''
+    if isinstance(value, types.MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+def get_file_signature(resource_path: str) -> tuple:
+    resource_stat = os.stat(resource_path)
+    return (resource_stat.st_mtime_ns, resource_stat.st_size)
+
+def load_directory(directory: str) -> object:
+    '''
+    Frozen contents of every file in a resource directory, keyed by file name. Hidden files and temporary files left by a write in progress are skipped
+    '''
+    directory = os.path.abspath(directory)
+    directory_mtime = os.stat(directory).st_mtime_ns
+    with registry_lock:
+        cached_directory = registry.get(directory)
+    if cached_directory is not None and cached_directory['mtime'] == directory_mtime:
+        return cached_directory['resources']
+
+    previous_resources = cached_directory['resources'] if cached_directory else {}
+    previous_signatures = cached_directory['signatures'] if cached_directory else {}
+    resources = {}
+    signatures = {}
+    for resource_name in sorted(os.listdir(directory)):
+        resource_path = os.path.join(directory, resource_name)
+        if resource_name.startswith('.') or resource_name.endswith('.tmp') or not os.path.isfile(resource_path):
+            continue
+        try:
+            file_signature = get_file_signature(resource_path)
+            if previous_signatures.get(resource_name) == file_signature:
+                resources[resource_name] = previous_resources[resource_name]
+            else:
+                with open(resource_path, 'r', encoding='utf-8') as resource_file:
+                    resources[resource_name] = freeze(json.load(resource_file))
+        except FileNotFoundError:
+            continue
+        signatures[resource_name] = file_signature
+
+    resources = types.MappingProxyType(resources)
+    with registry_lock:
+        registry[directory] = {'mtime': directory_mtime, 'resources': resources, 'signatures': signatures}
+    return resources
+
+def invalidate_directory(directory: str) -> None:
+    '''
+    Makes the next read of a directory check each of its files again, for when a file has been changed in place
+    '''
+    with registry_lock:
+        cached_directory = registry.get(os.path.abspath(directory))
+        if cached_directory is not None:
+            cached_directory['mtime'] = None
+
+def list_resources(directory: str) -> list:
+    return list(load_directory(directory))
+
+def get_resource(directory: str, resource_name: str) -> object:
+    '''
+    Frozen contents of a single resource file. Raises a FileNotFoundError when there is no such resource
+    '''
+    resources = load_directory(directory)
+    if resource_name not in resources:
+        raise FileNotFoundError(os.path.join(directory, resource_name))
+    return resources[resource_name]
+
+def get_schema(schema_name: str) -> object:
+    return get_resource(SCHEMA_DIRECTORY, f'{schema_name}.json')
+
+def save_resource(directory: str, resource_name: str, resource: object, stringified_resource: str = None, modified_at: float = None) -> None:
+    '''
+    Writes a resource file to a temporary file first and moves it into place, so that a concurrent reader never sees half of one and the directory is seen to have changed. The resource can be given already encoded as JSON, and the file can be given a modification time other than now
+    '''
+    if stringified_resource is None:
+        stringified_resource = json.dumps(resource)
+    os.makedirs(directory, exist_ok=True)
+    resource_path = os.path.join(directory, resource_name)
+    temporary_path = f'{resource_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as resource_file:
+        resource_file.write(stringified_resource)
+    if modified_at is not None:
+        os.utime(temporary_path, (modified_at, modified_at))
+    os.replace(temporary_path, resource_path)
+    invalidate_directory(directory)
+
+def delete_resource(directory: str, resource_name: str) -> None:
+    os.remove(os.path.join(directory, resource_name))
+    invalidate_directory(directory)
@@ -13,7 +13,7 @@ import requests
 from werkzeug.utils import secure_filename
 
 from __init__ import app, dynamodb
-import api, htmx_api, utils, errors
+import api, htmx_api, resource_registry, utils, errors
 from models import User
 from forms import TruckForm, TruckOpenGlassRackForm, TruckExteriorRackForm, RackForm, UploadForm
 from emails import send_creation_confirmation_email, send_password_reset_email
@@ -60,8 +60,7 @@ def configure_trucks():
         if selected_truck:
             truck_response = api.truck_api_get_truck(selected_truck)
             if request.args.get('edit_mode'):
-                with open('./schemas/truck_body_to_forms.json', 'r', encoding='utf-8') as f:
-                    schema_json = json.load(f)
+                schema_json = resource_registry.get_schema('truck_body_to_forms')
 
                 body_type_form = eval(f"{schema_json[truck_response['truck_body_type']]}()")
                 
@@ -199,7 +198,11 @@ def parse_manifest():
                 return redirect(request.url)
             if file and utils.allowed_file(file.filename):
                 filename = secure_filename(file.filename)
-                file.save(os.path.join(app.config['MANIFEST_PATH'], f"{filename.split('.')[0]}.csv"))
+                try:
+                    utils.save_manifest_upload(file.stream, filename.split('.')[0], file.filename.rsplit('.', 1)[1].lower())
+                except ValueError as error:
+                    flash(str(error), 'danger')
+                    return redirect(request.url)
                 return redirect(url_for('parse_manifest'))
             
         manifest_params = utils.get_manifest_params()
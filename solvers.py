@@ -0,0 +1,496 @@
+'''
+Plan solvers built on top of the greedy cargo placement in utils. Each placement strategy pairs an ordering of the prioritized manifest with a way of picking the rack for each line item, and every resulting plan is scored so that the best one can be kept.
+'''
+import collections
+import concurrent.futures
+import copy
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+import sparse_racks
+import utils
+
+# Relative importance of each part of a plan's score
+PLAN_SCORE_WEIGHTS = {
+    'placed_fraction': 0.55,
+    'side_balance': 0.15,
+    'axle_balance': 0.15,
+    'stop_accessibility': 0.15
+}
+
+# Share of the cargo weight that should ideally be carried by the rear axle
+TARGET_REAR_AXLE_SHARE = 0.5
+
+# Starting temperature of the annealing schedule used when improving a plan, in units of plan score
+INITIAL_ANNEALING_TEMPERATURE = 0.02
+
+def get_item_footprint_area(item: object) -> int:
+    '''
+    Grid area taken up on a rack by a single unit of the item
+    '''
+    return item['grid_volume']['horizontal']['length'] * item['grid_volume']['horizontal']['thickness']
+
+def iterate_racks(cargo_map: object):
+    '''
+    Yields a rack to place on for every rack of the cargo map, in sector, side and rack order
+    '''
+    for sector in cargo_map:
+        for side in cargo_map[sector]:
+            for rack_idx in range(len(cargo_map[sector][side]['racks'])):
+                yield {
+                    'sector': sector,
+                    'side': side,
+                    'rack_index': rack_idx,
+                    'orientation': None
+                }
+
+def get_fitting_racks(truck_details: object, cargo_map: object, line_item: object, placement_candidate_cache: object) -> list:
+    '''
+    Lists every rack that the line item currently fits on
+    '''
+    fitting_racks = []
+    for rack_to_place_on in iterate_racks(cargo_map):
+        rack_to_place_on['orientation'] = utils.get_item_orientation(truck_details, line_item, rack_to_place_on)
+        placement_coordinate_set = utils.get_cached_empty_space_for_placement(placement_candidate_cache, cargo_map, line_item, rack_to_place_on)
+        if utils.is_placement_found(placement_coordinate_set):
+            fitting_racks.append(rack_to_place_on)
+    return fitting_racks
+
+def get_rack(cargo_map: object, rack_to_place_on: object) -> object:
+    return cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['racks'][rack_to_place_on['rack_index']]
+
+def get_rack_free_cells(rack: object) -> int:
+    '''
+    Number of empty columns left on a rack, read from the corner of its occupancy index
+    '''
+    if rack['backend'] == 'sparse':
+        return sparse_racks.get_free_cells(rack)
+    return rack['map'].size - int(rack['index'][-1, -1])
+
+def select_first_fit_rack(truck_details: object, cargo_map: object, line_item: object, placement_candidate_cache: object, load_balance: object) -> object:
+    '''
+    Picks the first rack, in sector, side and rack order, that the line item fits on
+    '''
+    for rack_to_place_on in iterate_racks(cargo_map):
+        rack_to_place_on['orientation'] = utils.get_item_orientation(truck_details, line_item, rack_to_place_on)
+        placement_coordinate_set = utils.get_cached_empty_space_for_placement(placement_candidate_cache, cargo_map, line_item, rack_to_place_on)
+        if utils.is_placement_found(placement_coordinate_set):
+            return rack_to_place_on
+    return None
+
+def select_best_fit_rack(truck_details: object, cargo_map: object, line_item: object, placement_candidate_cache: object, load_balance: object) -> object:
+    '''
+    Picks the rack with the least free space left on it out of the racks that the line item fits on
+    '''
+    fitting_racks = get_fitting_racks(truck_details, cargo_map, line_item, placement_candidate_cache)
+    if not fitting_racks:
+        return None
+    return min(fitting_racks, key=lambda x: get_rack_free_cells(get_rack(cargo_map, x)))
+
+def make_stop_grouped_rack_selector() -> object:
+    '''
+    Creates a rack selector that keeps the cargo for each stop together. Items go onto a rack already holding cargo for the same stop when they fit, and otherwise onto the lightest rack they fit on
+    '''
+    racks_by_stop = {}
+
+    def select_stop_grouped_rack(truck_details: object, cargo_map: object, line_item: object, placement_candidate_cache: object, load_balance: object) -> object:
+        fitting_racks = get_fitting_racks(truck_details, cargo_map, line_item, placement_candidate_cache)
+        if not fitting_racks:
+            return None
+
+        stop_racks = racks_by_stop.setdefault(line_item['stop_number'], [])
+        for rack_to_place_on in fitting_racks:
+            if (rack_to_place_on['sector'], rack_to_place_on['side'], rack_to_place_on['rack_index']) in stop_racks:
+                return rack_to_place_on
+
+        lightest_rack = min(fitting_racks, key=lambda x: get_rack(cargo_map, x)['weight'])
+        stop_racks.append((lightest_rack['sector'], lightest_rack['side'], lightest_rack['rack_index']))
+        return lightest_rack
+
+    return select_stop_grouped_rack
+
+def get_load_imbalance(load_balance: object, weight: float, rack_to_place_on: object, placement_coordinate_set: object) -> float:
+    '''
+    How far the load would be from balanced with cargo of the given weight added at a footprint, without adding it. This is the distance of the rear axle from its target share of the weight, plus the distance of the center of gravity from the centerline as a share of the distance out to the exterior racks
+    '''
+    longitudinal_position, lateral_position = utils.get_placement_position(placement_coordinate_set, rack_to_place_on, load_balance['rack_offsets'])
+    total_weight = load_balance['total_weight'] + weight
+    if not total_weight:
+        return 0
+
+    load_imbalance = abs(load_balance['lateral_moment'] + weight * lateral_position) / total_weight / utils.EXTERIOR_RACK_LATERAL_OFFSET
+    if load_balance['rear_axle_distance']:
+        rear_axle_share = (load_balance['longitudinal_moment'] + weight * longitudinal_position) / total_weight / load_balance['rear_axle_distance']
+        load_imbalance += abs(rear_axle_share - TARGET_REAR_AXLE_SHARE)
+    return load_imbalance
+
+def select_balanced_rack(truck_details: object, cargo_map: object, line_item: object, placement_candidate_cache: object, load_balance: object) -> object:
+    '''
+    Picks the rack, out of the racks that the line item fits on, that leaves the load best balanced between the axles and from side to side once the item is added
+    '''
+    balanced_rack = None
+    least_imbalance = None
+    for rack_to_place_on in get_fitting_racks(truck_details, cargo_map, line_item, placement_candidate_cache):
+        placement_coordinate_set = utils.get_cached_empty_space_for_placement(placement_candidate_cache, cargo_map, line_item, rack_to_place_on)
+        load_imbalance = get_load_imbalance(load_balance, line_item['weight'], rack_to_place_on, placement_coordinate_set)
+        if least_imbalance is None or load_imbalance < least_imbalance:
+            balanced_rack = rack_to_place_on
+            least_imbalance = load_imbalance
+    return balanced_rack
+
+def order_by_footprint_decreasing(manifest_details: list) -> list:
+    '''
+    Orders the units by descending footprint, keeping the units of each line item together
+    '''
+    return sorted(manifest_details, key=lambda x: (-get_item_footprint_area(x), x['item_id']))
+
+def order_by_last_stop_first(manifest_details: list) -> list:
+    '''
+    Orders the units so that the last stop is loaded first, putting the cargo for the earliest stops at the front of each rack
+    '''
+    return sorted(manifest_details, key=lambda x: -x['stop_number'])
+
+PLACEMENT_STRATEGIES = {
+    'least_weight': {
+        'order': None,
+        'rack_selector_factory': None
+    },
+    'first_fit_decreasing': {
+        'order': order_by_footprint_decreasing,
+        'rack_selector_factory': lambda: select_first_fit_rack
+    },
+    'best_fit': {
+        'order': order_by_footprint_decreasing,
+        'rack_selector_factory': lambda: select_best_fit_rack
+    },
+    'stop_grouped': {
+        'order': order_by_last_stop_first,
+        'rack_selector_factory': make_stop_grouped_rack_selector
+    },
+    'balanced': {
+        'order': None,
+        'rack_selector_factory': lambda: select_balanced_rack
+    }
+}
+
+def count_blocked_items(rack_items: list) -> int:
+    '''
+    Counts the units on a rack that have cargo for a later stop sitting in front of them
+    '''
+    if not rack_items:
+        return 0
+    stops = np.array([item['stop_number'] for item in rack_items])
+    length_starts = np.array([item['placement']['length_axis']['start_index'] for item in rack_items])
+    length_ends = np.array([item['placement']['length_axis']['end_index'] for item in rack_items])
+    depth_starts = np.array([item['placement']['depth_axis']['start_index'] for item in rack_items])
+    depth_ends = np.array([item['placement']['depth_axis']['end_index'] for item in rack_items])
+    blocking = (
+        (stops[None, :] > stops[:, None]) &
+        (depth_starts[None, :] >= depth_ends[:, None]) &
+        (length_starts[None, :] < length_ends[:, None]) &
+        (length_ends[None, :] > length_starts[:, None])
+    )
+    return int(blocking.any(axis=1).sum())
+
+def prepare_plan_score_state(truck_details: object, manifest_items: list, cargo_map: object) -> object:
+    '''
+    Collects the running totals that a plan's score is computed from. Keeping these around lets the score be updated as single units are taken off of or put onto racks, rather than being worked out from the whole plan again
+    '''
+    plan_score_state = {
+        'item_count': len(manifest_items),
+        'placed_count': 0,
+        'side_weights': {'left': 0, 'right': 0},
+        'load_balance': utils.prepare_load_balance(truck_details, manifest_items),
+        'items_by_rack': {},
+        'blocked_by_rack': {}
+    }
+    for sector in cargo_map:
+        for side in cargo_map[sector]:
+            plan_score_state['side_weights'][side] += cargo_map[sector][side]['weight']
+
+    for item in manifest_items:
+        if item.get('placement'):
+            placement = item['placement']
+            plan_score_state['placed_count'] += 1
+            plan_score_state['items_by_rack'].setdefault((placement['sector'], placement['side'], placement['rack_index']), []).append(item)
+    for rack_key, rack_items in plan_score_state['items_by_rack'].items():
+        plan_score_state['blocked_by_rack'][rack_key] = count_blocked_items(rack_items)
+    return plan_score_state
+
+def get_score_from_state(plan_score_state: object) -> object:
+    '''
+    Scores a plan between 0 and 1 on how much of the cargo was placed, how evenly the weight is spread left to right and between the axles, and how few units are blocked in by cargo for a later stop. The total is the weighted sum of those parts
+    '''
+    score = {
+        'placed_fraction': 1,
+        'side_balance': 1,
+        'axle_balance': 1,
+        'stop_accessibility': 1
+    }
+    if plan_score_state['item_count']:
+        score['placed_fraction'] = plan_score_state['placed_count'] / plan_score_state['item_count']
+
+    side_weights = plan_score_state['side_weights']
+    total_weight = side_weights['left'] + side_weights['right']
+    if total_weight:
+        score['side_balance'] = 1 - abs(side_weights['left'] - side_weights['right']) / total_weight
+
+    rear_axle_share = utils.get_rear_axle_share(plan_score_state['load_balance'])
+    if rear_axle_share is not None:
+        score['axle_balance'] = max(0, 1 - abs(rear_axle_share - TARGET_REAR_AXLE_SHARE) / max(TARGET_REAR_AXLE_SHARE, 1 - TARGET_REAR_AXLE_SHARE))
+
+    if plan_score_state['placed_count']:
+        score['stop_accessibility'] = 1 - sum(plan_score_state['blocked_by_rack'].values()) / plan_score_state['placed_count']
+
+    score['total'] = sum(PLAN_SCORE_WEIGHTS[part] * score[part] for part in PLAN_SCORE_WEIGHTS)
+    return score
+
+def score_shipment_plan(truck_details: object, manifest_items: list, cargo_map: object) -> object:
+    return get_score_from_state(prepare_plan_score_state(truck_details, manifest_items, cargo_map))
+
+def place_unit(cargo_map: object, plan_score_state: object, line_item: object, rack_to_place_on: object, placement_coordinate_set: object) -> None:
+    '''
+    Puts a single unit onto a rack at the given coordinates, updating the rack weights and the plan score state along with it
+    '''
+    utils.modify_cargo_array(cargo_map, line_item, rack_to_place_on, placement_coordinate_set)
+    utils.record_cargo_placement([line_item], rack_to_place_on, placement_coordinate_set)
+    cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['weight'] += line_item['weight']
+    get_rack(cargo_map, rack_to_place_on)['weight'] += line_item['weight']
+
+    rack_key = (rack_to_place_on['sector'], rack_to_place_on['side'], rack_to_place_on['rack_index'])
+    plan_score_state['placed_count'] += 1
+    utils.update_load_balance(plan_score_state['load_balance'], line_item['weight'], rack_to_place_on, placement_coordinate_set)
+    plan_score_state['side_weights'][rack_to_place_on['side']] += line_item['weight']
+    plan_score_state['items_by_rack'].setdefault(rack_key, []).append(line_item)
+    plan_score_state['blocked_by_rack'][rack_key] = count_blocked_items(plan_score_state['items_by_rack'][rack_key])
+
+def unplace_unit(cargo_map: object, plan_score_state: object, line_item: object) -> None:
+    '''
+    Takes a single placed unit back off of its rack, updating the rack weights and the plan score state along with it
+    '''
+    placement = line_item['placement']
+    rack_key = (placement['sector'], placement['side'], placement['rack_index'])
+    utils.clear_cargo_array(cargo_map, line_item)
+    cargo_map[placement['sector']][placement['side']]['weight'] -= line_item['weight']
+    get_rack(cargo_map, placement)['weight'] -= line_item['weight']
+
+    plan_score_state['placed_count'] -= 1
+    utils.update_load_balance(plan_score_state['load_balance'], line_item['weight'], placement, placement, removed=True)
+    plan_score_state['side_weights'][placement['side']] -= line_item['weight']
+    plan_score_state['items_by_rack'][rack_key].remove(line_item)
+    plan_score_state['blocked_by_rack'][rack_key] = count_blocked_items(plan_score_state['items_by_rack'][rack_key])
+    line_item['placement'] = None
+
+def get_allowed_orientations(truck_details: object, line_item: object, rack_to_place_on: object) -> list:
+    '''
+    Lists the orientations a unit can be stood up in on a rack. Standing the unit on its short edge is always allowed, as it is when placing cargo greedily, while standing it on its long edge needs the rack to be tall enough
+    '''
+    orientations = ['horizontal']
+    if utils.get_item_orientation(truck_details, line_item, rack_to_place_on) == 'vertical':
+        orientations.append('vertical')
+    return orientations
+
+def improve_placement(truck_details: object, placement_result: object, time_budget_ms: int, seed: int = None, movable_items: list = None) -> object:
+    '''
+    Keeps improving a placed plan with simulated annealing until the time budget runs out. Each move takes a random unit off of its rack, or picks an unplaced one, and puts it at the first free spot on a random rack in a random orientation, which changes both the rack the unit is on and where it falls in the loading order. Moves are applied and undone in place on the cargo map with the score updated incrementally, and the best plan seen is restored at the end
+
+    Only the movable items are moved when they are given, such as the units placed while updating a stored plan, and every other unit stays where it is
+    '''
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + time_budget_ms / 1000
+    cargo_map = placement_result['cargo_map']
+    manifest_items = placement_result['manifest_items']
+    if movable_items is None:
+        movable_items = manifest_items
+    if not movable_items:
+        return placement_result
+
+    plan_score_state = prepare_plan_score_state(truck_details, manifest_items, cargo_map)
+    current_total = get_score_from_state(plan_score_state)['total']
+    best_total = current_total
+    best_placements = [item['placement'] for item in manifest_items]
+    racks = list(iterate_racks(cargo_map))
+    optimizer_stats = {
+        'time_budget_ms': time_budget_ms,
+        'moves': 0,
+        'accepted_moves': 0,
+        'improvements': 0
+    }
+
+    while True:
+        remaining_fraction = (deadline - time.perf_counter()) * 1000 / time_budget_ms
+        if remaining_fraction <= 0:
+            break
+        optimizer_stats['moves'] += 1
+
+        line_item = rng.choice(movable_items)
+        previous_placement = line_item['placement']
+        rack_to_place_on = dict(rng.choice(racks))
+        rack_to_place_on['orientation'] = rng.choice(get_allowed_orientations(truck_details, line_item, rack_to_place_on))
+
+        if previous_placement is not None:
+            unplace_unit(cargo_map, plan_score_state, line_item)
+        placement_coordinate_set = utils.get_empty_space_for_placement(cargo_map, line_item, rack_to_place_on)
+        if not utils.is_placement_found(placement_coordinate_set):
+            if previous_placement is not None:
+                place_unit(cargo_map, plan_score_state, line_item, previous_placement, previous_placement)
+            continue
+        place_unit(cargo_map, plan_score_state, line_item, rack_to_place_on, placement_coordinate_set)
+
+        new_total = get_score_from_state(plan_score_state)['total']
+        temperature = INITIAL_ANNEALING_TEMPERATURE * remaining_fraction
+        if new_total >= current_total or rng.random() < math.exp((new_total - current_total) / temperature):
+            optimizer_stats['accepted_moves'] += 1
+            current_total = new_total
+            if current_total > best_total:
+                optimizer_stats['improvements'] += 1
+                best_total = current_total
+                best_placements = [item['placement'] for item in manifest_items]
+        else:
+            unplace_unit(cargo_map, plan_score_state, line_item)
+            if previous_placement is not None:
+                place_unit(cargo_map, plan_score_state, line_item, previous_placement, previous_placement)
+
+    # Move every unit that has drifted from the best plan back to where it was, clearing them all first so that they cannot collide with each other
+    drifted_items = [
+        (item, best_placement)
+        for item, best_placement in zip(manifest_items, best_placements)
+        if item['placement'] != best_placement
+    ]
+    for item, best_placement in drifted_items:
+        if item['placement'] is not None:
+            unplace_unit(cargo_map, plan_score_state, item)
+    for item, best_placement in drifted_items:
+        if best_placement is not None:
+            place_unit(cargo_map, plan_score_state, item, best_placement, best_placement)
+
+    placement_result['score'] = get_score_from_state(plan_score_state)
+    placement_result['load_balance'] = plan_score_state['load_balance']
+    placement_result['optimizer'] = optimizer_stats
+    return placement_result
+
+def rebuild_cargo_map(truck_details: object, manifest_items: list, cargo_count: int, rack_backend: str = 'dense') -> object:
+    '''
+    Puts every unit of a stored plan back onto a fresh cargo map at the spot it was recorded at, without searching for space
+    '''
+    cargo_map = utils.prepare_cargo_map_blank(truck_details, cargo_count, rack_backend)
+    for item in manifest_items:
+        placement = item['placement']
+        if placement is None:
+            continue
+        utils.modify_cargo_array(cargo_map, item, placement, placement)
+        cargo_map[placement['sector']][placement['side']]['weight'] += item['weight']
+        get_rack(cargo_map, placement)['weight'] += item['weight']
+    return cargo_map
+
+def replan_placement(previous_plan: object, manifest_diff: object, manifest_units: object, rack_backend: str = 'dense') -> object:
+    '''
+    Updates the placement of a stored plan for an edited manifest. The units of removed rows are dropped, the rows that were added are prioritized and placed into the space that is left, and every other unit keeps its spot. Units that did not fit in the stored plan are tried again ahead of the added rows, since removed rows may have made room for them. Changed rows are given as pairs of the key of the old row and the new row, and are handled as the old row being removed and the new one added. The previous plan is left as it was, and the truck details updated for the new manifest are returned with the placement
+    '''
+    # The kept units are placed again and their placements rewritten, so work on a copy rather than the caller's plan
+    previous_plan = copy.deepcopy(previous_plan)
+    truck_details = previous_plan['truck_details']
+    removed_row_keys = collections.Counter(manifest_diff['removed'])
+    added_rows = list(manifest_diff['added'])
+    for old_row_key, new_row in manifest_diff.get('changed', []):
+        removed_row_keys[old_row_key] += 1
+        added_rows.append(new_row)
+
+    # Drop whole line items for the removed rows, matching duplicate rows one for one
+    removed_item_ids = set()
+    for item in previous_plan['manifest_details']['items']:
+        if item['item_id'] not in removed_item_ids and removed_row_keys[item['row_key']] > 0:
+            removed_row_keys[item['row_key']] -= 1
+            removed_item_ids.add(item['item_id'])
+            truck_details['total_cargo_volume'] -= item['quantity'] * (item['length'] * item['width'] * item['thickness'])
+    kept_items = [item for item in previous_plan['manifest_details']['items'] if item['item_id'] not in removed_item_ids]
+    placed_items = [item for item in kept_items if item['placement'] is not None]
+    retried_items = [item for item in kept_items if item['placement'] is None]
+
+    for row in added_rows:
+        row.setdefault('row_key', utils.get_manifest_row_key(row))
+    utils.prepare_types(truck_details, added_rows)
+    utils.calculate_grid_volumes(added_rows, manifest_units)
+    for row in added_rows:
+        truck_details['total_cargo_volume'] += row['quantity'] * (row['length'] * row['width'] * row['thickness'])
+
+    # New line items and cargo are numbered on from the highest IDs of the previous plan so that existing cargo keeps its IDs
+    last_item_id = max((item['item_id'] for item in previous_plan['manifest_details']['items']), default=0)
+    last_cargo_id = max((item['cargo_id'] for item in previous_plan['manifest_details']['items']), default=0)
+    added_items = utils.prioritize_cargo(added_rows)
+    for item in added_items:
+        item['item_id'] += last_item_id
+        item['cargo_id'] += last_cargo_id
+
+    cargo_map = rebuild_cargo_map(truck_details, placed_items, last_cargo_id + len(added_items), rack_backend)
+    placement_candidate_cache = utils.prepare_placement_candidate_cache()
+    load_balance = utils.prepare_load_balance(truck_details, placed_items)
+    cargo_map = utils.place_cargo(truck_details, retried_items + added_items, cargo_map, placement_candidate_cache, load_balance=load_balance)
+
+    manifest_items = placed_items + retried_items + added_items
+    return {
+        'strategy': 'incremental',
+        'truck_details': truck_details,
+        'cargo_map': cargo_map,
+        'manifest_items': manifest_items,
+        'movable_items': retried_items + added_items,
+        'score': score_shipment_plan(truck_details, manifest_items, cargo_map),
+        'placement_stats': utils.get_placement_candidate_cache_stats(placement_candidate_cache),
+        'load_balance': load_balance,
+        'replan': {
+            'previous_plan_hash': previous_plan.get('plan_hash'),
+            'kept_units': len(placed_items),
+            'retried_units': len(retried_items),
+            'removed_units': len(previous_plan['manifest_details']['items']) - len(kept_items),
+            'added_units': len(added_items)
+        }
+    }
+
+def run_placement_strategy(strategy_name: str, truck_details: object, prioritized_manifest_details: list, rack_backend: str = 'dense') -> object:
+    '''
+    Places the cargo with a single strategy and scores the result. This is run inside the worker processes of the portfolio solver, so it builds its own cargo map blank rather than having one sent to it
+    '''
+    strategy = PLACEMENT_STRATEGIES[strategy_name]
+    manifest_items = prioritized_manifest_details
+    if strategy['order'] is not None:
+        manifest_items = strategy['order'](prioritized_manifest_details)
+    rack_selector = None
+    if strategy['rack_selector_factory'] is not None:
+        rack_selector = strategy['rack_selector_factory']()
+
+    placement_candidate_cache = utils.prepare_placement_candidate_cache()
+    load_balance = utils.prepare_load_balance(truck_details)
+    cargo_map_blank = utils.prepare_cargo_map_blank(truck_details, len(manifest_items), rack_backend)
+    cargo_map = utils.place_cargo(truck_details, manifest_items, cargo_map_blank, placement_candidate_cache, rack_selector, load_balance)
+
+    return {
+        'strategy': strategy_name,
+        'cargo_map': cargo_map,
+        'manifest_items': manifest_items,
+        'score': score_shipment_plan(truck_details, manifest_items, cargo_map),
+        'placement_stats': utils.get_placement_candidate_cache_stats(placement_candidate_cache),
+        'load_balance': load_balance
+    }
+
+def solve_portfolio(truck_details: object, prioritized_manifest_details: list, strategies: list = None, max_workers: int = None, rack_backend: str = 'dense') -> object:
+    '''
+    Runs several placement strategies concurrently in a process pool over the same prepared truck and manifest, and returns the result of the best scoring one
+    '''
+    if strategies is None:
+        strategies = list(PLACEMENT_STRATEGIES)
+    if max_workers is None:
+        max_workers = min(len(strategies), os.cpu_count() or 1)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(run_placement_strategy, strategy_name, truck_details, prioritized_manifest_details, rack_backend)
+            for strategy_name in strategies
+        ]
+        results = [future.result() for future in futures]
+
+    # Ties go to the earliest listed strategy so that the outcome does not depend on which worker finished first
+    return max(results, key=lambda x: x['score']['total'])
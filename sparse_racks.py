@@ -0,0 +1,101 @@
+'''
+Sparse rack backend. Rather than holding a dense plane of grid places, a sparse rack keeps the footprint of each placed unit as an axis-aligned box, indexed by its interval along the depth axis. Free space is found with an extreme-point search over the far edges of the placed boxes, and the dense map is only rasterized when a plan is flattened for display. This keeps memory down to a handful of numbers per unit when a rack holds a few large panels.
+'''
+import bisect
+
+import numpy as np
+
+def prepare_sparse_rack(grid_size_length_axis: int, grid_size_depth_axis: int, grid_size_height_axis: int, cargo_id_dtype: type) -> object:
+    '''
+    Creates an empty sparse rack. Placed boxes are stored as (depth start, depth end, length start, length end, cargo ID) tuples, sorted by where they start along the depth axis, with the starts also kept in their own list so that they can be bisected. The far depth edges of the boxes are kept sorted as well, since these are the only depths other than the back of the rack that the first free position can start at
+    '''
+    return {
+        'backend': 'sparse',
+        'weight': 0,
+        'version': 0,
+        'grid_size_length_axis': grid_size_length_axis,
+        'grid_size_depth_axis': grid_size_depth_axis,
+        'grid_size_height_axis': grid_size_height_axis,
+        'cargo_id_dtype': np.dtype(cargo_id_dtype).name,
+        'boxes': [],
+        'box_depth_starts': [],
+        'box_depth_ends': [],
+        'deepest_box': 0,
+        'filled_cells': 0
+    }
+
+def get_boxes_overlapping_depth(rack: object, depth_start: int, depth_end: int) -> list:
+    '''
+    Looks up the boxes whose interval along the depth axis overlaps [depth_start, depth_end). No box is deeper than the deepest one placed so far, so only the boxes starting within that distance of the interval need to be checked
+    '''
+    first_box = bisect.bisect_left(rack['box_depth_starts'], depth_start - rack['deepest_box'] + 1)
+    last_box = bisect.bisect_left(rack['box_depth_starts'], depth_end)
+    return [box for box in rack['boxes'][first_box:last_box] if box[1] > depth_start]
+
+def find_first_empty_offset(rack: object, length: int, thickness: int) -> tuple:
+    '''
+    Finds the first (length, depth) offset on a sparse rack, taken in depth-major order, where a footprint of the given size would not overlap any placed box. Returns None when there is no such offset
+
+    The first free offset can only be at the back of the rack or against the far depth edge of some box, as otherwise it could be moved further back. These extreme points are tried in order, and at each one the boxes overlapping the depth band of the footprint are swept along the length axis to find the first gap long enough to hold it. The offset found is the same one that a search of the dense grid would find
+    '''
+    last_length_offset = rack['grid_size_length_axis'] - length
+    last_depth_offset = rack['grid_size_depth_axis'] - thickness
+    if last_length_offset < 0 or last_depth_offset < 0:
+        return None
+
+    depth_candidates = [0] + rack['box_depth_ends'][:bisect.bisect_right(rack['box_depth_ends'], last_depth_offset)]
+    previous_depth = None
+    for depth_start in depth_candidates:
+        if depth_start == previous_depth:
+            continue
+        previous_depth = depth_start
+
+        length_cursor = 0
+        for length_start, length_end in sorted((box[2], box[3]) for box in get_boxes_overlapping_depth(rack, depth_start, depth_start + thickness)):
+            if length_start - length_cursor >= length:
+                break
+            length_cursor = max(length_cursor, length_end)
+        if length_cursor <= last_length_offset:
+            return length_cursor, depth_start
+    return None
+
+def add_box(rack: object, placement_coordinate_set: object, cargo_id: int) -> None:
+    box = (
+        placement_coordinate_set['depth_axis']['start_index'],
+        placement_coordinate_set['depth_axis']['end_index'],
+        placement_coordinate_set['length_axis']['start_index'],
+        placement_coordinate_set['length_axis']['end_index'],
+        cargo_id
+    )
+    box_idx = bisect.bisect_right(rack['box_depth_starts'], box[0])
+    rack['boxes'].insert(box_idx, box)
+    rack['box_depth_starts'].insert(box_idx, box[0])
+    bisect.insort(rack['box_depth_ends'], box[1])
+    rack['deepest_box'] = max(rack['deepest_box'], box[1] - box[0])
+    rack['filled_cells'] += (box[1] - box[0]) * (box[3] - box[2])
+
+def remove_box(rack: object, placement_coordinate_set: object, cargo_id: int) -> None:
+    '''
+    Takes the box of a placed unit back off of the rack. The deepest box is left as it was, which only widens the depth lookups a little until the rack is filled again
+    '''
+    depth_start = placement_coordinate_set['depth_axis']['start_index']
+    length_start = placement_coordinate_set['length_axis']['start_index']
+    box_idx = bisect.bisect_left(rack['box_depth_starts'], depth_start)
+    while rack['boxes'][box_idx][2] != length_start or rack['boxes'][box_idx][4] != cargo_id:
+        box_idx += 1
+    box = rack['boxes'].pop(box_idx)
+    rack['box_depth_starts'].pop(box_idx)
+    rack['box_depth_ends'].pop(bisect.bisect_left(rack['box_depth_ends'], box[1]))
+    rack['filled_cells'] -= (box[1] - box[0]) * (box[3] - box[2])
+
+def get_free_cells(rack: object) -> int:
+    return rack['grid_size_length_axis'] * rack['grid_size_depth_axis'] - rack['filled_cells']
+
+def rasterize_sparse_rack(rack: object) -> np.ndarray:
+    '''
+    Draws the boxes of a sparse rack onto a dense cargo ID plane, laid out the same way as the plane of a dense rack
+    '''
+    rack_map = np.zeros((rack['grid_size_length_axis'], rack['grid_size_depth_axis']), dtype=rack['cargo_id_dtype'])
+    for depth_start, depth_end, length_start, length_end, cargo_id in rack['boxes']:
+        rack_map[length_start:length_end, depth_start:depth_end] = cargo_id
+    return rack_map
@@ -0,0 +1,190 @@
+'''
+Streaming readers for spreadsheet manifests. Both XLSX and ODS files are zip archives of XML, so the first sheet of a workbook is read straight out of the archive with an incremental XML parser, handing back one row at a time as a list of text values and dropping each row from memory once it has been read. Only the shared string table of an XLSX workbook has to be held in full, since its rows refer back to it.
+'''
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+ODS_TABLE_NAMESPACE = 'urn:oasis:names:tc:opendocument:xmlns:table:1.0'
+ODS_OFFICE_NAMESPACE = 'urn:oasis:names:tc:opendocument:xmlns:office:1.0'
+ODS_TEXT_NAMESPACE = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'
+
+# Value types of ODS cells whose value is held in an attribute rather than written out as text
+ODS_VALUE_ATTRIBUTES = {
+    'float': 'value',
+    'percentage': 'value',
+    'currency': 'value',
+    'date': 'date-value',
+    'time': 'time-value',
+    'boolean': 'boolean-value'
+}
+
+def get_local_name(tag: str) -> str:
+    '''
+    Name of an XML tag without its namespace. XLSX files come with either the transitional or the strict namespaces, so their tags are matched on this alone
+    '''
+    return tag.rsplit('}', 1)[-1]
+
+def get_column_index(cell_reference: str) -> int:
+    '''
+    Position of a cell along its row from a reference such as 'AB12', counting from zero
+    '''
+    column_index = 0
+    for character in cell_reference:
+        if not character.isalpha():
+            break
+        column_index = column_index * 26 + ord(character.upper()) - ord('A') + 1
+    return column_index - 1
+
+def get_xlsx_text(element: object) -> str:
+    '''
+    Text of a shared or inline XLSX string, joining the runs of rich text and leaving out any phonetic guides
+    '''
+    text_parts = []
+    for child in element:
+        child_name = get_local_name(child.tag)
+        if child_name == 't':
+            text_parts.append(child.text or '')
+        elif child_name == 'r':
+            text_parts.extend(run_child.text or '' for run_child in child if get_local_name(run_child.tag) == 't')
+    return ''.join(text_parts)
+
+def read_xlsx_shared_strings(workbook: zipfile.ZipFile) -> list:
+    if 'xl/sharedStrings.xml' not in workbook.namelist():
+        return []
+
+    shared_strings = []
+    with workbook.open('xl/sharedStrings.xml') as shared_strings_file:
+        for _, element in ET.iterparse(shared_strings_file):
+            if get_local_name(element.tag) == 'si':
+                shared_strings.append(get_xlsx_text(element))
+                element.clear()
+    return shared_strings
+
+def get_xlsx_first_sheet_path(workbook: zipfile.ZipFile) -> str:
+    '''
+    Path within the archive of the first sheet of an XLSX workbook, following the workbook relationships from the sheet listed first
+    '''
+    workbook_root = ET.fromstring(workbook.read('xl/workbook.xml'))
+    # These are read inside of a generator, where a StopIteration would be turned into a RuntimeError, so a missing sheet is raised as a KeyError instead
+    first_sheet = next((element for element in workbook_root.iter() if get_local_name(element.tag) == 'sheet'), None)
+    if first_sheet is None:
+        raise KeyError('The workbook has no sheets')
+    relationship_id = next((value for name, value in first_sheet.attrib.items() if get_local_name(name) == 'id'), None)
+    if relationship_id is None:
+        raise KeyError('The first sheet of the workbook has no relationship id')
+
+    relationships_root = ET.fromstring(workbook.read('xl/_rels/workbook.xml.rels'))
+    for relationship in relationships_root:
+        if relationship.get('Id') == relationship_id:
+            target = relationship.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return posixpath.normpath(posixpath.join('xl', target))
+    raise KeyError(relationship_id)
+
+def get_xlsx_cell_value(cell: object, shared_strings: list, namespace: str) -> str:
+    cell_type = cell.get('t', 'n')
+    if cell_type == 'inlineStr':
+        inline_string = cell.find(f'{namespace}is')
+        return get_xlsx_text(inline_string) if inline_string is not None else ''
+
+    value = cell.findtext(f'{namespace}v', '')
+    if cell_type == 's' and value:
+        return shared_strings[int(value)]
+    if cell_type == 'b' and value:
+        return 'TRUE' if value == '1' else 'FALSE'
+    return value
+
+def iterate_xlsx_rows(stream: object):
+    '''
+    Reads the first sheet of an XLSX workbook row by row. Cells that are left out of a row are filled in as blanks, so that every value lines up with its column
+    '''
+    with zipfile.ZipFile(stream) as workbook:
+        shared_strings = read_xlsx_shared_strings(workbook)
+        with workbook.open(get_xlsx_first_sheet_path(workbook)) as sheet_file:
+            open_elements = []
+            namespace = None
+            for event, element in ET.iterparse(sheet_file, events=('start', 'end')):
+                if event == 'start':
+                    if namespace is None:
+                        namespace = element.tag[:len(element.tag) - len(get_local_name(element.tag))]
+                    open_elements.append(element)
+                    continue
+                open_elements.pop()
+                if element.tag != f'{namespace}row':
+                    continue
+
+                row = []
+                for cell in element.iterfind(f'{namespace}c'):
+                    cell_reference = cell.get('r')
+                    if cell_reference:
+                        row.extend([''] * (get_column_index(cell_reference) - len(row)))
+                    row.append(get_xlsx_cell_value(cell, shared_strings, namespace))
+                yield row
+                open_elements[-1].remove(element)
+
+def get_ods_text(element: object) -> str:
+    '''
+    Text of an ODS paragraph, writing out the runs of spaces, tabs and line breaks that ODS stores as elements of their own
+    '''
+    text_parts = [element.text or '']
+    for child in element:
+        child_name = get_local_name(child.tag)
+        if child_name == 's':
+            text_parts.append(' ' * int(child.get(f'{{{ODS_TEXT_NAMESPACE}}}c', 1)))
+        elif child_name == 'tab':
+            text_parts.append('\t')
+        elif child_name == 'line-break':
+            text_parts.append('\n')
+        else:
+            text_parts.append(get_ods_text(child))
+        text_parts.append(child.tail or '')
+    return ''.join(text_parts)
+
+def get_ods_cell_value(cell: object) -> str:
+    value_type = cell.get(f'{{{ODS_OFFICE_NAMESPACE}}}value-type')
+    if value_type in ODS_VALUE_ATTRIBUTES:
+        value = cell.get(f'{{{ODS_OFFICE_NAMESPACE}}}{ODS_VALUE_ATTRIBUTES[value_type]}')
+        if value is not None:
+            return value
+    return '\n'.join(get_ods_text(paragraph) for paragraph in cell if get_local_name(paragraph.tag) == 'p')
+
+def iterate_ods_rows(stream: object):
+    '''
+    Reads the first sheet of an ODS spreadsheet row by row. Repeated cells and rows are written out in full, except for blank ones, which spreadsheets often repeat out to the edge of the sheet and which are only filled in when a value follows them
+    '''
+    row_tag = f'{{{ODS_TABLE_NAMESPACE}}}table-row'
+    cell_tags = (f'{{{ODS_TABLE_NAMESPACE}}}table-cell', f'{{{ODS_TABLE_NAMESPACE}}}covered-table-cell')
+    rows_repeated_attribute = f'{{{ODS_TABLE_NAMESPACE}}}number-rows-repeated'
+    columns_repeated_attribute = f'{{{ODS_TABLE_NAMESPACE}}}number-columns-repeated'
+
+    with zipfile.ZipFile(stream) as spreadsheet:
+        with spreadsheet.open('content.xml') as content_file:
+            open_elements = []
+            for event, element in ET.iterparse(content_file, events=('start', 'end')):
+                if event == 'start':
+                    open_elements.append(element)
+                    continue
+                open_elements.pop()
+                if element.tag == f'{{{ODS_TABLE_NAMESPACE}}}table':
+                    return
+                if element.tag != row_tag:
+                    continue
+
+                row = []
+                blank_cells = 0
+                for cell in element:
+                    if cell.tag not in cell_tags:
+                        continue
+                    repeat_count = int(cell.get(columns_repeated_attribute, 1))
+                    value = get_ods_cell_value(cell)
+                    if value:
+                        row.extend([''] * blank_cells + [value] * repeat_count)
+                        blank_cells = 0
+                    else:
+                        blank_cells += repeat_count
+                if row:
+                    for _ in range(int(element.get(rows_repeated_attribute, 1))):
+                        yield list(row)
+                open_elements[-1].remove(element)
@@ -0,0 +1,298 @@
+'''
+Storage for the trucks, racks and shipment plans of the application. Every object is stored by name within its collection through the same few functions, whichever backend holds it:
+
+    file    one JSON file per object in the resources directories, as the application has always stored them
+    sqlite  a single SQLite database in WAL mode, indexed by name, owner and creation date, so that listing and filtering stay quick as plans pile up and several workers can write at once
+
+The backend is chosen with STORAGE_BACKEND in the app config, and objects can be copied from one backend to the other with migrate_storage.py.
+'''
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import resource_registry
+
+APP_CONFIG_PATH = './config/app_config.json'
+
+# Directory that each collection is kept in by the file backend
+STORAGE_COLLECTIONS = {
+    'trucks': resource_registry.TRUCK_DIRECTORY,
+    'racks': resource_registry.RACK_DIRECTORY,
+    'plans': './resources/plans/shipments'
+}
+
+# Collections that are small and read on most requests, which the file backend serves from the resource registry rather than reading from disk each time
+REGISTRY_COLLECTIONS = ('trucks', 'racks')
+
+DEFAULT_STORAGE_BACKEND = 'file'
+DEFAULT_STORAGE_DATABASE_PATH = './resources/freight_helper.sqlite3'
+
+# Time in seconds that a write waits for another worker's write to finish before giving up
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    collection TEXT NOT NULL,
+    name TEXT NOT NULL,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (collection, name)
+);
+CREATE INDEX IF NOT EXISTS objects_owner ON objects (collection, owner, name);
+CREATE INDEX IF NOT EXISTS objects_created_at ON objects (collection, created_at);
+'''
+
+# SQLite connections cannot be shared between threads or carried across a fork, so each thread of each process opens its own
+sqlite_connections = threading.local()
+
+class ObjectNotFoundError(FileNotFoundError):
+    '''
+    Raised when a collection holds no object by the name asked for
+    '''
+
+@functools.lru_cache(maxsize=None)
+def get_storage_settings() -> object:
+    '''
+    Backend and database path set in the app config, falling back on the file backend when the config does not name one
+    '''
+    try:
+        with open(APP_CONFIG_PATH, 'r', encoding='utf-8') as config_file:
+            app_config = json.load(config_file)
+    except FileNotFoundError:
+        app_config = {}
+    return {
+        'backend': app_config.get('STORAGE_BACKEND', DEFAULT_STORAGE_BACKEND),
+        'database_path': app_config.get('STORAGE_DATABASE_PATH', DEFAULT_STORAGE_DATABASE_PATH)
+    }
+
+def check_collection(collection: str) -> None:
+    if collection not in STORAGE_COLLECTIONS:
+        raise ValueError(f"Unknown storage collection '{collection}', expected one of {', '.join(STORAGE_COLLECTIONS)}")
+
+def get_object_path(collection: str, name: str) -> str:
+    '''
+    Path of an object in the file backend. Names are used as file names, so a name that would reach outside of the collection directory is refused
+    '''
+    if not name or name in ('.', '..') or '/' in name or '\\' in name or name.startswith('.'):
+        raise ValueError(f"'{name}' cannot be used as the name of a stored object")
+    return os.path.join(STORAGE_COLLECTIONS[collection], name)
+
+def matches_filters(owner: str, created_at: float, filters: object) -> bool:
+    if filters.get('owner') is not None and owner != filters['owner']:
+        return False
+    if filters.get('created_after') is not None and created_at < filters['created_after']:
+        return False
+    if filters.get('created_before') is not None and created_at >= filters['created_before']:
+        return False
+    return True
+
+def file_list_objects(collection: str, filters: object) -> list:
+    '''
+    Names of the objects in a collection directory. Filtering on owner has to read every object, since the file backend keeps no index, and the creation date of an object is taken from the modification time of its file
+    '''
+    directory = STORAGE_COLLECTIONS[collection]
+    if collection in REGISTRY_COLLECTIONS:
+        names = resource_registry.list_resources(directory)
+    else:
+        try:
+            names = sorted(
+                name for name in os.listdir(directory)
+                if not name.startswith('.') and not name.endswith('.tmp')
+            )
+        except FileNotFoundError:
+            return []
+    if not any(value is not None for value in filters.values()):
+        return names
+
+    matching_names = []
+    for name in names:
+        try:
+            created_at = os.stat(os.path.join(directory, name)).st_mtime
+            owner = file_get_object(collection, name).get('owner') if filters.get('owner') is not None else None
+        except FileNotFoundError:
+            continue
+        if matches_filters(owner, created_at, filters):
+            matching_names.append(name)
+    return matching_names
+
+def file_get_object(collection: str, name: str) -> object:
+    if collection in REGISTRY_COLLECTIONS:
+        try:
+            return resource_registry.thaw(resource_registry.get_resource(STORAGE_COLLECTIONS[collection], name))
+        except FileNotFoundError as error:
+            raise ObjectNotFoundError(f'No {collection} object named {name!r}') from error
+    try:
+        with open(get_object_path(collection, name), 'r', encoding='utf-8') as object_file:
+            return json.load(object_file)
+    except FileNotFoundError as error:
+        raise ObjectNotFoundError(f'No {collection} object named {name!r}') from error
+
+def file_get_metadata(collection: str, name: str) -> object:
+    '''
+    Owner and creation date of an object. The file backend keeps no record of either, so the owner is read from the object's own 'owner' field and the creation date is the modification time of its file
+    '''
+    stored_object = file_get_object(collection, name)
+    return {
+        'owner': stored_object.get('owner') if isinstance(stored_object, dict) else None,
+        'created_at': os.stat(get_object_path(collection, name)).st_mtime
+    }
+
+def file_save_object(collection: str, name: str, stringified_object: str, owner: str, created_at: float = None) -> None:
+    '''
+    Writes an object through the resource registry, which moves it into place whole so that a concurrent reader never sees half of one. A creation date is kept as the modification time of the file
+    '''
+    get_object_path(collection, name)
+    resource_registry.save_resource(STORAGE_COLLECTIONS[collection], name, None, stringified_resource=stringified_object, modified_at=created_at)
+
+def file_delete_object(collection: str, name: str) -> None:
+    get_object_path(collection, name)
+    try:
+        resource_registry.delete_resource(STORAGE_COLLECTIONS[collection], name)
+    except FileNotFoundError as error:
+        raise ObjectNotFoundError(f'No {collection} object named {name!r}') from error
+
+def get_sqlite_connection(database_path: str = None) -> sqlite3.Connection:
+    '''
+    Connection to the storage database for the current thread, creating the database on first use. The database is put in WAL mode, so that readers are never blocked by a writer and writers from several workers queue up rather than fail
+    '''
+    if database_path is None:
+        database_path = get_storage_settings()['database_path']
+    connection_key = (os.getpid(), os.path.abspath(database_path))
+    connections = getattr(sqlite_connections, 'connections', None)
+    if connections is None:
+        connections = sqlite_connections.connections = {}
+    if connection_key in connections:
+        return connections[connection_key]
+
+    os.makedirs(os.path.dirname(os.path.abspath(database_path)), exist_ok=True)
+    connection = sqlite3.connect(database_path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SQLITE_SCHEMA)
+    connections[connection_key] = connection
+    return connection
+
+def sqlite_list_objects(collection: str, filters: object) -> list:
+    query = 'SELECT name FROM objects WHERE collection = ?'
+    parameters = [collection]
+    if filters.get('owner') is not None:
+        query += ' AND owner = ?'
+        parameters.append(filters['owner'])
+    if filters.get('created_after') is not None:
+        query += ' AND created_at >= ?'
+        parameters.append(filters['created_after'])
+    if filters.get('created_before') is not None:
+        query += ' AND created_at < ?'
+        parameters.append(filters['created_before'])
+    query += ' ORDER BY name'
+    return [name for name, in get_sqlite_connection().execute(query, parameters)]
+
+def sqlite_get_object(collection: str, name: str) -> object:
+    stored_row = get_sqlite_connection().execute(
+        'SELECT body FROM objects WHERE collection = ? AND name = ?',
+        (collection, name)
+    ).fetchone()
+    if stored_row is None:
+        raise ObjectNotFoundError(f'No {collection} object named {name!r}')
+    return json.loads(stored_row[0])
+
+def sqlite_get_metadata(collection: str, name: str) -> object:
+    stored_row = get_sqlite_connection().execute(
+        'SELECT owner, created_at FROM objects WHERE collection = ? AND name = ?',
+        (collection, name)
+    ).fetchone()
+    if stored_row is None:
+        raise ObjectNotFoundError(f'No {collection} object named {name!r}')
+    return {'owner': stored_row[0], 'created_at': stored_row[1]}
+
+def sqlite_save_object(collection: str, name: str, stringified_object: str, owner: str, created_at: float = None) -> None:
+    '''
+    Inserts or replaces an object, keeping the date it was first created and its owner unless a new owner is given
+    '''
+    saved_at = time.time()
+    connection = get_sqlite_connection()
+    with connection:
+        connection.execute(
+            '''
+            INSERT INTO objects (collection, name, owner, created_at, updated_at, body) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (collection, name) DO UPDATE SET
+                owner = COALESCE(excluded.owner, objects.owner),
+                updated_at = excluded.updated_at,
+                body = excluded.body
+            ''',
+            (collection, name, owner, saved_at if created_at is None else created_at, saved_at, stringified_object)
+        )
+
+def sqlite_delete_object(collection: str, name: str) -> None:
+    connection = get_sqlite_connection()
+    with connection:
+        deleted_count = connection.execute(
+            'DELETE FROM objects WHERE collection = ? AND name = ?',
+            (collection, name)
+        ).rowcount
+    if deleted_count == 0:
+        raise ObjectNotFoundError(f'No {collection} object named {name!r}')
+
+STORAGE_BACKENDS = {
+    'file': {
+        'list': file_list_objects,
+        'get': file_get_object,
+        'get_metadata': file_get_metadata,
+        'save': file_save_object,
+        'delete': file_delete_object
+    },
+    'sqlite': {
+        'list': sqlite_list_objects,
+        'get': sqlite_get_object,
+        'get_metadata': sqlite_get_metadata,
+        'save': sqlite_save_object,
+        'delete': sqlite_delete_object
+    }
+}
+
+def get_backend(backend_name: str = None) -> object:
+    if backend_name is None:
+        backend_name = get_storage_settings()['backend']
+    if backend_name not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend_name}', expected one of {', '.join(STORAGE_BACKENDS)}")
+    return STORAGE_BACKENDS[backend_name]
+
+def list_objects(collection: str, owner: str = None, created_after: float = None, created_before: float = None, backend_name: str = None) -> list:
+    '''
+    Names of the objects in a collection, in order, optionally only those with the given owner or created within the given range of Unix times
+    '''
+    check_collection(collection)
+    filters = {'owner': owner, 'created_after': created_after, 'created_before': created_before}
+    return get_backend(backend_name)['list'](collection, filters)
+
+def get_object(collection: str, name: str, backend_name: str = None) -> object:
+    '''
+    A stored object, as a fresh copy that the caller is free to change. Raises an ObjectNotFoundError, which is a FileNotFoundError, when there is no such object
+    '''
+    check_collection(collection)
+    return get_backend(backend_name)['get'](collection, name)
+
+def get_object_metadata(collection: str, name: str, backend_name: str = None) -> object:
+    '''
+    Owner and creation date, as a Unix time, of a stored object
+    '''
+    check_collection(collection)
+    return get_backend(backend_name)['get_metadata'](collection, name)
+
+def save_object(collection: str, name: str, stored_object: object, owner: str = None, stringified_object: str = None, created_at: float = None, backend_name: str = None) -> None:
+    '''
+    Stores an object under a name, replacing any object already stored under it. The object can be given already encoded as JSON to save encoding it again. The creation date is only given when copying an object from elsewhere, and is otherwise the time the object was first saved
+    '''
+    check_collection(collection)
+    if stringified_object is None:
+        stringified_object = json.dumps(stored_object)
+    get_backend(backend_name)['save'](collection, name, stringified_object, owner, created_at)
+
+def delete_object(collection: str, name: str, backend_name: str = None) -> None:
+    check_collection(collection)
+    get_backend(backend_name)['delete'](collection, name)
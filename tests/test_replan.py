@@ -0,0 +1,75 @@
+'''
+Checks that updating a stored shipment plan for an edited manifest leaves the rest of the cargo where it was. Run from the root of the repository with:
+
+    python -m unittest discover tests
+'''
+import copy
+import json
+import os
+import sys
+import unittest
+
+# The application modules live in the root of the repository and read their resources from paths relative to it
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+
+import utils
+
+SAMPLE_TRUCK = 'Toe Mater'
+SAMPLE_MANIFEST = 'W31_Manifest_20230922'
+
+class ReplanTest(unittest.TestCase):
+    def setUp(self):
+        self.working_directory = os.getcwd()
+        os.chdir(REPOSITORY_PATH)
+        with open(os.path.join('resources', 'trucks', SAMPLE_TRUCK), 'r', encoding='utf-8') as truck_file:
+            self.truck_details = json.load(truck_file)
+        self.manifest_details = utils.get_manifest_details(SAMPLE_MANIFEST)
+        self.manifest_units = utils.get_manifest_units(SAMPLE_MANIFEST)
+        # Stored plans are read back from JSON, so the previous plan is given to the replan in the same form
+        self.previous_plan = json.loads(json.dumps(utils.generate_shipment_plan(
+            copy.deepcopy(self.truck_details),
+            SAMPLE_MANIFEST,
+            copy.deepcopy(self.manifest_details),
+            self.manifest_units,
+            use_cache=False
+        )))
+
+    def tearDown(self):
+        os.chdir(self.working_directory)
+
+    def replan_with_edited_row(self, time_budget_ms: int) -> object:
+        edited_manifest_details = copy.deepcopy(self.manifest_details)
+        edited_manifest_details[0]['quantity'] = str(int(float(edited_manifest_details[0]['quantity'])) + 1)
+        return utils.generate_shipment_plan(
+            copy.deepcopy(self.truck_details),
+            SAMPLE_MANIFEST,
+            edited_manifest_details,
+            self.manifest_units,
+            time_budget_ms=time_budget_ms,
+            use_cache=False,
+            previous_plan=self.previous_plan
+        )
+
+    def test_kept_units_stay_in_place_with_time_budget(self):
+        previous_placements = {
+            item['cargo_id']: item['placement']
+            for item in self.previous_plan['manifest_details']['items']
+            if item['placement'] is not None
+        }
+        shipment_plan = self.replan_with_edited_row(time_budget_ms=100)
+
+        self.assertEqual(shipment_plan['solver']['strategy'], 'incremental')
+        kept_items = [item for item in shipment_plan['manifest_details']['items'] if item['cargo_id'] in previous_placements]
+        self.assertEqual(len(kept_items), shipment_plan['solver']['replan']['kept_units'])
+        self.assertGreater(len(kept_items), 0)
+        for item in kept_items:
+            self.assertEqual(item['placement'], previous_placements[item['cargo_id']])
+
+    def test_previous_plan_is_not_modified(self):
+        stringified_previous_plan = json.dumps(self.previous_plan, sort_keys=True)
+        self.replan_with_edited_row(time_budget_ms=100)
+        self.assertEqual(json.dumps(self.previous_plan, sort_keys=True), stringified_previous_plan)
+
+if __name__ == '__main__':
+    unittest.main()
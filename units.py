@@ -0,0 +1,91 @@
+'''
+Registry of the units that manifests and trucks are measured in. Every unit is defined by the kind of quantity it measures and its size relative to the standard unit for that kind, so that the factor between any two units of the same kind is worked out once and a whole column of values can be converted with a single multiply. Units can be referred to by their full names or by the abbreviations listed for them in the manifest parameter schema.
+'''
+import functools
+import threading
+
+import numpy as np
+
+import resource_registry
+
+# Size of each unit in the standard unit of its kind, which is inches, pounds and square feet
+UNIT_DEFINITIONS = {
+    'inches': ('dimension', 1.0),
+    'feet': ('dimension', 12.0),
+    'millimeters': ('dimension', 1 / 25.4),
+    'meters': ('dimension', 1000 / 25.4),
+    'pounds': ('mass', 1.0),
+    'kilograms': ('mass', 2.204),
+    'square feet': ('area', 1.0),
+    'square meters': ('area', 10.764)
+}
+
+# Aliases worked out from the manifest parameter schema, along with the frozen schema they were worked out from, so that they are only worked out again when the registry reads a changed schema
+unit_aliases_cache = {'manifest_params': None, 'unit_aliases': None}
+unit_aliases_cache_lock = threading.Lock()
+
+class UnitConversionError(ValueError):
+    '''
+    Raised when a value is given in a unit that is not known, or is to be converted between units that measure different kinds of quantity
+    '''
+
+def get_unit_aliases() -> dict:
+    '''
+    Lowercased names that each unit can be referred to by, mapped to its name in the unit definitions. These are the full names of the units along with the names and abbreviations offered for them on the manifest mapping form
+    '''
+    try:
+        manifest_params = resource_registry.get_schema('manifest_params')['manifest_parameters']
+    except FileNotFoundError:
+        manifest_params = ()
+
+    with unit_aliases_cache_lock:
+        if unit_aliases_cache['manifest_params'] is manifest_params:
+            return unit_aliases_cache['unit_aliases']
+
+    unit_aliases = {}
+    for param in manifest_params:
+        for unit_label, unit_abbreviation in (param['units'] or {}).items():
+            unit_name = unit_label.lower()
+            if unit_name in UNIT_DEFINITIONS:
+                unit_aliases[unit_abbreviation.lower()] = unit_name
+    # A full name always means its own unit, which lets get_unit_name look full names up without reading the schema
+    unit_aliases.update({unit_name: unit_name for unit_name in UNIT_DEFINITIONS})
+
+    with unit_aliases_cache_lock:
+        unit_aliases_cache['manifest_params'] = manifest_params
+        unit_aliases_cache['unit_aliases'] = unit_aliases
+    return unit_aliases
+
+def get_unit_name(unit: str) -> str:
+    '''
+    Name in the unit definitions of a unit given by any of its names. Full names are known without the schema, so only abbreviations have the schema checked for changes
+    '''
+    unit_key = str(unit).strip().lower()
+    if unit_key in UNIT_DEFINITIONS:
+        return unit_key
+    unit_name = get_unit_aliases().get(unit_key)
+    if unit_name is None:
+        raise UnitConversionError(f"Unknown unit '{unit}', expected one of {', '.join(sorted(get_unit_aliases()))}")
+    return unit_name
+
+def get_conversion_factor(from_unit: str, to_unit: str) -> float:
+    '''
+    Factor that values in one unit are multiplied by to give them in another
+    '''
+    return get_unit_name_conversion_factor(get_unit_name(from_unit), get_unit_name(to_unit))
+
+@functools.lru_cache(maxsize=None)
+def get_unit_name_conversion_factor(from_unit_name: str, to_unit_name: str) -> float:
+    from_kind, from_size = UNIT_DEFINITIONS[from_unit_name]
+    to_kind, to_size = UNIT_DEFINITIONS[to_unit_name]
+    if from_kind != to_kind:
+        raise UnitConversionError(f"Cannot convert from '{from_unit_name}', which is a unit of {from_kind}, to '{to_unit_name}', which is a unit of {to_kind}")
+    if from_size == to_size:
+        return 1.0
+    return from_size / to_size
+
+def convert_units(values: object, from_unit: str, to_unit: str) -> np.ndarray:
+    '''
+    Converts a whole column of values from one unit to another at once
+    '''
+    return np.asarray(values, dtype=np.float64) * get_conversion_factor(from_unit, to_unit)
@@ -1,8 +1,12 @@
 '''
 Utility functions for use with the freight helper tool.
 '''
+import collections
 import copy
 import csv
+import functools
+import heapq
+import hashlib
 import json
 import math
 import os
@@ -10,8 +14,17 @@ import random
 
 import numpy as np
 
+import manifest_dimensions
+import manifest_maps
+import manifest_store
+import manifest_validation
+import resource_registry
+import sparse_racks
+import storage
+import units
+
 # Allowed extensions for manifests
-ALLOWED_EXTENSIONS = {'csv', 'xslx', 'ods'}
+ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'ods'}
 
 # Set standard units for internal calculations
 STANDARD_CALCULATION_UNITS = {
@@ -20,69 +33,68 @@ STANDARD_CALCULATION_UNITS = {
     'area': 'square feet'
 }
 
+# Manifest parameters that can be read from the description of an item when they are not mapped to a column
+DESCRIPTION_DIMENSION_PARAMS = ('length', 'width', 'thickness')
+
+# Types that the values of each manifest parameter are cast to before planning
+MANIFEST_PARAM_TYPES = {
+    'stop_number': int,
+    'quantity': int,
+    'weight': float,
+    'square_footage': float,
+    'length': float,
+    'width': float,
+    'thickness': float
+}
+
 # Nearest inch factor precision
 GRID_PRECISION_FACTOR = 0.25
 
+# Size in inches of the cells of the coarse grid that the free-space search is narrowed down on before checking the fine grid
+COARSE_GRID_CELL_SIZE = 2
+COARSE_GRID_FACTOR = max(1, round(COARSE_GRID_CELL_SIZE / GRID_PRECISION_FACTOR))
+
+# Ways of representing the space on a rack while cargo is being placed. Both give the same plan, and differ only in how quickly they find space and how much memory they take up
+RACK_BACKENDS = ('dense', 'sparse')
+
+# Exterior racks hang off of the outside of the body walls, which are taken to be half of a standard 8 foot wide body out from the centerline of the truck, in inches. Interior racks stand on the centerline
+EXTERIOR_RACK_LATERAL_OFFSET = 48.0
+
+# Parts of a rack that are only used while placing cargo, and are left out of the flattened map of a plan
+FLATTENED_RACK_EXCLUDED_KEYS = (
+    'backend',
+    'occupancy',
+    'index',
+    'coarse_occupancy',
+    'grid_size_length_axis',
+    'grid_size_depth_axis',
+    'cargo_id_dtype',
+    'boxes',
+    'box_depth_starts',
+    'box_depth_ends',
+    'deepest_box',
+    'filled_cells'
+)
+
+# Version of the cargo placement logic, to be bumped whenever a change to it would give a different plan for the same inputs
+SOLVER_VERSION = 4
+
 def save_truck(truck_obj):
-    with open(f"./resources/trucks/{truck_obj['truck_name']}", 'w', encoding='utf-8') as truckfile:
-        truckfile.write(json.dumps(truck_obj))
+    storage.save_object('trucks', truck_obj['truck_name'], truck_obj, owner=truck_obj.get('owner'))
     return
 
 def delete_truck(truck_obj):
-    os.remove(f"./resources/trucks/{truck_obj['name']}")
+    storage.delete_object('trucks', truck_obj['name'])
     return
 
+def load_truck(truck_name: str) -> object:
+    return storage.get_object('trucks', truck_name)
+
 def unit_convert(from_unit: str, to_unit: str, val) -> float:
     '''
-    Takes an object key and converts the value of it from a specific unit to a specific unit
+    Takes an object key and converts the value of it from a specific unit to a specific unit. Raises a units.UnitConversionError, which is a ValueError, for a unit that is not known
     '''
-    from_unit = from_unit.lower()
-    to_unit = to_unit.lower()
-    val = float(val)
-
-    # Checking if the before and after units are the same
-    if from_unit == to_unit:
-        return val
-
-    # Converting linear dimensional units
-    if from_unit == 'inches' and to_unit == 'feet':
-        return val / 12
-    if from_unit == 'feet' and to_unit == 'inches':
-        return val * 12
-    
-    if from_unit == 'inches' and to_unit == 'millimeters':
-        return val * 25.4
-    if from_unit == 'millimeters' and to_unit == 'inches':
-        return val / 25.4
-    
-    if from_unit == 'inches' and to_unit == 'meters':
-        return val * 25.4 / 1000
-    if from_unit == 'meters' and to_unit == 'inches':
-        return val * 1000 / 25.4
-
-    if from_unit == 'feet' and to_unit == 'millimeters':
-        return val * 12 * 25.4
-    if from_unit == 'millimeters' and to_unit == 'feet':
-        return val / 25.4 / 12
-
-    if from_unit == 'feet' and to_unit == 'meters':
-        return val * 12 * 25.4 / 1000
-    if from_unit == 'meters' and to_unit == 'feet':
-        return val * 1000 / 25.4 / 12
-    
-    # Converting mass units
-    if from_unit == 'pounds' and to_unit == 'kilograms':
-        return val / 2.204
-    if from_unit == 'kilograms' and to_unit == 'pounds':
-        return val * 2.204
-
-    # Converting area units
-    if from_unit == 'square feet' and to_unit == 'square meters':
-        return val / 10.764
-    if from_unit == 'square meters' and to_unit == 'square feet':
-        return val * 10.764
-
-    raise ValueError
+    return float(val) * units.get_conversion_factor(from_unit, to_unit)
 
 def allowed_file(filename):
     '''
@@ -91,20 +103,19 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_manifest_params():
-    with open('./schemas/manifest_params.json', 'r', encoding='utf-8') as jsonfile:
-        manifest_params = json.load(jsonfile)['manifest_parameters']
-    return manifest_params
+    return resource_registry.get_schema('manifest_params')['manifest_parameters']
+
+def save_manifest_upload(manifest_stream: object, manifest_name: str, file_format: str = 'csv') -> object:
+    '''
+    Streams an uploaded CSV, XLSX or ODS manifest into the manifests directory as a normalized CSV, caching its columns on the way so that it is ready to be mapped without being read again
+    '''
+    return manifest_store.ingest_manifest_stream(manifest_stream, f'./resources/manifests/{manifest_name}.csv', file_format)
 
 def get_manifest_column_names(manifest_name):
-    manifest_column_names = []
-    with open(f'./resources/manifests/{manifest_name}.csv', 'r', encoding='utf-8', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            for column_name in row:
-                manifest_column_names.append(column_name)
-            break
-    
-    return manifest_column_names
+    manifest_columns = manifest_store.load_manifest_columns(f'./resources/manifests/{manifest_name}.csv')
+    if manifest_columns['row_count'] == 0:
+        return []
+    return list(manifest_columns['column_names'])
 
 def make_manifest_map(manifest_params):
     manifest_map = {}
@@ -116,24 +127,30 @@ def make_manifest_map(manifest_params):
     return manifest_map
 
 def check_if_manifest_mapped(manifest_name):
-    with open('./maps/manifest_maps.json', 'r', encoding='utf-8') as jsonfile:
-        manifest_maps = json.load(jsonfile)
-    if manifest_name in manifest_maps:
-        return True
-    return False
+    return manifest_maps.get_manifest_map(manifest_name) is not None
 
 def get_manifest_map(manifest_name):
-    with open('./maps/manifest_maps.json', 'r', encoding='utf-8') as jsonfile:
-        manifest_maps = json.load(jsonfile)
-    return manifest_maps[manifest_name]
+    manifest_map = manifest_maps.get_manifest_map(manifest_name)
+    if manifest_map is None:
+        raise KeyError(manifest_name)
+    return manifest_map
 
-def get_manifest_details(manifest_name):
-    manifest_details = []
-    with open(f'./resources/manifests/{manifest_name}.csv', 'r', encoding='utf-8', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            manifest_details.append(row)
-    return manifest_details
+def save_manifest_map(manifest_name: str, manifest_map: object) -> None:
+    '''
+    Saves the map of a manifest, filed under its column names as well so that manifests in the same format can be mapped the same way. Has to be called before the manifest is rewritten with the parameters as its columns
+    '''
+    manifest_columns = manifest_store.load_manifest_columns(f'./resources/manifests/{manifest_name}.csv')
+    manifest_maps.save_manifest_map(manifest_name, manifest_columns['column_names'], manifest_map)
+
+def find_manifest_map(manifest_column_names: list) -> object:
+    '''
+    Map of an earlier manifest with the same columns, for mapping a new manifest the same way, or None when there is none
+    '''
+    return manifest_maps.find_manifest_map(manifest_column_names)
+
+def get_manifest_details(manifest_name, manifest_path='./resources/manifests'):
+    manifest_columns = manifest_store.load_manifest_columns(f'{manifest_path}/{manifest_name}.csv')
+    return manifest_store.get_manifest_rows(manifest_columns)
 
 def format_manifest_form_data(formdata, row_to_delete=None):
     manifest_data_obj = {}
@@ -152,38 +169,121 @@ def format_manifest_form_data(formdata, row_to_delete=None):
 
     return formatted_data
 
-def analyze_manifest(manifest_name: str, manifest_map: object) -> list:
+def get_mapped_column(manifest_map: object, param_key: str) -> str:
+    '''
+    Column of the manifest that a parameter is mapped to, or None when it is left unmapped. Maps are either the saved kind, keyed straight to column names, or the kind made from the mapping form, which also hold the units of each column
     '''
-    Analyzes the selected manifest to determine the details for the shipment for later use in optimization.
+    mapped_column = manifest_map.get(param_key)
+    if isinstance(mapped_column, dict):
+        mapped_column = mapped_column.get('column')
+    if not mapped_column or mapped_column == 'NULL':
+        return None
+    return mapped_column
+
+def fill_dimensions_from_descriptions(manifest_details: list, manifest_columns: object, manifest_map: object, dimension_report: object = None) -> None:
+    '''
+    Fills in the length, width and thickness of every row where the manifest map leaves them unmapped, with the sizes given in the row's description. Parsed sizes are in inches and are converted to the units that the parameter is mapped with
+
+    When a dimension report is given, it is filled in with how many rows had all of their missing sizes found and the confidence of each row
+    '''
+    unmapped_keys = [param_key for param_key in DESCRIPTION_DIMENSION_PARAMS if get_mapped_column(manifest_map, param_key) is None]
+    description_column = get_mapped_column(manifest_map, 'description')
+    if not unmapped_keys or description_column not in manifest_columns['text_columns']:
+        return
+
+    parsed_dimensions = manifest_dimensions.extract_dimensions(manifest_columns['text_columns'][description_column])
+    found_rows = np.ones(manifest_columns['row_count'], dtype=bool)
+    for param_key in unmapped_keys:
+        param_units = manifest_map[param_key].get('units') if isinstance(manifest_map.get(param_key), dict) else None
+        param_values = parsed_dimensions[param_key]
+        if param_units:
+            param_values = units.convert_units(param_values, 'inches', param_units)
+        found_rows &= ~np.isnan(param_values)
+        for row_obj, value in zip(manifest_details, param_values.tolist()):
+            if not np.isnan(value):
+                row_obj[param_key] = np.format_float_positional(value, precision=4, trim='-')
+
+    if dimension_report is not None:
+        dimension_report['row_count'] = manifest_columns['row_count']
+        dimension_report['parsed_rows'] = int(np.count_nonzero(found_rows))
+        dimension_report['confidence'] = parsed_dimensions['confidence']
+
+def analyze_manifest(manifest_name: str, manifest_map: object, dimension_report: object = None) -> list:
+    '''
+    Analyzes the selected manifest to determine the details for the shipment for later use in optimization. Sizes that the manifest map leaves unmapped are filled in from the descriptions of the items where they can be found, and reported in the dimension report when one is given
     '''
     manifest_params = get_manifest_params()
     manifest_details = []
-    with open(f'./resources/manifests/{manifest_name}.csv', 'r', encoding='utf-8', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            row_obj = {}
-            for param in manifest_params:
-                row_obj[param['key']] = {}
-                if manifest_map[param['key']] == 'NULL':
-                    row_obj[param['key']] = None
-                try:
-                    row_obj[param['key']] = row[manifest_map[param['key']]['column']]
-                except KeyError:
-                    row_obj[param['key']] = None
-            manifest_details.append(row_obj)
+    manifest_columns = manifest_store.load_manifest_columns(f'./resources/manifests/{manifest_name}.csv')
+    for row in manifest_store.get_manifest_rows(manifest_columns):
+        row_obj = {}
+        for param in manifest_params:
+            mapped_column = get_mapped_column(manifest_map, param['key'])
+            row_obj[param['key']] = row.get(mapped_column) if mapped_column else None
+        manifest_details.append(row_obj)
+    fill_dimensions_from_descriptions(manifest_details, manifest_columns, manifest_map, dimension_report)
     return manifest_details
 
 def update_manifest(manifest_name: str, manifest_params: object, manifest_details: list) -> None:
+    '''
+    Writes out the rows of a manifest and brings its validation index up to date, checking again only the rows that differ from the version being replaced
+    '''
     manifest_fields = []
     for param in manifest_params:
         manifest_fields.append(param['key'])
-    with open(f'./resources/manifests/{manifest_name}.csv', 'w', encoding='utf-8', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=manifest_fields)
-        writer.writeheader()
-        for row in manifest_details:
-            writer.writerow(row)
+
+    csv_path = f'./resources/manifests/{manifest_name}.csv'
+    with manifest_store.lock_manifest(csv_path):
+        previous_validation_index = manifest_validation.read_validation_index(csv_path) if os.path.exists(csv_path) else None
+        previous_rows = get_manifest_details(manifest_name) if previous_validation_index else None
+
+        manifest_store.forget_manifest(csv_path)
+        manifest_store.discard_change_log(csv_path)
+        with open(csv_path, 'w', encoding='utf-8', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=manifest_fields)
+            writer.writeheader()
+            for row in manifest_details:
+                writer.writerow(row)
+
+        manifest_validation.update_validation_index(
+            csv_path,
+            [{field: row.get(field) for field in manifest_fields} for row in manifest_details],
+            previous_rows if previous_rows and list(previous_rows[0]) == manifest_fields else None,
+            previous_validation_index
+        )
     return
 
+def patch_manifest_row(manifest_name: str, row_idx: int, row_values: object) -> object:
+    '''
+    Sets some of the cells of a single manifest row, counted from zero, without writing out the rest of the manifest. Raises a ValueError for a row or column that the manifest does not have
+
+    Returns the row as it now is along with its problem cells and the problem cells of the whole manifest
+    '''
+    csv_path = f'./resources/manifests/{manifest_name}.csv'
+    with manifest_store.lock_manifest(csv_path):
+        previous_validation_index = manifest_validation.get_validation_index(csv_path)
+        manifest_columns = manifest_store.patch_manifest(csv_path, {'op': 'set', 'row': row_idx, 'values': row_values})
+        row = manifest_store.get_manifest_row(manifest_columns, row_idx)
+        validation_index = manifest_validation.patch_validation_index(csv_path, previous_validation_index, row_idx, row)
+    return {
+        'row': row,
+        'problems': validation_index['cells'].get(row_idx, {}),
+        'validation': validation_index['cells']
+    }
+
+def delete_manifest_row(manifest_name: str, row_idx: int) -> object:
+    '''
+    Deletes a single manifest row, counted from zero, moving the rows after it up by one
+
+    Returns the problem cells of the manifest as it now is
+    '''
+    csv_path = f'./resources/manifests/{manifest_name}.csv'
+    with manifest_store.lock_manifest(csv_path):
+        previous_validation_index = manifest_validation.get_validation_index(csv_path)
+        manifest_store.patch_manifest(csv_path, {'op': 'delete', 'row': row_idx})
+        validation_index = manifest_validation.patch_validation_index(csv_path, previous_validation_index, row_idx)
+    return validation_index['cells']
+
 def save_manifest_units(manifest_name: str, manifest_map: object) -> None:
     units_fields = []
     units_obj = {}
@@ -191,40 +291,37 @@ def save_manifest_units(manifest_name: str, manifest_map: object) -> None:
         if 'units' in manifest_map[param]:
             units_fields.append(param)
             units_obj[param] = manifest_map[param]['units']
+    manifest_store.forget_manifest(f'./resources/manifests/{manifest_name}-units.csv')
     with open(f'./resources/manifests/{manifest_name}-units.csv', 'w', encoding='utf-8', newline='') as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=units_fields)
         writer.writeheader()
         writer.writerow(units_obj)
     return
 
-def get_manifest_units(manifest_name: str) -> object:
-    with open(f'./resources/manifests/{manifest_name}-units.csv', 'r', encoding='utf-8', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            unit_map = row
-    return unit_map
+def get_manifest_units(manifest_name: str, manifest_path: str = './resources/manifests') -> object:
+    manifest_units_columns = manifest_store.load_manifest_columns(f'{manifest_path}/{manifest_name}-units.csv')
+    return manifest_store.get_manifest_rows(manifest_units_columns)[-1]
+
+def get_manifest_validation(manifest_name: str) -> object:
+    '''
+    Cells of a manifest that are missing or invalid, keyed by row number and then by column
+    '''
+    return manifest_validation.get_validation_index(f'./resources/manifests/{manifest_name}.csv')['cells']
 
 def check_for_complete_manifest_data(manifest_name: str) -> bool:
-    manifest_details = get_manifest_details(manifest_name)
-    incomplete_flag = False
-    for data_row in manifest_details:
-        for key in data_row:
-            if not data_row[key]:
-                incomplete_flag = True
-    return incomplete_flag
+    return bool(get_manifest_validation(manifest_name))
 
 def save_rack(rack_obj: object) -> None:
-    with open(f"./resources/racks/{rack_obj['name']}", 'w', encoding='utf-8') as rackfile:
-        rackfile.write(json.dumps(rack_obj))
+    storage.save_object('racks', rack_obj['name'], rack_obj, owner=rack_obj.get('owner'))
     return
 
 def delete_rack(rack_obj: object) -> None:
-    os.remove(f"./resources/racks/{rack_obj['name']}")
+    storage.delete_object('racks', rack_obj['name'])
     return
 
 def prepare_types(truck_details: object, manifest_details: list) -> None:
     '''
-    Ensures that all types are set properly for the truck details as well as the items in the manifest
+    Ensures that all types are set properly for the truck details as well as the items in the manifest. A manifest value that cannot be cast raises a ManifestValidationError, which is a ValueError, naming its row and parameter
     '''
     truck_details['distance_to_rear_axle'] = float(truck_details['distance_to_rear_axle'])
     truck_details['interior_rack_quantity'] = int(truck_details['interior_rack_quantity'])
@@ -238,38 +335,29 @@ def prepare_types(truck_details: object, manifest_details: list) -> None:
         rack['rack_depth'] = float(rack['rack_depth'])
         rack['rack_height'] = float(rack['rack_height'])
 
-    for item in manifest_details:
-        item['stop_number'] = int(item['stop_number'])
-        item['quantity'] = int(item['quantity'])
-        item['weight'] = float(item['weight'])
-        item['square_footage'] = float(item['square_footage'])
-        item['length'] = float(item['length'])
-        item['width'] = float(item['width'])
-        item['thickness'] = float(item['thickness'])
+    for item_idx, item in enumerate(manifest_details):
+        for param_key, param_type in MANIFEST_PARAM_TYPES.items():
+            try:
+                item[param_key] = param_type(item[param_key])
+            except (TypeError, ValueError) as error:
+                if item.get(param_key) in (None, ''):
+                    raise manifest_validation.ManifestValidationError(f"Row {item_idx + 1} of the manifest has no value for '{param_key}'") from error
+                expected_value = 'a whole number' if param_type is int else 'a number'
+                raise manifest_validation.ManifestValidationError(f"Row {item_idx + 1} of the manifest has '{item[param_key]}' for '{param_key}', which is not {expected_value}") from error
 
 def calculate_physical_space(truck_details: object, manifest_details: list, manifest_units: list) -> object:
+    # Rack sizes are always given in feet
+    feet_to_standard_factor = units.get_conversion_factor('feet', STANDARD_CALCULATION_UNITS['dimension'])
 
     truck_details['total_interior_rack_volume'] = 0
     for rack in truck_details['rack_info']['interior']:
-        rack['rack_length'] = unit_convert(
-            from_unit='feet',
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=rack['rack_length']
-        )
+        rack['rack_length'] = float(rack['rack_length']) * feet_to_standard_factor
         rack['grid_size_length_axis'] = math.floor(rack['rack_length'] / GRID_PRECISION_FACTOR)
 
-        rack['rack_depth'] = unit_convert(
-            from_unit='feet',
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=rack['rack_depth']
-        )
+        rack['rack_depth'] = float(rack['rack_depth']) * feet_to_standard_factor
         rack['grid_size_depth_axis'] = math.floor(rack['rack_depth'] / GRID_PRECISION_FACTOR)
 
-        rack['rack_height'] = unit_convert(
-            from_unit='feet',
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=rack['rack_height']
-        )
+        rack['rack_height'] = float(rack['rack_height']) * feet_to_standard_factor
         rack['grid_size_height_axis'] = math.floor(rack['rack_height'] / GRID_PRECISION_FACTOR)
 
         truck_details['total_interior_rack_volume'] += 2 * (
@@ -280,25 +368,13 @@ def calculate_physical_space(truck_details: object, manifest_details: list, mani
 
     truck_details['total_exterior_rack_volume'] = 0
     for rack in truck_details['rack_info']['exterior']:
-        rack['rack_length'] = unit_convert(
-            from_unit='feet',
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=rack['rack_length']
-        )
+        rack['rack_length'] = float(rack['rack_length']) * feet_to_standard_factor
         rack['grid_size_length_axis'] = math.floor(rack['rack_length'] / GRID_PRECISION_FACTOR)
 
-        rack['rack_depth'] = unit_convert(
-            from_unit='feet',
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=rack['rack_depth']
-        )
+        rack['rack_depth'] = float(rack['rack_depth']) * feet_to_standard_factor
         rack['grid_size_depth_axis'] = math.floor(rack['rack_depth'] / GRID_PRECISION_FACTOR)
 
-        rack['rack_height'] = unit_convert(
-            from_unit='feet',
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=rack['rack_height']
-        )
+        rack['rack_height'] = float(rack['rack_height']) * feet_to_standard_factor
         rack['grid_size_height_axis'] = math.floor(rack['rack_height'] / GRID_PRECISION_FACTOR)
 
         truck_details['total_exterior_rack_volume'] += 2 * (
@@ -307,42 +383,78 @@ def calculate_physical_space(truck_details: object, manifest_details: list, mani
             rack['rack_height']
         )
 
-    truck_details['total_cargo_volume'] = 0
-    for item in manifest_details:
-        item['length'] = unit_convert(
-            from_unit=manifest_units['length'],
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=item['length']
-        )
-        item['width'] = unit_convert(
-            from_unit=manifest_units['width'],
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=item['width']
-        )
-        item['thickness'] = unit_convert(
-            from_unit=manifest_units['thickness'],
-            to_unit=STANDARD_CALCULATION_UNITS['dimension'],
-            val=item['thickness']
-        )
+    calculate_grid_volumes(manifest_details, manifest_units)
+    truck_details['total_cargo_volume'] = sum(
+        item['quantity'] * (item['length'] * item['width'] * item['thickness'])
+        for item in manifest_details
+    )
+    return truck_details
 
-        primary_dimension = item['length'] if item['length'] >= item['width'] else item['width']
-        secondary_dimension = item['width'] if item['length'] >= item['width'] else item['length']
+def calculate_grid_volumes(items: list, manifest_units: object) -> None:
+    '''
+    Converts the dimensions of manifest items to the standard units and works out the grid space each one takes up when stood up in either orientation. Each dimension is converted for all of the items at once
+    '''
+    if not items:
+        return
+
+    dimensions = {}
+    for dimension in ('length', 'width', 'thickness'):
+        dimensions[dimension] = units.convert_units(
+            [item[dimension] for item in items],
+            from_unit=manifest_units[dimension],
+            to_unit=STANDARD_CALCULATION_UNITS['dimension']
+        )
+    primary_dimensions = np.maximum(dimensions['length'], dimensions['width'])
+    secondary_dimensions = np.minimum(dimensions['length'], dimensions['width'])
+
+    primary_grid_sizes = np.ceil(primary_dimensions / GRID_PRECISION_FACTOR).astype(np.int64).tolist()
+    secondary_grid_sizes = np.ceil(secondary_dimensions / GRID_PRECISION_FACTOR).astype(np.int64).tolist()
+    thickness_grid_sizes = np.ceil(dimensions['thickness'] / GRID_PRECISION_FACTOR).astype(np.int64).tolist()
+
+    for dimension in dimensions:
+        dimensions[dimension] = dimensions[dimension].tolist()
+    for item_idx, item in enumerate(items):
+        item['length'] = dimensions['length'][item_idx]
+        item['width'] = dimensions['width'][item_idx]
+        item['thickness'] = dimensions['thickness'][item_idx]
         item['grid_volume'] = {
             'horizontal': {
-                'length': math.ceil(primary_dimension / GRID_PRECISION_FACTOR),
-                'height': math.ceil(secondary_dimension / GRID_PRECISION_FACTOR),
-                'thickness': math.ceil(item['thickness'] / GRID_PRECISION_FACTOR)
+                'length': primary_grid_sizes[item_idx],
+                'height': secondary_grid_sizes[item_idx],
+                'thickness': thickness_grid_sizes[item_idx]
             },
             'vertical': {
-                'length': math.ceil(secondary_dimension / GRID_PRECISION_FACTOR),
-                'height': math.ceil(primary_dimension / GRID_PRECISION_FACTOR),
-                'thickness': math.ceil(item['thickness'] / GRID_PRECISION_FACTOR)
+                'length': secondary_grid_sizes[item_idx],
+                'height': primary_grid_sizes[item_idx],
+                'thickness': thickness_grid_sizes[item_idx]
             }
         }
 
-        item_volume = item['quantity'] * (item['length'] * item['width'] * item['thickness'])
-        truck_details['total_cargo_volume'] += item_volume
-    return truck_details
+def get_manifest_row_key(row: object) -> str:
+    '''
+    Identifies a manifest row by its content, so that the same row can be recognized between edits of the manifest. Values are compared as trimmed strings, the same way they are when hashing plan inputs
+    '''
+    canonical_row = {column: str(value).strip() for column, value in row.items() if column != 'row_key'}
+    return hashlib.sha1(json.dumps(canonical_row, sort_keys=True).encode('utf-8')).hexdigest()
+
+def diff_manifest_rows(previous_row_keys: list, manifest_details: list) -> object:
+    '''
+    Works out which rows were added to and removed from a manifest since a plan was made for it, matching rows by their content. Rows that appear more than once are matched up one for one
+    '''
+    unmatched_row_keys = collections.Counter(previous_row_keys)
+    manifest_diff = {
+        'added': [],
+        'removed': [],
+        'changed': []
+    }
+    for row in manifest_details:
+        row_key = get_manifest_row_key(row)
+        if unmatched_row_keys[row_key] > 0:
+            unmatched_row_keys[row_key] -= 1
+        else:
+            manifest_diff['added'].append(row)
+    manifest_diff['removed'] = list(unmatched_row_keys.elements())
+    return manifest_diff
 
 def prioritize_cargo(manifest_details: list) -> list:
     prioritized_manifest_details = []
@@ -359,6 +471,8 @@ def prioritize_cargo(manifest_details: list) -> list:
             sublist = []
         sublist.append(item)
         previous_stop_number = item['stop_number']
+    if sublist:
+        stop_number_sublists.append(sublist)
     
     # Sort each stop's sublist by descending weight and create new item entries based on the item quantity specification. Then assign a cargo ID value to each unique piece of cargo for tracking its placement.
     item_id = 1
@@ -401,26 +515,36 @@ def generate_color_palette(manifest_details: list) -> object:
         }
     return color_palette
 
-def prepare_cargo_map_blank(truck_details: object) -> object:
+def get_compact_uint_dtype(max_value: int) -> type:
+    '''
+    Picks the smallest unsigned integer type that can hold values up to the given maximum
     '''
-    The cargo map blank is created in such a way that all empty space is indicated by a '0' value. And nonzero values indicate the cargo ID of the item that is occupying that space. Numpy 3D arrays are used to map out the space on each of the racks. These arrays are set up in a sort of 'stacked' view, as if you were looking straight on towards the rack while placing a panel on there yourself. What this means, is that the depth axis of the rack grids represent the 'stacking' of the arrays, while the height axis represents the quantity of rows present in each of the 'stacks' and the length axis represents the number of columns. This representation looks similar to the following example:
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+def prepare_cargo_map_blank(truck_details: object, cargo_count: int = 0, rack_backend: str = 'dense') -> object:
+    '''
+    The cargo map blank is created in such a way that all empty space is indicated by a '0' value. And nonzero values indicate the cargo ID of the item that is occupying that space. Since every panel is stood up from the bottom of the rack, the space on each rack is tracked as a 2D plane rather than a full 3D grid. The 'map' plane holds the cargo ID occupying each (length, depth) column of the rack. Viewed as if you were looking straight down onto the rack, the length axis represents the rows and the depth axis represents the 'stacking' of panels against the rack. This representation looks similar to the following example:
 
     length  - 5 grid places
-    height  - 2 grid places
     depth   - 3 grid places
 
-    [[[0., 0., 0.],
-      [0., 0., 0.],
-      [0., 0., 0.],
-      [0., 0., 0.],
-      [0., 0., 0.]],    This 'stack', being the first one, would represent the bottom layer of the rack, with the top being the front of the truck
-        
-     [[0., 0., 0.],
-      [0., 0., 0.],
-      [0., 0., 0.],
-      [0., 0., 0.],
-      [0., 0., 0.]]]
+    [[0., 0., 0.],
+     [0., 0., 0.],
+     [0., 0., 0.],
+     [0., 0., 0.],
+     [0., 0., 0.]]      The first column of each row would represent the bottom layer of the stack against the rack, with the top row being the front of the truck
+
+    Cargo IDs are stored in a uint16 plane, or uint32 when the manifest holds more pieces of cargo than that can address. Alongside it, the 'occupancy' plane packs whether each column is filled into single bits along the depth axis, which lets the free-space search skip over the filled back of a rack eight depth layers at a time. The 'coarse_occupancy' plane counts the filled columns within each cell of the coarse grid, which the free-space search uses to rule out offsets before checking them on the fine grid.
+
+    With the 'sparse' rack backend, each rack instead holds a list of the boxes placed on it and is only drawn out as a plane when the map is flattened. See sparse_racks for how it finds space.
     '''
+    if rack_backend not in RACK_BACKENDS:
+        raise ValueError(f"Unknown rack backend '{rack_backend}'")
+    cargo_id_dtype = np.uint16 if cargo_count <= np.iinfo(np.uint16).max else np.uint32
+
     cargo_map_blank = {}
 
     for sector in truck_details['rack_info']:
@@ -436,32 +560,202 @@ def prepare_cargo_map_blank(truck_details: object) -> object:
         }
         for rack_definintion in truck_details['rack_info'][sector]:
             for side in cargo_map_blank[sector]:
+                if rack_backend == 'sparse':
+                    cargo_map_blank[sector][side]['racks'].append(
+                        sparse_racks.prepare_sparse_rack(
+                            rack_definintion['grid_size_length_axis'],
+                            rack_definintion['grid_size_depth_axis'],
+                            rack_definintion['grid_size_height_axis'],
+                            cargo_id_dtype
+                        )
+                    )
+                    continue
+                rack_map = np.zeros(
+                    (
+                        rack_definintion['grid_size_length_axis'],
+                        rack_definintion['grid_size_depth_axis']
+                    ),
+                    dtype=cargo_id_dtype
+                )
                 cargo_map_blank[sector][side]['racks'].append(
                     {
+                        'backend': 'dense',
                         'weight': 0,
-                        'map': np.zeros(
-                            (
-                                rack_definintion['grid_size_height_axis'],
-                                rack_definintion['grid_size_length_axis'],
-                                rack_definintion['grid_size_depth_axis']
-                            )
-                        )
+                        'version': 0,
+                        'grid_size_height_axis': rack_definintion['grid_size_height_axis'],
+                        'map': rack_map,
+                        'occupancy': np.packbits(rack_map != 0, axis=1),
+                        'index': build_occupancy_index(rack_map),
+                        'coarse_occupancy': build_coarse_occupancy(rack_map)
                     }
                 )
 
     return cargo_map_blank
 
-def get_empty_space_for_placement(cargo_map: object, line_item: object, rack_to_place_on: object) -> object:
-    def set_placement_coordinates_obj_values(placement_coordinates_obj: object, length_layer: int, depth_layer: int) -> None:
-        placement_coordinates_obj['length_axis']['start_index'] = length_layer
-        placement_coordinates_obj['length_axis']['end_index'] = line_item['grid_volume'][rack_to_place_on['orientation']]['length'] + length_layer
+def build_occupancy_index(rack_map: np.ndarray) -> np.ndarray:
+    '''
+    Builds the summed-area table (2D prefix sum) of occupied columns for a rack map. The index is padded with a leading row and column of zeros so that index[i, j] holds the count of occupied columns within rack_map[:i, :j]. This turns "is this footprint empty" into a lookup of four corners rather than a scan of the footprint itself
 
-        placement_coordinates_obj['height_axis']['start_index'] = 0
-        placement_coordinates_obj['height_axis']['end_index'] = line_item['grid_volume'][rack_to_place_on['orientation']]['height']
+    Counts are stored in the smallest unsigned type that can hold the area of the rack. Box sums taken from the table may wrap around in between, but always land back on the true count since it is within range of the type.
+    '''
+    occupancy_index = np.zeros(
+        tuple(axis_size + 1 for axis_size in rack_map.shape),
+        dtype=get_compact_uint_dtype(rack_map.size)
+    )
+    occupancy_index[1:, 1:] = (rack_map != 0).cumsum(axis=0).cumsum(axis=1)
+    return occupancy_index
+
+def update_occupancy_index(occupancy_index: np.ndarray, placement_coordinate_set: object, filled: bool = True) -> None:
+    '''
+    Incrementally adds a newly filled footprint to the summed-area table, or takes a newly cleared one out of it. Every prefix sum at or beyond the start of the footprint changes by the size of its overlap with the footprint, which is the outer product of a clipped ramp along each axis. Only the suffix region of the index is touched, so the table never has to be rebuilt from the rack map
+    '''
+    ramps = []
+    for axis_idx, axis in enumerate(('length_axis', 'depth_axis')):
+        start_index = placement_coordinate_set[axis]['start_index']
+        end_index = min(placement_coordinate_set[axis]['end_index'], occupancy_index.shape[axis_idx] - 1)
+        ramps.append(np.clip(np.arange(1, occupancy_index.shape[axis_idx] - start_index), 0, end_index - start_index))
+
+    overlap = np.outer(ramps[0], ramps[1]).astype(occupancy_index.dtype)
+    suffix = (
+        slice(placement_coordinate_set['length_axis']['start_index'] + 1, None),
+        slice(placement_coordinate_set['depth_axis']['start_index'] + 1, None)
+    )
+    if filled:
+        occupancy_index[suffix] += overlap
+    else:
+        occupancy_index[suffix] -= overlap
+
+def update_occupancy_bits(occupancy_bits: np.ndarray, placement_coordinate_set: object, depth_size: int, filled: bool = True) -> None:
+    '''
+    Marks a newly filled footprint in the bit-packed occupancy plane by OR-ing a packed mask of its depth range into each of its length rows, or unmarks a newly cleared one by AND-ing in the inverse of that mask
+    '''
+    depth_mask = np.zeros(depth_size, dtype=bool)
+    depth_mask[placement_coordinate_set['depth_axis']['start_index'] : placement_coordinate_set['depth_axis']['end_index']] = True
+    length_rows = slice(placement_coordinate_set['length_axis']['start_index'], placement_coordinate_set['length_axis']['end_index'])
+    if filled:
+        occupancy_bits[length_rows] |= np.packbits(depth_mask)
+    else:
+        occupancy_bits[length_rows] &= ~np.packbits(depth_mask)
+
+def build_coarse_occupancy(rack_map: np.ndarray) -> np.ndarray:
+    '''
+    Pools the occupied columns of a rack map onto the coarse grid by counting how many of them fall within each coarse cell. A coarse cell with a count of zero is empty, and one whose count matches its size is full. Cells along the far edges of the rack may be smaller than the rest when the rack is not a whole number of coarse cells long or deep
+    '''
+    coarse_shape = tuple(-(-axis_size // COARSE_GRID_FACTOR) for axis_size in rack_map.shape)
+    padded_occupancy = np.zeros(tuple(axis_size * COARSE_GRID_FACTOR for axis_size in coarse_shape), dtype=bool)
+    padded_occupancy[:rack_map.shape[0], :rack_map.shape[1]] = rack_map != 0
+    coarse_occupancy = padded_occupancy.reshape(coarse_shape[0], COARSE_GRID_FACTOR, coarse_shape[1], COARSE_GRID_FACTOR).sum(axis=(1, 3))
+    return coarse_occupancy.astype(get_compact_uint_dtype(COARSE_GRID_FACTOR ** 2))
+
+@functools.lru_cache(maxsize=None)
+def get_coarse_cell_sizes(rack_shape: tuple) -> np.ndarray:
+    '''
+    Number of fine grid columns within each coarse cell of a rack. The array returned is shared between every rack of the same shape, so it must not be modified
+    '''
+    cell_sizes = []
+    for axis_size in rack_shape:
+        cell_starts = np.arange(0, axis_size, COARSE_GRID_FACTOR)
+        cell_sizes.append(np.minimum(COARSE_GRID_FACTOR, axis_size - cell_starts))
+    return np.outer(*cell_sizes)
 
-        placement_coordinates_obj['depth_axis']['start_index'] = depth_layer
-        placement_coordinates_obj['depth_axis']['end_index'] = line_item['grid_volume'][rack_to_place_on['orientation']]['thickness'] + depth_layer
+def update_coarse_occupancy(coarse_occupancy: np.ndarray, placement_coordinate_set: object, filled: bool = True) -> None:
+    '''
+    Adds a newly filled footprint to the coarse occupancy counts, or takes a newly cleared one out of them. Each coarse cell touched by the footprint changes by the size of its overlap with the footprint, which is the outer product of the overlap along each axis
+    '''
+    overlaps = []
+    touched_cells = []
+    for axis in ('length_axis', 'depth_axis'):
+        start_index = placement_coordinate_set[axis]['start_index']
+        end_index = placement_coordinate_set[axis]['end_index']
+        first_cell = start_index // COARSE_GRID_FACTOR
+        last_cell = (end_index - 1) // COARSE_GRID_FACTOR
+        cell_starts = np.arange(first_cell, last_cell + 1) * COARSE_GRID_FACTOR
+        overlaps.append(np.minimum(end_index, cell_starts + COARSE_GRID_FACTOR) - np.maximum(start_index, cell_starts))
+        touched_cells.append(slice(first_cell, last_cell + 1))
+
+    overlap = np.outer(*overlaps).astype(coarse_occupancy.dtype)
+    if filled:
+        coarse_occupancy[tuple(touched_cells)] += overlap
+    else:
+        coarse_occupancy[tuple(touched_cells)] -= overlap
+
+def find_first_empty_offset(rack: object, length: int, thickness: int, search_depth_start: int = 0) -> tuple:
+    '''
+    Finds the first (length, depth) offset on a rack, taken in depth-major order, where a footprint of the given size would not overlap any placed cargo. Returns None when there is no such offset
 
+    The search is narrowed down on the coarse grid before anything is checked on the fine grid. Depth offsets are grouped into bands the width of a coarse cell, each band starting in the same coarse column, and a band is ruled out when the coarse grid shows that none of its offsets could be empty. That is, when at every length offset the footprint would either touch a coarse cell that is full, or wholly cover a coarse cell that is not empty. Neither rule can rule out an offset that is actually empty, so the offset found on the fine grid among the remaining bands is always the one that a search of the whole fine grid would find
+    '''
+    length_offsets = rack['map'].shape[0] - length + 1
+    last_depth_offset = rack['map'].shape[1] - thickness
+    if length_offsets <= 0 or last_depth_offset < search_depth_start:
+        return None
+
+    first_column = search_depth_start // COARSE_GRID_FACTOR
+    last_column = last_depth_offset // COARSE_GRID_FACTOR
+    band_columns = slice(first_column + 1, last_column + 2)
+    band_column_starts = slice(first_column, last_column + 1)
+
+    # Length offsets are taken a coarse row at a time. The offset at the start of each coarse row touches the fewest coarse rows, and the offsets after it wholly cover the coarse rows from the next one on
+    row_blocks = (length_offsets - 1) // COARSE_GRID_FACTOR + 1
+    fewest_touched_rows = (length - 1) // COARSE_GRID_FACTOR + 1
+    inner_row_count = (length - COARSE_GRID_FACTOR + 1) // COARSE_GRID_FACTOR
+    inner_column_count = thickness // COARSE_GRID_FACTOR - 1
+
+    # Running count of full coarse cells down each coarse column that a band starts in
+    coarse_full_index = build_occupancy_index(rack['coarse_occupancy'] == get_coarse_cell_sizes(rack['map'].shape))
+    full_cell_counts = coarse_full_index[:, band_columns] - coarse_full_index[:, band_column_starts]
+    possible_blocks = full_cell_counts[fewest_touched_rows:fewest_touched_rows + row_blocks] - full_cell_counts[:row_blocks] == 0
+
+    if inner_row_count > 0 and inner_column_count > 0:
+        coarse_occupied_index = build_occupancy_index(rack['coarse_occupancy'])
+        inner_row_offsets = coarse_occupied_index.shape[0] - inner_row_count
+        inner_column_ends = slice(first_column + 1 + inner_column_count, last_column + 2 + inner_column_count)
+        inner_cells_empty = np.zeros((row_blocks + 1, last_column - first_column + 1), dtype=bool)
+        inner_cells_empty[:inner_row_offsets] = (
+            coarse_occupied_index[inner_row_count:, inner_column_ends] -
+            coarse_occupied_index[:inner_row_offsets, inner_column_ends] -
+            coarse_occupied_index[inner_row_count:, band_columns] +
+            coarse_occupied_index[:inner_row_offsets, band_columns]
+        )[:row_blocks + 1] == 0
+        possible_blocks &= inner_cells_empty[:-1] | inner_cells_empty[1:]
+
+    candidate_bands = np.flatnonzero(possible_blocks.any(axis=0)).tolist()
+    if not candidate_bands:
+        return None
+
+    # Confirm on the fine grid. Racks fill from the back, so the first band left open by the coarse grid usually holds the offset and is checked on its own first. Should it not, the bands after it are checked together in one pass
+    for first_band, last_band in ((candidate_bands[0], candidate_bands[0]), (candidate_bands[0] + 1, candidate_bands[-1])):
+        if first_band > last_band:
+            break
+        band_start = max((first_column + first_band) * COARSE_GRID_FACTOR, search_depth_start)
+        band_end = min((first_column + last_band + 1) * COARSE_GRID_FACTOR, last_depth_offset + 1)
+        band_starts = slice(band_start, band_end)
+        band_ends = slice(band_start + thickness, band_end + thickness)
+        empty_offsets = (
+            rack['index'][length:, band_ends] -
+            rack['index'][:length_offsets, band_ends] -
+            rack['index'][length:, band_starts] +
+            rack['index'][:length_offsets, band_starts]
+        ) == 0
+        if empty_offsets.any():
+            first_empty_offset = int(np.argmax(empty_offsets.T))
+            depth_layer, length_layer = divmod(first_empty_offset, length_offsets)
+            return length_layer, band_start + depth_layer
+    return None
+
+def is_placement_found(placement_coordinate_set: object) -> bool:
+    '''
+    Checks whether a placement coordinate set returned by the free-space search describes an actual location
+    '''
+    for axis in placement_coordinate_set:
+        if placement_coordinate_set[axis]['start_index'] is None or placement_coordinate_set[axis]['end_index'] is None:
+            return False
+    return True
+
+def get_empty_space_for_placement(cargo_map: object, line_item: object, rack_to_place_on: object, unit_count: int = 1) -> object:
+    '''
+    Finds the first empty location on a rack for the line item. When a unit count is given, the location found is for that many identical units stood side by side along the depth axis of the rack
+    '''
     placement_coordinates_obj = {
         'length_axis': {
             'start_index': None,
@@ -476,158 +770,487 @@ def get_empty_space_for_placement(cargo_map: object, line_item: object, rack_to_
             'end_index': None
         }
     }
-    for rack in cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['racks']:
-        rack_map = rack['map']
-        for depth_layer in range(rack_map.shape[2] - line_item['grid_volume'][rack_to_place_on['orientation']]['thickness']):
-            for length_layer in range(rack_map.shape[1] - line_item['grid_volume'][rack_to_place_on['orientation']]['length']):
-                submatrix = rack_map[
-                    0 : line_item['grid_volume'][rack_to_place_on['orientation']]['height'],
-                    length_layer : line_item['grid_volume'][rack_to_place_on['orientation']]['length'] + length_layer,
-                    depth_layer : line_item['grid_volume'][rack_to_place_on['orientation']]['thickness'] + depth_layer
-                ]
-                
-                if not submatrix.any():
-                    set_placement_coordinates_obj_values(placement_coordinates_obj, length_layer, depth_layer)
-                    print(f"\n{line_item['cargo_id']}")
-                    print(rack_to_place_on)
-                    print(placement_coordinates_obj)
-                    break
-            else:
-                continue
-            break
-    
+    item_grid_volume = line_item['grid_volume'][rack_to_place_on['orientation']]
+    rack = cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['racks'][rack_to_place_on['rack_index']]
+
+    # Every panel starts at the bottom of the rack, so only its footprint needs to be free for it to fit. Racks are filled from the back of the stack forwards, so the first empty offset is taken in depth-major order
+    if rack['backend'] == 'sparse':
+        first_empty_offset = sparse_racks.find_first_empty_offset(
+            rack,
+            item_grid_volume['length'],
+            item_grid_volume['thickness'] * unit_count
+        )
+    else:
+        # Any depth layer group whose packed occupancy byte is full along the whole length of the rack cannot hold the start of a panel
+        open_depth_groups = (rack['occupancy'] != 0xFF).any(axis=0)
+        if not open_depth_groups.any():
+            return placement_coordinates_obj
+        search_depth_start = 8 * int(np.argmax(open_depth_groups))
+
+        first_empty_offset = find_first_empty_offset(
+            rack,
+            item_grid_volume['length'],
+            item_grid_volume['thickness'] * unit_count,
+            search_depth_start
+        )
+    if first_empty_offset is None:
+        return placement_coordinates_obj
+    length_layer, depth_layer = first_empty_offset
+
+    placement_coordinates_obj['length_axis']['start_index'] = length_layer
+    placement_coordinates_obj['length_axis']['end_index'] = item_grid_volume['length'] + length_layer
+
+    placement_coordinates_obj['height_axis']['start_index'] = 0
+    placement_coordinates_obj['height_axis']['end_index'] = item_grid_volume['height']
+
+    placement_coordinates_obj['depth_axis']['start_index'] = depth_layer
+    placement_coordinates_obj['depth_axis']['end_index'] = item_grid_volume['thickness'] * unit_count + depth_layer
+
     return placement_coordinates_obj
 
-def modify_cargo_array(cargo_map: object, line_item: object, rack_to_place_on: object, placement_coordinate_set: object) -> None:
-    cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['racks'][rack_to_place_on['rack_index']]['map'][
-        placement_coordinate_set['height_axis']['start_index'] : placement_coordinate_set['height_axis']['end_index'],
-        placement_coordinate_set['length_axis']['start_index'] : placement_coordinate_set['length_axis']['end_index'],
-        placement_coordinate_set['depth_axis']['start_index'] : placement_coordinate_set['depth_axis']['end_index']
-    ] = line_item['cargo_id']
+def prepare_placement_candidate_cache() -> object:
+    '''
+    Creates a cache of free-space search results for the item currently being placed. Entries are keyed by the rack, orientation and unit count searched for, and remember the version of the rack grid they were found on. Since modifying a rack bumps its version, any entry for a rack that has been modified since is treated as invalidated. The counters track how often the search was skipped
+    '''
+    return {
+        'item_id': None,
+        'candidates': {},
+        'hits': 0,
+        'misses': 0,
+        'invalidations': 0
+    }
 
-def place_cargo(truck_details: object, manifest_details: list, cargo_map_blank: object) -> object:
-    DEFAULT_STARTING_SECTOR = 'interior'
-    DEFAULT_STARTING_SIDE = 'left'
-    DEFAULT_STARTING_INDEX = 0
+def get_cached_empty_space_for_placement(placement_candidate_cache: object, cargo_map: object, line_item: object, rack_to_place_on: object, unit_count: int = 1) -> object:
+    '''
+    Looks up the free-space search result for the item on the rack in the placement candidate cache, only running the search when there is no valid entry for it
+    '''
+    if placement_candidate_cache['item_id'] != line_item['item_id']:
+        # Candidates are only shared between the searches done for a single item
+        placement_candidate_cache['item_id'] = line_item['item_id']
+        placement_candidate_cache['candidates'] = {}
+
+    rack_version = cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['racks'][rack_to_place_on['rack_index']]['version']
+    candidate_key = (
+        rack_to_place_on['sector'],
+        rack_to_place_on['side'],
+        rack_to_place_on['rack_index'],
+        rack_to_place_on['orientation'],
+        unit_count
+    )
+    if candidate_key in placement_candidate_cache['candidates']:
+        cached_version, placement_coordinate_set = placement_candidate_cache['candidates'][candidate_key]
+        if cached_version == rack_version:
+            placement_candidate_cache['hits'] += 1
+            return placement_coordinate_set
+        placement_candidate_cache['invalidations'] += 1
+
+    placement_candidate_cache['misses'] += 1
+    placement_coordinate_set = get_empty_space_for_placement(cargo_map, line_item, rack_to_place_on, unit_count)
+    placement_candidate_cache['candidates'][candidate_key] = (rack_version, placement_coordinate_set)
+    return placement_coordinate_set
+
+def get_placement_candidate_cache_stats(placement_candidate_cache: object) -> object:
+    '''
+    Summarizes the counters of the placement candidate cache
+    '''
+    lookups = placement_candidate_cache['hits'] + placement_candidate_cache['misses']
+    return {
+        'hits': placement_candidate_cache['hits'],
+        'misses': placement_candidate_cache['misses'],
+        'invalidations': placement_candidate_cache['invalidations'],
+        'hit_rate': placement_candidate_cache['hits'] / lookups if lookups else 0
+    }
 
-    def get_least_weights(cargo_map: object, sector: str) -> object:
-        '''
-        Determines the side and rack with the least amount of weight on it for a given sector
-        '''
-        least_weight_map = {
-            'sector': None,
-            'side': None,
-            'rack_index': None
+def modify_cargo_array(cargo_map: object, line_item: object, rack_to_place_on: object, placement_coordinate_set: object) -> None:
+    rack = cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['racks'][rack_to_place_on['rack_index']]
+    rack['version'] += 1
+    if rack['backend'] == 'sparse':
+        sparse_racks.add_box(rack, placement_coordinate_set, line_item['cargo_id'])
+        return
+    footprint = (
+        slice(placement_coordinate_set['length_axis']['start_index'], placement_coordinate_set['length_axis']['end_index']),
+        slice(placement_coordinate_set['depth_axis']['start_index'], placement_coordinate_set['depth_axis']['end_index'])
+    )
+    rack['map'][footprint] = line_item['cargo_id']
+    update_occupancy_bits(rack['occupancy'], placement_coordinate_set, rack['map'].shape[1])
+    update_occupancy_index(rack['index'], placement_coordinate_set)
+    update_coarse_occupancy(rack['coarse_occupancy'], placement_coordinate_set)
+
+def modify_cargo_array_batch(cargo_map: object, line_items: list, rack_to_place_on: object, placement_coordinate_set: object) -> None:
+    '''
+    Fills a block of identical units in one step. The block found for the units is split along the depth axis into one slab per unit, with each slab taking the cargo ID of its unit
+    '''
+    rack = cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['racks'][rack_to_place_on['rack_index']]
+    unit_thickness = line_items[0]['grid_volume'][rack_to_place_on['orientation']]['thickness']
+    rack['version'] += 1
+    if rack['backend'] == 'sparse':
+        for unit_idx, line_item in enumerate(line_items):
+            slab_depth_start = placement_coordinate_set['depth_axis']['start_index'] + unit_idx * unit_thickness
+            slab_coordinate_set = dict(placement_coordinate_set, depth_axis={'start_index': slab_depth_start, 'end_index': slab_depth_start + unit_thickness})
+            sparse_racks.add_box(rack, slab_coordinate_set, line_item['cargo_id'])
+        return
+    footprint = (
+        slice(placement_coordinate_set['length_axis']['start_index'], placement_coordinate_set['length_axis']['end_index']),
+        slice(placement_coordinate_set['depth_axis']['start_index'], placement_coordinate_set['depth_axis']['end_index'])
+    )
+    cargo_ids = np.array([line_item['cargo_id'] for line_item in line_items], dtype=rack['map'].dtype)
+    rack['map'][footprint] = np.repeat(cargo_ids, unit_thickness)[None, :]
+    update_occupancy_bits(rack['occupancy'], placement_coordinate_set, rack['map'].shape[1])
+    update_occupancy_index(rack['index'], placement_coordinate_set)
+    update_coarse_occupancy(rack['coarse_occupancy'], placement_coordinate_set)
+
+def clear_cargo_array(cargo_map: object, line_item: object) -> None:
+    '''
+    Takes a placed unit back off of its rack, emptying its footprint in the rack planes and occupancy structures. The unit's recorded placement is left for the caller to update
+    '''
+    placement = line_item['placement']
+    rack = cargo_map[placement['sector']][placement['side']]['racks'][placement['rack_index']]
+    rack['version'] += 1
+    if rack['backend'] == 'sparse':
+        sparse_racks.remove_box(rack, placement, line_item['cargo_id'])
+        return
+    footprint = (
+        slice(placement['length_axis']['start_index'], placement['length_axis']['end_index']),
+        slice(placement['depth_axis']['start_index'], placement['depth_axis']['end_index'])
+    )
+    rack['map'][footprint] = 0
+    update_occupancy_bits(rack['occupancy'], placement, rack['map'].shape[1], filled=False)
+    update_occupancy_index(rack['index'], placement, filled=False)
+    update_coarse_occupancy(rack['coarse_occupancy'], placement, filled=False)
+
+def get_item_orientation(truck_details: object, item: object, rack_to_place_on: object) -> str:
+    '''
+    Simple calculation to determine what the orientation of the item being placed should be
+    '''
+    if (
+        item['grid_volume']['vertical']['height'] < 
+        truck_details['rack_info'][rack_to_place_on['sector']][rack_to_place_on['rack_index']]['grid_size_height_axis']
+    ):
+        return'vertical'
+    return 'horizontal'
+
+def record_cargo_placement(line_items: list, rack_to_place_on: object, placement_coordinate_set: object) -> None:
+    '''
+    Stores where each unit of a placed block of identical units ended up, with each unit taking its own slab along the depth axis of the block
+    '''
+    unit_thickness = line_items[0]['grid_volume'][rack_to_place_on['orientation']]['thickness']
+    for unit_idx, line_item in enumerate(line_items):
+        depth_start_index = placement_coordinate_set['depth_axis']['start_index'] + unit_idx * unit_thickness
+        line_item['placement'] = {
+            'sector': rack_to_place_on['sector'],
+            'side': rack_to_place_on['side'],
+            'rack_index': rack_to_place_on['rack_index'],
+            'orientation': rack_to_place_on['orientation'],
+            'length_axis': dict(placement_coordinate_set['length_axis']),
+            'height_axis': dict(placement_coordinate_set['height_axis']),
+            'depth_axis': {
+                'start_index': depth_start_index,
+                'end_index': depth_start_index + unit_thickness
+            }
         }
 
-        side_weights = {}
-        for side in cargo_map[sector]:
-            side_weights[side] = cargo_map[sector][side]['weight']
-        lightest_side = min(side_weights, key=lambda x: side_weights[x])
+def get_rack_longitudinal_offsets(truck_details: object) -> object:
+    '''
+    Distance in inches from the front of the load area to the front of each rack. The racks of a sector are taken to be laid out front to back in the order they were defined
+    '''
+    rack_offsets = {}
+    for sector in truck_details['rack_info']:
+        offset = 0
+        for rack_idx, rack in enumerate(truck_details['rack_info'][sector]):
+            rack_offsets[(sector, rack_idx)] = offset
+            offset += rack['rack_length']
+    return rack_offsets
+
+def get_rear_axle_distance(truck_details: object) -> float:
+    return unit_convert(
+        from_unit='feet',
+        to_unit=STANDARD_CALCULATION_UNITS['dimension'],
+        val=truck_details['distance_to_rear_axle']
+    )
+
+def get_placement_position(placement_coordinate_set: object, rack_to_place_on: object, rack_offsets: object) -> tuple:
+    '''
+    Position in inches of the middle of a placed footprint, as its distance back from the front of the load area and its distance out from the centerline of the truck. Positions on the left side of the truck are negative
+    '''
+    length_center = (placement_coordinate_set['length_axis']['start_index'] + placement_coordinate_set['length_axis']['end_index']) / 2
+    longitudinal_position = rack_offsets[(rack_to_place_on['sector'], rack_to_place_on['rack_index'])] + length_center * GRID_PRECISION_FACTOR
+
+    depth_center = (placement_coordinate_set['depth_axis']['start_index'] + placement_coordinate_set['depth_axis']['end_index']) / 2
+    lateral_position = depth_center * GRID_PRECISION_FACTOR
+    if rack_to_place_on['sector'] == 'exterior':
+        lateral_position += EXTERIOR_RACK_LATERAL_OFFSET
+    if rack_to_place_on['side'] == 'left':
+        lateral_position = -lateral_position
+    return longitudinal_position, lateral_position
+
+def prepare_load_balance(truck_details: object, manifest_items: list = ()) -> object:
+    '''
+    Sets up the running totals that the balance of the load is worked out from, starting with any of the given units that are already placed. Only the total weight and its moments about the front of the load area and the centerline are kept, so that adding or removing cargo is a constant time update
+    '''
+    load_balance = {
+        'rack_offsets': get_rack_longitudinal_offsets(truck_details),
+        'rear_axle_distance': get_rear_axle_distance(truck_details),
+        'total_weight': 0,
+        'longitudinal_moment': 0,
+        'lateral_moment': 0
+    }
+    for item in manifest_items:
+        if item.get('placement'):
+            update_load_balance(load_balance, item['weight'], item['placement'], item['placement'])
+    return load_balance
+
+def update_load_balance(load_balance: object, weight: float, rack_to_place_on: object, placement_coordinate_set: object, removed: bool = False) -> None:
+    '''
+    Adds cargo of the given weight at a placed footprint to the load, or takes it back out. A block of identical units can be added in one step with their combined weight, since the middle of the block is the middle of their weight
+    '''
+    if removed:
+        weight = -weight
+    longitudinal_position, lateral_position = get_placement_position(placement_coordinate_set, rack_to_place_on, load_balance['rack_offsets'])
+    load_balance['total_weight'] += weight
+    load_balance['longitudinal_moment'] += weight * longitudinal_position
+    load_balance['lateral_moment'] += weight * lateral_position
+
+def get_rear_axle_share(load_balance: object) -> float:
+    '''
+    Share of the cargo weight carried by the rear axle, taking the cargo to be carried between the front of the load area and the rear axle. Returns None for an empty load or a truck without a rear axle distance
+    '''
+    if not load_balance['total_weight'] or not load_balance['rear_axle_distance']:
+        return None
+    return load_balance['longitudinal_moment'] / load_balance['total_weight'] / load_balance['rear_axle_distance']
+
+def get_load_balance_report(load_balance: object) -> object:
+    '''
+    Summarizes the balance of the load for a shipment plan. Centers of gravity are in inches back from the front of the load area and out to the right of the centerline, and axle loads are in the same units as the cargo weight
+    '''
+    load_balance_report = {
+        'total_weight': load_balance['total_weight'],
+        'longitudinal_center_of_gravity': None,
+        'lateral_center_of_gravity': None,
+        'front_axle_load': None,
+        'rear_axle_load': None,
+        'rear_axle_share': get_rear_axle_share(load_balance)
+    }
+    if load_balance['total_weight']:
+        load_balance_report['longitudinal_center_of_gravity'] = load_balance['longitudinal_moment'] / load_balance['total_weight']
+        load_balance_report['lateral_center_of_gravity'] = load_balance['lateral_moment'] / load_balance['total_weight']
+    if load_balance_report['rear_axle_share'] is not None:
+        load_balance_report['rear_axle_load'] = load_balance['total_weight'] * load_balance_report['rear_axle_share']
+        load_balance_report['front_axle_load'] = load_balance['total_weight'] - load_balance_report['rear_axle_load']
+    return load_balance_report
+
+def prepare_indexed_heap(entries: list) -> object:
+    '''
+    Builds an indexed min-heap out of (priority, key) pairs. The position of every key within the heap is tracked alongside it, so that the priority of any key can be changed in O(log n). Keys must be unique, and entries with the same priority are ordered by key
+    '''
+    indexed_heap = {
+        'entries': sorted(entries),
+        'positions': {}
+    }
+    for position, entry in enumerate(indexed_heap['entries']):
+        indexed_heap['positions'][entry[1]] = position
+    return indexed_heap
+
+def swap_indexed_heap_entries(indexed_heap: object, first_position: int, second_position: int) -> None:
+    entries = indexed_heap['entries']
+    entries[first_position], entries[second_position] = entries[second_position], entries[first_position]
+    indexed_heap['positions'][entries[first_position][1]] = first_position
+    indexed_heap['positions'][entries[second_position][1]] = second_position
+
+def update_indexed_heap(indexed_heap: object, key, priority) -> None:
+    '''
+    Changes the priority of a key and moves it up or down the heap to where it now belongs
+    '''
+    entries = indexed_heap['entries']
+    position = indexed_heap['positions'][key]
+    entries[position] = (priority, key)
+
+    while position > 0 and entries[position] < entries[(position - 1) // 2]:
+        swap_indexed_heap_entries(indexed_heap, position, (position - 1) // 2)
+        position = (position - 1) // 2
+
+    while True:
+        smallest_position = position
+        for child_position in (2 * position + 1, 2 * position + 2):
+            if child_position < len(entries) and entries[child_position] < entries[smallest_position]:
+                smallest_position = child_position
+        if smallest_position == position:
+            break
+        swap_indexed_heap_entries(indexed_heap, position, smallest_position)
+        position = smallest_position
+
+def iterate_lightest_heap_keys(indexed_heap: object):
+    '''
+    Yields every key that shares the lowest priority in the heap, in key order. Only the part of the heap holding those keys is walked, and only as far as the caller reads
+    '''
+    entries = indexed_heap['entries']
+    if not entries:
+        return
+    lowest_priority = entries[0][0]
+    frontier = [(entries[0], 0)]
+    while frontier:
+        entry, position = heapq.heappop(frontier)
+        yield entry[1]
+        for child_position in (2 * position + 1, 2 * position + 2):
+            if child_position < len(entries) and entries[child_position][0] == lowest_priority:
+                heapq.heappush(frontier, (entries[child_position], child_position))
+
+def place_cargo(truck_details: object, manifest_details: list, cargo_map_blank: object, placement_candidate_cache: object = None, rack_selector: object = None, load_balance: object = None) -> object:
+    '''
+    Places each unit of the prioritized manifest onto the racks of the truck, recording where every unit ended up under its 'placement' key. Units that could not be fit anywhere keep a placement of None.
 
-        rack_weights = {}
-        for idx, rack in enumerate(cargo_map[sector][lightest_side]['racks']):
-            rack_weights[idx] = rack['weight']
-        lightest_rack = min(rack_weights, key=lambda x: rack_weights[x])
-            
-        least_weight_map['sector'] = sector
-        least_weight_map['side'] = lightest_side
-        least_weight_map['rack_index'] = lightest_rack
+    By default, each new line item goes to the side and rack carrying the least weight. A different rack_selector can be provided to choose the rack instead, which is called as rack_selector(truck_details, cargo_map, line_item, placement_candidate_cache, load_balance) and returns the rack to place on, or None when the item does not fit anywhere.
 
-        return least_weight_map
+    The balance of the load is kept up to date in load_balance as cargo is placed, starting from a fresh one when none is given, for the rack selector to make use of and for the caller to report on.
+    '''
+    DEFAULT_STARTING_SECTOR = 'interior'
+    DEFAULT_STARTING_SIDE = 'left'
+    DEFAULT_STARTING_INDEX = 0
 
-    def get_item_orientation(truck_details: object, item: object, rack_to_place_on: object) -> str:
+    def get_least_weight_rack(cargo_map: object, line_item: object) -> object:
         '''
-        Simple calculation to determine what the orientation of the item being placed should be
+        Finds the rack to place a new line item on. Sectors are tried in turn, and within each sector the item goes to the lightest rack on the lightest side. Sides and racks tied for the least weight are tried in order until one that the item fits on is found
         '''
-        if (
-            item['grid_volume']['vertical']['height'] < 
-            truck_details['rack_info'][rack_to_place_on['sector']][rack_to_place_on['rack_index']]['grid_size_height_axis']
-        ):
-            return'vertical'
-        return 'horizontal'
+        for sector in cargo_map:
+            sides = list(cargo_map[sector])
+            for side_idx in iterate_lightest_heap_keys(side_weight_heaps[sector]):
+                for rack_idx in iterate_lightest_heap_keys(rack_weight_heaps[(sector, sides[side_idx])]):
+                    rack_to_place_on = {
+                        'sector': sector,
+                        'side': sides[side_idx],
+                        'rack_index': rack_idx,
+                        'orientation': None
+                    }
+                    rack_to_place_on['orientation'] = get_item_orientation(truck_details, line_item, rack_to_place_on)
+                    if eligible_for_rack(cargo_map, line_item, rack_to_place_on):
+                        return rack_to_place_on
+        return None
 
     def eligible_for_rack(cargo_map: object, line_item: object, rack_to_place_on: object) -> object:
         '''
         Determines whether the item is elgibible to even be placed on the rack based on its size as well as the available space on the rack
         '''
-        placement_coordinate_set = get_empty_space_for_placement(cargo_map, line_item, rack_to_place_on)
-        for axis in placement_coordinate_set:
-            if placement_coordinate_set[axis]['start_index'] == None or placement_coordinate_set[axis]['end_index'] == None:
-                return False
-        return True
+        placement_coordinate_set = get_cached_empty_space_for_placement(placement_candidate_cache, cargo_map, line_item, rack_to_place_on)
+        return is_placement_found(placement_coordinate_set)
+
+    if placement_candidate_cache is None:
+        placement_candidate_cache = prepare_placement_candidate_cache()
+    if load_balance is None:
+        load_balance = prepare_load_balance(truck_details)
 
     cargo_map = cargo_map_blank.copy()
 
+    # The weight carried by each side of every sector, and by each rack on every side, is kept in indexed min-heaps so that the lightest ones can be found without scanning them all for every line item
+    side_weight_heaps = {}
+    rack_weight_heaps = {}
+    for sector in cargo_map:
+        side_weight_heaps[sector] = prepare_indexed_heap([
+            (cargo_map[sector][side]['weight'], side_idx) for side_idx, side in enumerate(cargo_map[sector])
+        ])
+        for side in cargo_map[sector]:
+            rack_weight_heaps[(sector, side)] = prepare_indexed_heap([
+                (rack['weight'], rack_idx) for rack_idx, rack in enumerate(cargo_map[sector][side]['racks'])
+            ])
+
+    for line_item in manifest_details:
+        line_item['placement'] = None
+
+    def select_rack(line_item: object) -> object:
+        if rack_selector is not None:
+            return rack_selector(truck_details, cargo_map, line_item, placement_candidate_cache, load_balance)
+        return get_least_weight_rack(cargo_map, line_item)
+
+    def find_units_placement(item_idx: int, line_item: object, rack_to_place_on: object) -> tuple:
+        '''
+        Finds room on a rack for the remaining units of a line item, returning the units that fit and where they go, or None when not even a single unit fits. Identical units of a line item are consecutive, so all of the remaining ones are tried side by side in a single step first, unless the block has already failed to fit on this rack, in which case the units are placed one at a time for the rest of the item
+        '''
+        nonlocal per_unit_placement
+        rack_key = (line_item['item_id'], rack_to_place_on['sector'], rack_to_place_on['side'], rack_to_place_on['rack_index'])
+        if per_unit_placement != rack_key:
+            batch_end_idx = item_idx + 1
+            while (
+                batch_end_idx < len(manifest_details) and
+                manifest_details[batch_end_idx]['item_id'] == line_item['item_id']
+            ):
+                batch_end_idx += 1
+            if batch_end_idx - item_idx > 1:
+                batch = manifest_details[item_idx:batch_end_idx]
+                placement_coordinate_set = get_cached_empty_space_for_placement(placement_candidate_cache, cargo_map, line_item, rack_to_place_on, unit_count=len(batch))
+                if placement_coordinate_set is not None and is_placement_found(placement_coordinate_set):
+                    return (batch, placement_coordinate_set)
+                per_unit_placement = rack_key
+
+        placement_coordinate_set = get_cached_empty_space_for_placement(placement_candidate_cache, cargo_map, line_item, rack_to_place_on)
+        if not is_placement_found(placement_coordinate_set):
+            return None
+        return ([line_item], placement_coordinate_set)
+
     item_id_of_last_placed = None
     rack_last_placed_on = None
+    next_item_idx_to_place = 0
+    # Line item and rack on which the remaining units of the item did not fit as a block, so that the shrinking block is not searched for again after every unit
+    per_unit_placement = None
 
     for item_idx, line_item in enumerate(manifest_details):
-        rack_to_place_on = {
-            'sector': None,
-            'side': None,
-            'rack_index': None,
-            'orientation': None
-        }
+        if item_idx < next_item_idx_to_place:
+            # This unit was already placed as part of a batch of identical units
+            continue
 
-        if item_idx == 0:
-            rack_to_place_on['sector'] = DEFAULT_STARTING_SECTOR
-            rack_to_place_on['side'] = DEFAULT_STARTING_SIDE
-            rack_to_place_on['rack_index'] = DEFAULT_STARTING_INDEX
-            rack_to_place_on['orientation'] = get_item_orientation(truck_details, line_item, rack_to_place_on)
-        elif line_item['item_id'] == item_id_of_last_placed:
+        rack_was_selected = False
+        if line_item['item_id'] == item_id_of_last_placed:
             # If the item is the same item as the last that was placed, allow the item to be placed on the same rack
             rack_to_place_on = rack_last_placed_on
+        elif item_idx == 0 and rack_selector is None:
+            rack_to_place_on = {
+                'sector': DEFAULT_STARTING_SECTOR,
+                'side': DEFAULT_STARTING_SIDE,
+                'rack_index': DEFAULT_STARTING_INDEX,
+                'orientation': None
+            }
+            rack_to_place_on['orientation'] = get_item_orientation(truck_details, line_item, rack_to_place_on)
         else:
-            for sector in cargo_map:
-                least_weight_map = get_least_weights(cargo_map, sector)
-                for side in cargo_map[sector]:
-                    # Only load items onto the sector and side that have the least weight loaded onto them
-                    if (
-                        cargo_map[sector][side]['weight'] <=
-                        cargo_map[least_weight_map['sector']][least_weight_map['side']]['weight']
-                    ):
-                        rack_to_place_on['sector'] = least_weight_map['sector'] = sector
-                        rack_to_place_on['side'] = least_weight_map['side'] = side
-
-                        # Check the racks within the sector and side defined to determine which has the least weight and determine item orientation
-                        for rack_idx, rack in enumerate(cargo_map[sector][side]['racks']):
-                            if (
-                                rack['weight'] <=
-                                cargo_map[sector][side]['racks'][least_weight_map['rack_index']]['weight']
-                            ):
-                                rack_to_place_on['rack_index'] = least_weight_map['rack_index'] = rack_idx
-                                rack_to_place_on['orientation'] = get_item_orientation(truck_details, line_item, rack_to_place_on)
-                                if eligible_for_rack(cargo_map, line_item, rack_to_place_on):
-                                    break
-                        else:
-                            continue
-                        break
-                else:
-                    continue
-                break
-                                    
-        placement_coordinate_set = get_empty_space_for_placement(cargo_map, line_item, rack_to_place_on)
-        modify_cargo_array(cargo_map, line_item, rack_to_place_on, placement_coordinate_set)
+            rack_to_place_on = select_rack(line_item)
+            rack_was_selected = True
+            if rack_to_place_on is None:
+                continue
 
-        cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['weight'] += line_item['weight']
-        cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]['racks'][rack_to_place_on['rack_index']]['weight'] += line_item['weight']
+        units_placement = find_units_placement(item_idx, line_item, rack_to_place_on)
+        if units_placement is None and not rack_was_selected:
+            # The rack that the item was carried over to is full, so the rest of the item goes wherever a new line item would
+            item_id_of_last_placed = None
+            rack_to_place_on = select_rack(line_item)
+            if rack_to_place_on is not None:
+                units_placement = find_units_placement(item_idx, line_item, rack_to_place_on)
+        if units_placement is None:
+            # There is no room left for this unit, so leave it unplaced rather than writing it over the whole rack
+            continue
+
+        batch, placement_coordinate_set = units_placement
+        if len(batch) > 1:
+            modify_cargo_array_batch(cargo_map, batch, rack_to_place_on, placement_coordinate_set)
+        else:
+            modify_cargo_array(cargo_map, line_item, rack_to_place_on, placement_coordinate_set)
+        next_item_idx_to_place = item_idx + len(batch)
+        record_cargo_placement(batch, rack_to_place_on, placement_coordinate_set)
+
+        batch_weight = sum(unit['weight'] for unit in batch)
+        update_load_balance(load_balance, batch_weight, rack_to_place_on, placement_coordinate_set)
+        loaded_side = cargo_map[rack_to_place_on['sector']][rack_to_place_on['side']]
+        loaded_side['weight'] += batch_weight
+        loaded_side['racks'][rack_to_place_on['rack_index']]['weight'] += batch_weight
+        update_indexed_heap(
+            side_weight_heaps[rack_to_place_on['sector']],
+            list(cargo_map[rack_to_place_on['sector']]).index(rack_to_place_on['side']),
+            loaded_side['weight']
+        )
+        update_indexed_heap(
+            rack_weight_heaps[(rack_to_place_on['sector'], rack_to_place_on['side'])],
+            rack_to_place_on['rack_index'],
+            loaded_side['racks'][rack_to_place_on['rack_index']]['weight']
+        )
 
         item_id_of_last_placed = line_item['item_id']
         rack_last_placed_on = rack_to_place_on
 
-        # Solely for testing
-        if item_idx == 5:
-            break
-    
-    # TODO: Continue building flipping rules for other sides and sectors of the truck layout
-    # Handle the appropriate flipping of arrays based on their location
-    for sector in cargo_map:
-        for side in cargo_map[sector]:
-            if sector == 'interior' and side == 'right':
-                for idx, rack in enumerate(cargo_map[sector][side]['racks']):
-                        cargo_map[sector][side]['racks'][idx]['map'] = np.flip(cargo_map[sector][side]['racks'][idx]['map'], 2)
-
     return cargo_map
 
 def flatten_map(cargo_map: object) -> object:
@@ -636,33 +1259,171 @@ def flatten_map(cargo_map: object) -> object:
     for sector in cargo_map:
         for side in cargo_map[sector]:
             for idx, rack in enumerate(cargo_map[sector][side]['racks']):
-                master_flat_map[sector][side]['racks'][idx]['map'] = rack['map'][0].tolist()
+                # Sparse racks are only drawn out as a plane here, for display
+                if rack['backend'] == 'sparse':
+                    rack_map = sparse_racks.rasterize_sparse_rack(rack)
+                else:
+                    rack_map = rack['map']
+                # TODO: Continue building flipping rules for other sides and sectors of the truck layout
+                # Handle the appropriate flipping of arrays based on their location. This is only done for display, so that the maps used while placing cargo stay aligned with their occupancy structures
+                if sector == 'interior' and side == 'right':
+                    master_flat_map[sector][side]['racks'][idx]['map'] = np.flip(rack_map, 1).tolist()
+                else:
+                    master_flat_map[sector][side]['racks'][idx]['map'] = rack_map.tolist()
+                # The height plane, occupancy structures and placed boxes are only needed while placing cargo and are not part of the plan
+                for placement_structure in FLATTENED_RACK_EXCLUDED_KEYS:
+                    master_flat_map[sector][side]['racks'][idx].pop(placement_structure, None)
 
     return master_flat_map
 
-def generate_shipment_plan(truck_details: object, manifest_name: str, manifest_details: list, manifest_units: list):    
-    # Ensure that types are correct for calculations
-    prepare_types(truck_details, manifest_details)
+def get_shipment_plan_name(truck_name: str, manifest_name: str) -> str:
+    return f"{truck_name.replace(' ', '_')}-{manifest_name}-shipment_plan"
 
-    # Calculation of grid sizes and volumes
-    truck_details = calculate_physical_space(truck_details, manifest_details, manifest_units)
+def save_shipment_plan(shipment_plan: object) -> str:
+    '''
+    Writes a plan to the stored shipment plans, returning it as JSON. The write is skipped when the same plan is already stored
+    '''
+    import plan_cache
 
-    # Prioritization of cargo based on manifest details
-    prioritized_manifest_details = prioritize_cargo(manifest_details)
-    color_palette = generate_color_palette(prioritized_manifest_details)
+    shipment_plan_name = get_shipment_plan_name(shipment_plan['truck_details']['truck_name'], shipment_plan['manifest_details']['name'])
+    stringified_json = json.dumps(shipment_plan)
+    if not shipment_plan.get('plan_hash') or plan_cache.get_stored_plan_hash(shipment_plan_name) != shipment_plan['plan_hash']:
+        storage.save_object('plans', shipment_plan_name, shipment_plan, owner=shipment_plan.get('owner'), stringified_object=stringified_json)
+        if shipment_plan.get('plan_hash'):
+            plan_cache.record_stored_plan_hash(shipment_plan_name, shipment_plan['plan_hash'])
+    return stringified_json
 
-    cargo_map_blank = prepare_cargo_map_blank(truck_details)
+def load_shipment_plan(truck_name: str, manifest_name: str) -> object:
+    '''
+    Loads the plan last stored for a truck and manifest, if there is one
+    '''
+    try:
+        return storage.get_object('plans', get_shipment_plan_name(truck_name, manifest_name))
+    except storage.ObjectNotFoundError:
+        return None
 
-    cargo_placement_map = place_cargo(truck_details, prioritized_manifest_details, cargo_map_blank)
-    flattened_map = flatten_map(cargo_placement_map)
+def get_plan_row_keys(shipment_plan: object) -> list:
+    '''
+    Lists the key of every manifest row that went into a plan, once per row rather than once per unit of cargo
+    '''
+    row_keys = {}
+    for item in shipment_plan['manifest_details']['items']:
+        row_keys.setdefault(item['item_id'], item['row_key'])
+    return list(row_keys.values())
 
-    return {
+def can_replan_from(previous_plan: object, truck_hash: str, manifest_units: object) -> bool:
+    '''
+    Determines whether a stored plan can be updated incrementally for a manifest rather than planned again from scratch. The plan has to be for the same truck configuration and manifest units, and has to record where each unit came from and where it was placed
+    '''
+    if not previous_plan or previous_plan.get('truck_hash') != truck_hash:
+        return False
+    if previous_plan.get('manifest_units') != manifest_units:
+        return False
+    for item in previous_plan['manifest_details']['items']:
+        if 'row_key' not in item or 'placement' not in item:
+            return False
+    return True
+
+def carry_over_color_palette(previous_color_palette: object, manifest_items: list) -> object:
+    '''
+    Builds the color palette for an updated plan, keeping the colors that cargo already had in the previous plan and picking new ones for new cargo
+    '''
+    previous_colors = {}
+    for entry in previous_color_palette.values():
+        previous_colors[entry['cargo_id']] = tuple(entry['color'])
+
+    color_palette = generate_color_palette(manifest_items)
+    taken_colors = set(previous_colors.values())
+    for entry in color_palette.values():
+        if entry['cargo_id'] in previous_colors:
+            entry['color'] = previous_colors[entry['cargo_id']]
+        else:
+            while entry['color'] in taken_colors:
+                entry['color'] = tuple(random.choices(range(256), k=3))
+            taken_colors.add(entry['color'])
+    return color_palette
+
+def generate_shipment_plan(truck_details: object, manifest_name: str, manifest_details: list, manifest_units: list, solver: str = 'greedy', time_budget_ms: int = 0, use_cache: bool = True, previous_plan: object = None, rack_backend: str = 'dense'):
+    '''
+    Builds a shipment plan for the manifest on the truck. The 'greedy' solver places the cargo with the least-weight heuristic, while the 'portfolio' solver runs every placement strategy in parallel and keeps the best scoring plan. When a time budget is given, the plan found is then improved upon until the budget runs out.
+
+    Plans are cached by a hash of their inputs, which is stored in the plan as 'plan_hash'. A repeat request for the same inputs is answered from the cache without placing any cargo.
+
+    When a previous plan for the same truck is given, only the manifest rows that were added, removed or changed since then are taken off of or placed onto the racks, and the rest of the cargo stays where it was
+
+    The rack backend picks how the space on the racks is represented while placing cargo. Either one gives the same plan
+    '''
+    # The solvers and plan cache are built on top of the functions in this module, so they are imported here rather than at the top to avoid a circular import
+    import plan_cache
+    import solvers
+
+    # Hash the inputs before they are converted in place below
+    truck_hash = plan_cache.hash_truck_details(truck_details)
+    replanning = can_replan_from(previous_plan, truck_hash, manifest_units)
+    solver_options = {'solver': solver, 'time_budget_ms': time_budget_ms, 'rack_backend': rack_backend}
+    if replanning:
+        # A plan updated from an earlier one can differ from one planned from scratch, so it is cached under a key of its own
+        solver_options['replanned_from'] = previous_plan.get('plan_hash')
+    plan_hash = plan_cache.hash_plan_inputs(truck_details, manifest_details, manifest_units, solver_options)
+    if use_cache:
+        cached_plan = plan_cache.get_cached_plan(plan_hash)
+        if cached_plan is not None:
+            cached_plan['manifest_details']['name'] = manifest_name
+            return cached_plan
+
+    # Remember which manifest row each piece of cargo came from, so that the plan can be updated when rows are edited later on
+    for row in manifest_details:
+        row['row_key'] = get_manifest_row_key(row)
+
+    if replanning:
+        manifest_diff = diff_manifest_rows(get_plan_row_keys(previous_plan), manifest_details)
+        placement_result = solvers.replan_placement(previous_plan, manifest_diff, manifest_units, rack_backend)
+        truck_details = placement_result['truck_details']
+        color_palette = carry_over_color_palette(previous_plan['color_palette'], placement_result['manifest_items'])
+    else:
+        # Ensure that types are correct for calculations
+        prepare_types(truck_details, manifest_details)
+
+        # Calculation of grid sizes and volumes
+        truck_details = calculate_physical_space(truck_details, manifest_details, manifest_units)
+
+        # Prioritization of cargo based on manifest details
+        prioritized_manifest_details = prioritize_cargo(manifest_details)
+        color_palette = generate_color_palette(prioritized_manifest_details)
+
+        if solver == 'greedy':
+            placement_result = solvers.run_placement_strategy('least_weight', truck_details, prioritized_manifest_details, rack_backend)
+        elif solver == 'portfolio':
+            placement_result = solvers.solve_portfolio(truck_details, prioritized_manifest_details, rack_backend=rack_backend)
+        else:
+            raise ValueError(f"Unknown shipment plan solver '{solver}'")
+    if time_budget_ms > 0:
+        # An updated plan only moves the units that were placed while updating it, so that the rest of the cargo keeps its spot
+        placement_result = solvers.improve_placement(truck_details, placement_result, time_budget_ms, movable_items=placement_result.get('movable_items'))
+    flattened_map = flatten_map(placement_result['cargo_map'])
+
+    shipment_plan = {
+        'plan_hash': plan_hash,
+        'truck_hash': truck_hash,
         'truck_details': truck_details,
+        'manifest_units': manifest_units,
         'manifest_details': {
             'name': manifest_name, 
-            'items': prioritized_manifest_details
+            'items': placement_result['manifest_items']
         },
         'color_palette': color_palette,
-        'flattened_map': flattened_map
+        'flattened_map': flattened_map,
+        'solver': {
+            'name': solver,
+            'rack_backend': rack_backend,
+            'strategy': placement_result['strategy'],
+            'score': placement_result['score'],
+            'optimizer': placement_result.get('optimizer'),
+            'replan': placement_result.get('replan')
+        },
+        'placement_stats': placement_result['placement_stats'],
+        'load_balance': get_load_balance_report(placement_result['load_balance'])
     }
-
+    if use_cache:
+        plan_cache.cache_plan(plan_hash, shipment_plan)
+    return shipment_plan